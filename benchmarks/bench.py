@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks of the library hot paths, results are compared with the baseline stored in benchmarks/baseline.json:
+
+	python3 benchmarks/bench.py                  # run all and compare with the baseline
+	python3 benchmarks/bench.py --quick          # skip the slowest inputs (100k torrents/files)
+	python3 benchmarks/bench.py -k list -k bdecode
+	python3 benchmarks/bench.py --save           # store results as the new baseline
+
+Every benchmark is run several times and the best time is reported, network benchmarks use utorrent.mock_server on localhost.
+Times are compared relative to the calibration loop that doesn't use the library, so that the baseline recorded on another machine is
+still usable, though only roughly. Requests made and bytes transferred (see utorrent.instrument) don't depend on the machine, any
+increase of them is reported as regression.
+"""
+
+import hashlib
+import json
+import optparse
+import os
+import platform
+import sys
+import time
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+import utorrent
+import utorrent.instrument
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+from utorrent.uTorrent import Falcon
+
+BASELINE = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "baseline.json" )
+# default format of utorrentctl, see config.py.template
+TORRENT_FORMAT = "{hash_code} {status} {progress}% {size} {dl_speed} {ul_speed} {ratio} {peer_info} eta: {eta} {name} {label}"
+
+_benchmarks = []
+# requests of all the connections of the benchmark being run
+INSTRUMENTATION = utorrent.instrument.Instrumentation( )
+
+
+def benchmark( name, repeat = 5, slow = False ):
+	"""
+	Registers function that prepares the input and returns callable to be timed, or the callable and the one releasing the resources
+	(e.g. the server) after the runs.
+	"""
+
+	def register( func ):
+		_benchmarks.append( ( name, func, repeat, slow ) )
+		return func
+
+	return register
+
+
+class StaticConnection:
+	"""
+	Connection stand-in returning prepared responses, so that only the library code is measured.
+	"""
+	cache = None
+	_utorrent = None
+
+	def __init__( self, responses ):
+		self.instrumentation = INSTRUMENTATION
+		self._responses = responses
+
+	def do_action( self, action, **kwargs ):
+		self.instrumentation.record( utorrent.instrument.RequestRecord( action ) )
+		return self._responses[action]
+
+
+class NullBuffer:
+	written = 0
+
+	def write( self, data ):
+		self.written += len( data )
+
+
+def make_torrent_data( size = 4 << 30, piece_length = 1 << 20, files = 500 ):
+	"""
+	Returns .torrent file contents of the typical multi-file torrent.
+
+	:rtype: bytes
+	"""
+	file_size = size // files
+	pieces = b"".join( hashlib.sha1( str( i ).encode( "ascii" ) ).digest( ) for i in range( ( size + piece_length - 1 ) // piece_length ) )
+	return utorrent.bencode( {
+		"announce": "http://tracker.example.com/announce",
+		"announce-list": [["http://tracker.example.com/announce"], ["udp://tracker.example.org:6969/announce"]],
+		"comment": "synthetic benchmark torrent",
+		"created by": "utorrentctl bench",
+		"creation date": 1600000000,
+		"info": {
+			"name": "Synthetic Benchmark Torrent",
+			"piece length": piece_length,
+			"pieces": pieces,
+			"files": [{ "length": file_size, "path": ["CD{}".format( i % 5 ), "file{:04d}.bin".format( i )] } for i in range( files )],
+		},
+	} )
+
+
+def make_falcon( torrents = 0, files = 0 ):
+	"""
+	Returns Falcon instance serving list and getfiles responses of the synthetic population without network.
+
+	:rtype: (Falcon, Population)
+	"""
+	population = Population( torrents = torrents, files = max( files, 1 ), feeds = 0, filters = 0 )
+	responses = { "list": population.list( ) if torrents else { } }
+	if files and torrents:
+		hsh = population.torrent_hash( 0 )
+		responses["getfiles"] = { "build": population.build, "files": [hsh, population.files( hsh )] }
+	return Falcon( StaticConnection( responses ) ), population
+
+
+@benchmark( "bdecode_4GiB_torrent" )
+def bench_bdecode( ):
+	data = make_torrent_data( )
+	return lambda: utorrent.bdecode( data )
+
+
+@benchmark( "bdecode_20k_pieces_torrent" )
+def bench_bdecode_20k_pieces( ):
+	data = make_torrent_data( size = 20000 << 20, files = 1 )
+	return lambda: utorrent.bdecode( data )
+
+
+@benchmark( "bencode_4GiB_torrent" )
+def bench_bencode( ):
+	meta = utorrent.bdecode( make_torrent_data( ) )
+	return lambda: utorrent.bencode( meta )
+
+
+@benchmark( "bencode_to_file_4GiB_torrent" )
+def bench_bencode_to_file( ):
+	meta = utorrent.bdecode( make_torrent_data( ) )
+	return lambda: utorrent.bencode_to( meta, NullBuffer( ) )
+
+
+@benchmark( "get_info_hash_4GiB_torrent" )
+def bench_get_info_hash( ):
+	data = make_torrent_data( )
+	return lambda: Falcon.get_info_hash( data )
+
+
+def _bench_torrent_list( count ):
+	ut, population = make_falcon( count )
+	return lambda: ut.torrent_list( )
+
+
+@benchmark( "torrent_list_1k" )
+def bench_torrent_list_1k( ):
+	return _bench_torrent_list( 1000 )
+
+
+@benchmark( "torrent_list_10k" )
+def bench_torrent_list_10k( ):
+	return _bench_torrent_list( 10000 )
+
+
+@benchmark( "torrent_list_100k", repeat = 3, slow = True )
+def bench_torrent_list_100k( ):
+	return _bench_torrent_list( 100000 )
+
+
+def _bench_torrent_list_poll( count, live ):
+	ut, population = make_falcon( count )
+	ut.live_torrents = live
+	ut.torrent_list( )
+	# every poll gets the same delta of 100 changed torrents
+	population.churn( 100 )
+	ut._connection._responses["list"] = population.list( int( ut._list_cache_id ) )
+	return lambda: ut.torrent_list( )
+
+
+@benchmark( "torrent_list_poll_100k", repeat = 3, slow = True )
+def bench_torrent_list_poll_100k( ):
+	return _bench_torrent_list_poll( 100000, False )
+
+
+@benchmark( "torrent_list_poll_live_100k", repeat = 3, slow = True )
+def bench_torrent_list_poll_live_100k( ):
+	return _bench_torrent_list_poll( 100000, True )
+
+
+def _bench_torrent_table( count ):
+	ut, population = make_falcon( count )
+	table = ut.torrent_table( )
+
+	def run( ):
+		mask = table.mask( "ratio", ">", 2 ) & table.mask( "label", "=", "tv" ) & table.status_mask( "started" )
+		table.top( [( "ratio", True )], 10, mask.indices( ) )
+		table.sort( [( "label", False ), ( "size", True )] )
+		table.group_sum( "label", ( "size", "ul_speed", "dl_speed" ) )
+
+	return run
+
+
+@benchmark( "torrent_table_query_10k" )
+def bench_torrent_table_10k( ):
+	return _bench_torrent_table( 10000 )
+
+
+@benchmark( "torrent_table_query_100k", repeat = 3, slow = True )
+def bench_torrent_table_100k( ):
+	return _bench_torrent_table( 100000 )
+
+
+@benchmark( "torrent_top_active_100k", repeat = 3, slow = True )
+def bench_torrent_top_active_100k( ):
+	ut, population = make_falcon( 100000 )
+	return lambda: ut.torrent_top( "ul_speed", 20, True, where = "ul_speed > 0 or dl_speed > 0" )
+
+
+@benchmark( "verbose_str_10k" )
+def bench_verbose_str( ):
+	ut, population = make_falcon( 10000 )
+	torrents = list( ut.torrent_list( ).values( ) )
+	return lambda: [t.verbose_str( TORRENT_FORMAT ) for t in torrents]
+
+
+def _bench_file_list_structure( count ):
+	ut, population = make_falcon( 1, count )
+	files = list( ut.file_list( population.torrent_hash( 0 ) ).values( ) )[0]
+	return lambda: ut.parse_file_list_structure( files )
+
+
+@benchmark( "parse_file_list_structure_10k" )
+def bench_file_list_structure_10k( ):
+	return _bench_file_list_structure( 10000 )
+
+
+@benchmark( "parse_file_list_structure_100k", repeat = 3, slow = True )
+def bench_file_list_structure_100k( ):
+	return _bench_file_list_structure( 100000 )
+
+
+def _bench_decode_list( count ):
+	text = MockServer.encode_json( Population( torrents = count, files = 1 ).list( ) ).decode( "utf8" )
+	return lambda: Connection._decode_response( text )
+
+
+@benchmark( "decode_list_10k" )
+def bench_decode_list_10k( ):
+	return _bench_decode_list( 10000 )
+
+
+@benchmark( "decode_list_100k", repeat = 3, slow = True )
+def bench_decode_list_100k( ):
+	return _bench_decode_list( 100000 )
+
+
+@benchmark( "decode_getfiles_1k_x_100" )
+def bench_decode_getfiles( ):
+	# several torrents are sent as duplicate "files" keys, which the decoder has to merge
+	population = Population( torrents = 1000, files = 100 )
+	parts = ",".join( '"files":' + json.dumps( [h, population.files( h )], separators = ( ",", ":" ) ) for h in
+	                  ( population.torrent_hash( i ) for i in range( 1000 ) ) )
+	text = '{"build":1,' + parts + "}"
+	return lambda: Connection._decode_response( text )
+
+
+@benchmark( "file_get_64MiB", repeat = 3 )
+def bench_file_get( ):
+	size = 64 << 20
+	population = Population( torrents = 1, files = 100 )
+	hsh = population.torrent_hash( 0 )
+	index = [i for i, f in enumerate( population.files( hsh ) ) if f[1] >= size][0]
+	server = MockServer( population, compression = False ).start( )
+	ut = Connection( server.host, server.login, server.password, keep_alive = True ).utorrent( "falcon" )
+	ut._connection.instrumentation.add_listener( INSTRUMENTATION.record )
+
+	def run( ):
+		buffer = NullBuffer( )
+		ut.file_get( "{}.{}".format( hsh, index ), buffer, 0, size )
+		assert buffer.written == size
+
+	def close( ):
+		ut._connection.close( )
+		server.stop( )
+
+	return run, close
+
+
+def calibration( ):
+	"""
+	Workload of the standard library only, the speed of the machine is measured by it.
+	"""
+	numbers = [( i * 7919 ) % 100003 for i in range( 200000 )]
+	text = json.dumps( [[str( i ), i, i / 3] for i in range( 20000 )] )
+
+	def run( ):
+		sorted( numbers )
+		json.loads( text )
+		{ i: str( i ) for i in numbers[:50000] }
+		hashlib.sha1( text.encode( "utf8" ) ).digest( )
+
+	return run
+
+
+def run_benchmark( func, repeat ):
+	"""
+	Returns the best time and the numbers of requests and transferred bytes of a single run.
+	"""
+	target = func( )
+	close = None
+	if isinstance( target, tuple ):
+		target, close = target
+	best = None
+	try:
+		for i in range( repeat ):
+			INSTRUMENTATION.reset( )
+			start = time.perf_counter( )
+			target( )
+			elapsed = time.perf_counter( ) - start
+			best = elapsed if best is None else min( best, elapsed )
+	finally:
+		if close is not None:
+			close( )
+	actions = INSTRUMENTATION.actions.values( )
+	return best, sum( a.requests for a in actions ), sum( a.bytes_sent + a.bytes_received for a in actions )
+
+
+def main( ):
+	parser = optparse.OptionParser( usage = "%prog [options]" )
+	parser.add_option( "-k", dest = "patterns", action = "append", default = [], help = "run only benchmarks containing the substring" )
+	parser.add_option( "--quick", action = "store_true", default = False, help = "skip the slowest benchmarks" )
+	parser.add_option( "--save", action = "store_true", default = False, help = "store results in {}".format( BASELINE ) )
+	parser.add_option( "--tolerance", type = "float", default = 0.25,
+	                   help = "slowdown against the baseline reported as regression, default is 0.25 (25%)" )
+	parser.add_option( "--check", action = "store_true", default = False, help = "exit with status 1 if there are regressions" )
+	opts, args = parser.parse_args( )
+
+	baseline = { }
+	if os.path.exists( BASELINE ):
+		with open( BASELINE, "r", encoding = "utf8" ) as f:
+			baseline = json.load( f )["results"]
+
+	unit = run_benchmark( calibration, 5 )[0]
+	print( "calibration: {:.4f} s, times are relative to it".format( unit ) )
+	results = { }
+	regressions = 0
+	print( "{:<32} {:>10} {:>9} {:>9} {:>7} {:>5} {:>10}".format( "benchmark", "best, s", "relative", "baseline", "ratio", "reqs", "bytes" ) )
+	for name, func, repeat, slow in _benchmarks:
+		if opts.patterns and not any( p in name for p in opts.patterns ):
+			continue
+		if slow and opts.quick:
+			continue
+		best, requests, transferred = run_benchmark( func, repeat )
+		results[name] = { "relative": best / unit, "requests": requests, "bytes": transferred }
+		base = baseline.get( name )
+		if base:
+			ratio = best / unit / base["relative"]
+			slower = ratio > 1 + opts.tolerance
+			# the counts are exact, any increase is a regression even if it isn't slower on this machine
+			more_io = requests > base["requests"] or transferred > base["bytes"]
+			mark = "  SLOWER" if slower else ( "  faster" if ratio < 1 - opts.tolerance else "" )
+			if more_io:
+				mark += "  MORE IO ({} reqs, {} bytes in baseline)".format( base["requests"], base["bytes"] )
+			regressions += slower or more_io
+			print( "{:<32} {:>10.4f} {:>9.3f} {:>9.3f} {:>7.2f} {:>5} {:>10}{}".format( name, best, best / unit, base["relative"], ratio, requests,
+			                                                                           transferred, mark ) )
+		else:
+			print( "{:<32} {:>10.4f} {:>9.3f} {:>9} {:>7} {:>5} {:>10}".format( name, best, best / unit, "-", "-", requests, transferred ) )
+
+	if opts.save:
+		merged = dict( baseline, **results )
+		with open( BASELINE, "w", encoding = "utf8" ) as f:
+			json.dump( {
+				"machine": { "python": platform.python_version( ), "implementation": platform.python_implementation( ),
+				             "platform": platform.platform( ), "processor": platform.machine( ), "calibration": round( unit, 6 ) },
+				"results": { k: dict( v, relative = round( v["relative"], 4 ) ) for k, v in sorted( merged.items( ) ) },
+			}, f, indent = "\t" )
+			f.write( "\n" )
+	if opts.check and regressions > 0:
+		sys.exit( 1 )
+
+
+if __name__ == "__main__":
+	main( )
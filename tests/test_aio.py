@@ -0,0 +1,180 @@
+import asyncio
+import io
+import socket
+import unittest
+from unittest import mock
+
+import utorrent.aio
+from tests.webui import WebUI
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+
+
+class AsyncConnectionTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.webui = WebUI( ).start( )
+
+	def tearDown( self ):
+		self.webui.stop( )
+
+	def _connection( self, **kwargs ):
+		return utorrent.aio.AsyncConnection( self.webui.host, "admin", "", **kwargs )
+
+	def test_concurrent_requests( self ):
+		async def run( ):
+			async with self._connection( pool_size = 5 ) as connection:
+				results = await asyncio.gather( *( connection.do_action( "getsettings" ) for i in range( 50 ) ) )
+				return connection, results
+
+		connection, results = asyncio.run( run( ) )
+		self.assertEqual( results, [WebUI.response] * 50 )
+		# the token is fetched once for all of them
+		self.assertEqual( len( [r for r in self.webui.requests if r.startswith( "/gui/token.html" )] ), 1 )
+		self.assertEqual( len( self.webui.requests ), 51 )
+		self.assertLessEqual( self.webui.connection_count, 5 )
+		self.assertEqual( connection.connect_count + connection.reuse_count, 51 )
+
+	def test_dropped_connection_is_reopened( self ):
+		async def run( ):
+			async with self._connection( ) as connection:
+				await connection.do_action( "getsettings" )
+				self.webui.drop_connections( )
+				self.assertEqual( await connection.do_action( "getsettings" ), WebUI.response )
+				return connection
+
+		connection = asyncio.run( run( ) )
+		self.assertEqual( connection.reconnect_count, 1 )
+		self.assertEqual( self.webui.connection_count, 2 )
+
+	def test_autodetect( self ):
+		async def run( ):
+			async with self._connection( ) as connection:
+				return await connection.utorrent( )
+
+		ut = asyncio.run( run( ) )
+		# the build number alone is what the desktop client answers
+		self.assertIsInstance( ut, utorrent.aio.AsyncDesktop )
+		self.assertEqual( ut._version.build, 1 )
+
+
+class MockServerAsyncConnectionTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 20, files = 3 ) ).start( )
+		self.population = self.server.population
+
+	def tearDown( self ):
+		self.server.stop( )
+
+	def _run( self, test, api = "falcon", **kwargs ):
+		"""
+		Runs test( ut ) on a new event loop, the connection is closed afterwards.
+		"""
+
+		async def run( ):
+			async with utorrent.aio.AsyncConnection( self.server.host, self.server.login, self.server.password, **kwargs ) as connection:
+				return await test( await connection.utorrent( api ) )
+
+		return asyncio.run( run( ) )
+
+	def test_lists( self ):
+		hsh = self.population.torrent_hash( 5 )
+
+		async def test( ut ):
+			return await ut.torrent_list( ), await ut.torrent_info( hsh ), await ut.file_list( hsh )
+
+		torrents, info, files = self._run( test )
+		self.assertEqual( sorted( torrents ), sorted( self.population.torrent_hash( i ) for i in range( 20 ) ) )
+		self.assertEqual( torrents[hsh].name, self.population.list( )["torrents"][5][2] )
+		self.assertEqual( list( info ), [hsh] )
+		self.assertEqual( [( f.name, f.size ) for f in files[hsh]], [( f[0], f[1] ) for f in self.population.files( hsh )] )
+
+	def test_file_get_range( self ):
+		hsh = self.population.torrent_hash( 0 )
+
+		async def test( ut ):
+			out = io.BytesIO( )
+			await ut.file_get( hsh + ".1", out, 1000, 70000 )
+			return out.getvalue( )
+
+		# the mock server sends the repeating 0-255 pattern
+		self.assertEqual( self._run( test ), bytes( i % 256 for i in range( 1000, 71000 ) ) )
+
+	def test_rss( self ):
+		async def test( ut ):
+			feed_id = await ut.rss_add( "http://feeds.example.com/new.rss" )
+			filter_id = await ut.rssfilter_add( feed_id )
+			await ut.rssfilter_update( filter_id, { "name": "new filter", "filter": "*new*" } )
+			feeds, filters = await ut.rss_list( ), await ut.rssfilter_list( )
+			await ut.rss_remove( feed_id )
+			await ut.rssfilter_remove( filter_id )
+			return feed_id, filter_id, feeds, filters, await ut.rss_list( ), await ut.rssfilter_list( )
+
+		feed_id, filter_id, feeds, filters, feeds_after, filters_after = self._run( test )
+		self.assertEqual( len( feeds ), 3 )
+		self.assertEqual( feeds[feed_id].url, "http://feeds.example.com/new.rss" )
+		self.assertEqual( len( filters ), 3 )
+		self.assertEqual( filters[filter_id].name, "new filter" )
+		self.assertEqual( filters[filter_id].feed_id, feed_id )
+		# removals come with the list delta
+		self.assertEqual( sorted( feeds_after ), sorted( set( feeds ) - { feed_id } ) )
+		self.assertEqual( sorted( filters_after ), sorted( set( filters ) - { filter_id } ) )
+
+	def test_autodetect( self ):
+		for api, cls in ( ( "desktop", utorrent.aio.AsyncDesktop ), ( "falcon", utorrent.aio.AsyncFalcon ),
+		                  ( "linux", utorrent.aio.AsyncLinuxServer ) ):
+			with MockServer( Population( torrents = 2, files = 1, api = api ) ) as server:
+				async def run( ):
+					async with utorrent.aio.AsyncConnection( server.host, server.login, server.password ) as connection:
+						ut = await connection.utorrent( )
+						return ut, await ut.torrent_list( )
+
+				ut, torrents = asyncio.run( run( ) )
+			self.assertIs( type( ut ), cls, api )
+			self.assertEqual( len( torrents ), 2 )
+
+	def test_concurrent_torrent_lists( self ):
+		async def test( ut ):
+			return ut, await asyncio.gather( *( ut.torrent_list( ) for i in range( 50 ) ) )
+
+		requests = self.server.request_count
+		ut, results = self._run( test, pool_size = 5 )
+		expected = sorted( self.population.torrent_hash( i ) for i in range( 20 ) )
+		for torrents in results:
+			self.assertEqual( sorted( torrents ), expected )
+		# the token request and a list request for every call, over no more than the pool size of connections
+		self.assertEqual( self.server.request_count - requests, 51 )
+		self.assertLessEqual( ut._connection.connect_count, 5 )
+		self.assertEqual( ut.instrumentation.actions["list"].requests, 50 )
+
+	def test_concurrent_token_refresh( self ):
+		hsh = self.population.torrent_hash( 0 )
+
+		async def test( ut ):
+			await ut.torrent_list( )
+			old_token = ut._connection._token
+			self.server.token += "0"
+			self.server.guid += "0"
+			with mock.patch.object( Connection, "_parse_token", side_effect = Connection._parse_token ) as parse_token:
+				await asyncio.gather( *( ut.torrent_stop( hsh ) for i in range( 20 ) ) )
+			return old_token, ut._connection._token, parse_token.call_count
+
+		old_token, token, token_requests = self._run( test, pool_size = 5 )
+		self.assertNotEqual( token, old_token )
+		# every rejected request waits for the single new token
+		self.assertEqual( token_requests, 1 )
+
+	def test_pooled_socket_has_nodelay( self ):
+		async def run( ):
+			connection = utorrent.aio.AsyncConnection( self.server.host, self.server.login, self.server.password )
+			try:
+				stream = await connection._pool.connect( )
+				try:
+					return stream.writer.get_extra_info( "socket" ).getsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY )
+				finally:
+					stream.close( )
+			finally:
+				await connection.close( )
+
+		self.assertTrue( asyncio.run( run( ) ) )
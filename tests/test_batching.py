@@ -0,0 +1,110 @@
+import unittest
+import urllib.parse
+from unittest import mock
+
+from tests.webui import WebUI
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population, _Handler
+
+HASHES = ["{:040X}".format( i ) for i in range( 200 )]
+
+
+class UrlLengthTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.webui = WebUI( ).start( )
+
+	def tearDown( self ):
+		self.webui.stop( )
+
+	def _actions( self, name ):
+		return [urllib.parse.parse_qs( urllib.parse.urlsplit( r ).query ) for r in self.webui.requests if "action={}&".format( name ) in r]
+
+	def test_list_is_split( self ):
+		connection = Connection( self.webui.host, "admin", "", max_url_length = 1000 )
+		self.assertEqual( connection.do_action( "stop", { "hash": HASHES } ), WebUI.response )
+		requests = [r for r in self.webui.requests if "action=stop&" in r]
+		self.assertGreater( len( requests ), 1 )
+		self.assertTrue( all( len( r ) <= 1000 for r in requests ) )
+		# every hash is sent once, in the same order
+		self.assertEqual( [h for query in self._actions( "stop" ) for h in query["hash"]], HASHES )
+
+	def test_groups_are_kept_together( self ):
+		connection = Connection( self.webui.host, "admin", "", max_url_length = 1000 )
+		groups = ["hash={}&s=label&v=x".format( h ) for h in HASHES]
+		connection.do_action( "setprops", params_str = groups )
+		queries = self._actions( "setprops" )
+		self.assertGreater( len( queries ), 1 )
+		for query in queries:
+			self.assertEqual( len( query["hash"] ), len( query["s"] ) )
+		self.assertEqual( [h for query in queries for h in query["hash"]], HASHES )
+
+	def test_short_action_is_sent_at_once( self ):
+		connection = Connection( self.webui.host, "admin", "" )
+		connection.do_action( "stop", { "hash": HASHES[:10] } )
+		self.assertEqual( len( self._actions( "stop" ) ), 1 )
+
+	def test_merge_responses( self ):
+		merged = Connection._merge_responses( [{ "build": 1, "files": ["a", [1]] }, { "build": 2, "files": ["b", [2]] }, { "build": 3 }] )
+		self.assertEqual( merged, { "build": 3, "files": ["a", [1], "b", [2]] } )
+
+
+class ActionBatchesTest( unittest.TestCase ):
+
+	count = 200
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = self.count, files = 2 ) ).start( )
+		self.hashes = [self.server.population.torrent_hash( i ) for i in range( self.count )]
+		self.received = []
+		received = self.received
+		getprops = _Handler._action_getprops
+
+		def record( handler, query, body ):
+			received.append( query.get( "hash", [] ) )
+			return getprops( handler, query, body )
+
+		patcher = mock.patch.object( _Handler, "_action_getprops", record )
+		patcher.start( )
+		self.addCleanup( patcher.stop )
+
+	def tearDown( self ):
+		self.server.stop( )
+
+	def _connection( self, **kwargs ):
+		connection = Connection( self.server.host, self.server.login, self.server.password, **kwargs )
+		self.addCleanup( connection.close )
+		return connection
+
+	def _props( self, connection ):
+		del self.received[:]
+		return connection.do_action( "getprops", { "hash": self.hashes } )
+
+	def test_split( self ):
+		expected = self._props( self._connection( max_url_length = 1 << 20 ) )
+		self.assertEqual( len( self.received ), 1 )
+		connection = self._connection( max_url_length = 1000 )
+		self.assertGreater( len( connection._action_batches( "getprops", { "hash": self.hashes } ) ), 2 )
+		res = self._props( connection )
+		self.assertGreater( len( self.received ), 2 )
+		# every hash is sent exactly once and the parts are merged into the single response
+		self.assertEqual( sorted( h for hashes in self.received for h in hashes ), sorted( self.hashes ) )
+		self.assertEqual( res, expected )
+		self.assertEqual( len( res["props"] ), self.count )
+
+	def test_file_list( self ):
+		expected = self._connection( max_url_length = 1 << 20 ).utorrent( "falcon" ).file_list( self.hashes )
+		res = self._connection( max_url_length = 1000 ).utorrent( "falcon" ).file_list( self.hashes )
+		self.assertEqual( sorted( res.keys( ) ), sorted( self.hashes ) )
+		for hsh in self.hashes:
+			self.assertEqual( [f.name for f in res[hsh]], [f.name for f in expected[hsh]] )
+
+	def test_post( self ):
+		expected = self._props( self._connection( max_url_length = 1 << 20 ) )
+		connection = self._connection( max_url_length = 1000, post_actions = ["getprops"] )
+		# arguments in the request body are not limited by the url length
+		self.assertEqual( connection._action_batches( "getprops", { "hash": self.hashes } ), [( { "hash": self.hashes }, None )] )
+		res = self._props( connection )
+		self.assertEqual( len( self.received ), 1 )
+		self.assertEqual( sorted( self.received[0] ), sorted( self.hashes ) )
+		self.assertEqual( res, expected )
@@ -0,0 +1,38 @@
+import importlib.util
+import json
+import os
+import unittest
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+
+def _load_bench( ):
+	spec = importlib.util.spec_from_file_location( "bench", os.path.join( ROOT, "benchmarks", "bench.py" ) )
+	module = importlib.util.module_from_spec( spec )
+	spec.loader.exec_module( module )
+	return module
+
+
+class BenchmarkTest( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		cls.bench = _load_bench( )
+
+	def test_quick_benchmarks_run( self ):
+		requests = { }
+		for name, func, repeat, slow in self.bench._benchmarks:
+			if not slow:
+				best, requests[name], transferred = self.bench.run_benchmark( func, 1 )
+				self.assertGreater( best, 0 )
+		# requests are counted for the request gate
+		self.assertGreater( requests["file_get_64MiB"], 0 )
+
+	def test_baseline_names_benchmarks( self ):
+		self.assertTrue( os.path.exists( self.bench.BASELINE ) )
+		with open( self.bench.BASELINE, "r", encoding = "utf8" ) as f:
+			results = json.load( f )["results"]
+		# new benchmarks may not be recorded yet, but every recorded one must exist
+		self.assertLessEqual( set( results ), { name for name, func, repeat, slow in self.bench._benchmarks } )
+		for result in results.values( ):
+			self.assertEqual( sorted( result ), ["bytes", "relative", "requests"] )
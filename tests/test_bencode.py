@@ -0,0 +1,91 @@
+import io
+import mmap
+import unittest
+
+import utorrent
+
+INFO = b"d6:lengthi10e4:name5:a.txt12:piece lengthi16384e6:pieces20:" + b"\x00" * 20 + b"e"
+TORRENT = b"d8:announce30:http://tracker.example.com/ann4:info" + INFO + b"e"
+
+
+class BencodeTest( unittest.TestCase ):
+
+	def test_round_trip( self ):
+		obj = { "a": [1, -2, 0, "x", b"\xff\xfe", [], { }], "b": { "c": "\u0436", "d": 1 << 70 }, "": "" }
+		data = utorrent.bencode( obj )
+		self.assertEqual( data, b"d0:0:1:ali1ei-2ei0e1:x2:\xff\xfeledee1:bd1:c2:\xd0\xb61:di1180591620717411303424eee" )
+		obj["a"][4] = bytearray( b"\xff\xfe" )
+		self.assertEqual( utorrent.bdecode( data ), obj )
+
+	def test_binary_keys( self ):
+		data = b"d1:ai2e1:bi3e2:\xff\xfei1ee"
+		obj = utorrent.bdecode( data )
+		self.assertEqual( obj, { b"\xff\xfe": 1, "a": 2, "b": 3 } )
+		# keys are sorted by their encoded form
+		self.assertEqual( utorrent.bencode( obj ), data )
+
+	def test_bencode_to( self ):
+		obj = { "info": { "pieces": b"\xff" * 1000, "files": [{ "path": ["a", "b"], "length": i } for i in range( 100 )] } }
+		data = utorrent.bencode( obj )
+		out = bytearray( b"prefix" )
+		utorrent.bencode_to( obj, out )
+		self.assertEqual( out, b"prefix" + data )
+		# the file gets it in several chunks
+		chunks = []
+		f = io.BytesIO( )
+		f.write = lambda b, write = f.write: chunks.append( bytes( b ) ) or write( b )
+		utorrent.bencode_to( obj, f, flush_size = 100 )
+		self.assertEqual( f.getvalue( ), data )
+		self.assertGreater( len( chunks ), 1 )
+		self.assertEqual( utorrent.bdecode( f.getvalue( ) ), obj )
+
+	def test_deep_nesting( self ):
+		depth = 100000
+		self.assertEqual( utorrent.bencoded_end( b"l" * depth + b"e" * depth ), 2 * depth )
+		obj = utorrent.bdecode( b"l" * depth + b"i1e" + b"e" * depth )
+		for i in range( depth ):
+			obj, = obj
+		self.assertEqual( obj, 1 )
+
+	def test_malformed( self ):
+		for data in ( b"", b"ie", b"i1x2e" ):
+			self.assertRaises( ValueError, utorrent.bdecode, data )
+		# values are skipped without decoding, so only the structure is checked
+		for data in ( b"i12", b"l", b"li1e", b"d1:a", b"d1:ai1e", b"5:ab", b"3x:abc", b"x", b"l1:ax" ):
+			self.assertRaises( ValueError, utorrent.bdecode, data )
+			self.assertRaises( ValueError, utorrent.bencoded_end, data )
+
+	def test_info_hash( self ):
+		self.assertEqual( utorrent.info_hash( TORRENT ), "8B1CC0BF7A54D545B42F7A2B7E52F4EF7AF8A5D0" )
+		self.assertEqual( utorrent.info_hash( TORRENT, 2 ), "EDF5E6ABB5C64A4DD4AE53F3374236C26295FEBF5D2F52F0900A487240D2E4E3" )
+		self.assertEqual( utorrent.info_hash( utorrent.bdecode( TORRENT ) ), "8B1CC0BF7A54D545B42F7A2B7E52F4EF7AF8A5D0" )
+		self.assertRaises( ValueError, utorrent.info_hash, TORRENT, 3 )
+
+	def test_info_hash_not_canonical( self ):
+		# the dictionary is hashed as it's stored, not as it would be encoded again
+		info = b"d4:name5:a.txt6:lengthi10e12:piece lengthi16384e6:pieces20:" + b"\x00" * 20 + b"e"
+		self.assertEqual( utorrent.info_hash( b"d4:info" + info + b"e" ), "5289022FF96E00E100F7B44C12E0BFD501EF09A1" )
+
+
+class BencodedBufferTest( unittest.TestCase ):
+
+	def test_whole_buffer_is_not_copied( self ):
+		for data in ( b"d1:ai1ee", bytearray( b"d1:ai1ee" ) ):
+			with memoryview( data ) as view:
+				self.assertIs( utorrent._bencoded_buffer( view ), data )
+				self.assertEqual( utorrent.bdecode( view ), { "a": 1 } )
+		m = mmap.mmap( -1, 8 )
+		try:
+			m.write( b"d1:ai1ee" )
+			with memoryview( m ) as view:
+				self.assertIs( utorrent._bencoded_buffer( view ), m )
+				self.assertEqual( utorrent.bdecode( view ), { "a": 1 } )
+		finally:
+			m.close( )
+
+	def test_slice_is_copied( self ):
+		data = b"xxd1:ai1eexx"
+		with memoryview( data ) as view:
+			self.assertEqual( utorrent._bencoded_buffer( view[2:-2] ), b"d1:ai1ee" )
+			self.assertEqual( utorrent.bdecode( view[2:-2] ), { "a": 1 } )
+		self.assertEqual( utorrent.bdecode( iter( b"i5e" ) ), 5 )
@@ -0,0 +1,97 @@
+import unittest
+
+import utorrent
+import utorrent.changes
+from utorrent.changes import Change
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+
+NEW_HASH = "A" * 40
+
+
+class TorrentChangesTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 10, files = 1, feeds = 2, filters = 2 ) ).start( )
+		self.population = self.server.population
+		self.ut = Connection( self.server.host, self.server.login, self.server.password ).utorrent( "falcon" )
+
+	def tearDown( self ):
+		self.server.stop( )
+
+	@staticmethod
+	def _summary( changes ):
+		# comparable form of the changes, status is compared by the flipped flags
+		out = []
+		for c in changes:
+			fields = { name: values for name, values in c.fields.items( ) if name != "status" }
+			out.append( ( c.kind, c.id, fields, c.status_flags ) )
+		return sorted( out, key = lambda c: ( c[0], str( c[1] ) ) )
+
+	def _make_changes( self ):
+		hashes = list( self.ut._torrent_cache )
+		self.stopped = [h for h in hashes if self.ut._torrent_cache[h][1] == 201][0]
+		self.relabelled, self.removed = [h for h in hashes if h != self.stopped][:2]
+		self.old_label = self.ut._torrent_cache[self.relabelled][11]
+		self.population.set_prop( self.relabelled, "label", "relabelled" )
+		self.population.set_status( self.stopped, "stop" )
+		self.population.remove( self.removed )
+		self.population.add( NEW_HASH, "Added.Torrent", [1 << 20] )
+		self.feed_id = sorted( self.ut._rssfeed_cache )[0]
+		self.old_url = self.ut._rssfeed_cache[self.feed_id][6]
+		self.population.feed_update( self.feed_id, { "url": "http://feed.example.com/new" } )
+		self.filter_id = sorted( self.ut._rssfilter_cache )[0]
+		self.population.filter_remove( self.filter_id )
+
+	def _expected( self ):
+		return sorted( [
+			( Change.ADDED, NEW_HASH, { }, { } ),
+			( Change.CHANGED, self.feed_id, { "url": ( self.old_url, "http://feed.example.com/new" ) }, { } ),
+			( Change.CHANGED, self.relabelled, { "label": ( self.old_label, "relabelled" ) }, { } ),
+			( Change.CHANGED, self.stopped, { }, { "started": ( True, False ), "queued": ( True, False ) } ),
+			( Change.REMOVED, self.filter_id, { }, { } ),
+			( Change.REMOVED, self.removed, { }, { } ),
+		], key = lambda c: ( c[0], str( c[1] ) ) )
+
+	def test_first_fetch( self ):
+		changes = self.ut.torrent_changes( )
+		self.assertEqual( len( changes ), 14 )
+		self.assertEqual( len( changes.added ), 14 )
+		self.assertEqual( sorted( c.id for c in changes.torrents ), sorted( self.population.torrent_hash( i ) for i in range( 10 ) ) )
+		self.assertTrue( all( c.old is None and c.new is not None and c.fields == { } for c in changes ) )
+		self.assertEqual( len( self.ut.torrent_changes( ) ), 0 )
+
+	def test_delta( self ):
+		self.ut.torrent_changes( )
+		self._make_changes( )
+		changes = self.ut.torrent_changes( )
+		self.assertEqual( self._summary( changes ), self._expected( ) )
+		self.assertEqual( [c.id for c in changes.added], [NEW_HASH] )
+		self.assertEqual( changes.added[0].new.name, "Added.Torrent" )
+		removed = { c.id: c for c in changes.removed }
+		self.assertEqual( removed[self.removed].old.hash_code, self.removed )
+		self.assertIsNone( removed[self.removed].new )
+		self.assertEqual( removed[self.filter_id].old.filter_id, self.filter_id )
+		changed = { c.id: c for c in changes.changed }
+		self.assertEqual( changed[self.stopped].old.hash_code, self.stopped )
+		self.assertEqual( str( changed[self.relabelled] ).split( ": " )[-1], "label {} -> relabelled".format( self.old_label ) )
+		# the changes were applied to the cache
+		self.assertEqual( len( self.ut.torrent_changes( ) ), 0 )
+		self.assertEqual( self.ut._torrent_cache[self.relabelled][11], "relabelled" )
+
+	def test_full_list( self ):
+		self.ut.torrent_changes( )
+		self._make_changes( )
+		# cache id isn't known anymore, the full list is compared with the cached rows
+		self.population.forget_cids( )
+		self.assertEqual( self._summary( self.ut.torrent_changes( ) ), self._expected( ) )
+		self.assertEqual( len( self.ut.torrent_changes( ) ), 0 )
+
+	def test_compare_doesnt_modify_cache( self ):
+		self.ut.torrent_changes( )
+		cache = dict( self.ut._torrent_cache )
+		self._make_changes( )
+		changes = utorrent.changes.ListChanges( )
+		changes.compare( self.ut, self.population.list( int( self.ut._list_cache_id ) ) )
+		self.assertEqual( self._summary( changes ), self._expected( ) )
+		self.assertEqual( self.ut._torrent_cache, cache )
@@ -0,0 +1,91 @@
+import gzip
+import unittest
+import zlib
+from unittest import mock
+
+import utorrent
+import utorrent.mock_server
+from utorrent.connection import Connection, ContentDecoder
+from utorrent.mock_server import MockServer, Population
+
+_gzip = gzip.compress
+BODY = b'{"build":1,"torrents":[' + b",".join( b'["%040d",201,"name"]' % i for i in range( 100 ) ) + b"]}"
+
+
+class ContentDecoderTest( unittest.TestCase ):
+
+	def _decode( self, encoding, data, chunk = 7 ):
+		decoder = ContentDecoder( encoding )
+		return b"".join( [decoder.decompress( data[i:i + chunk] ) for i in range( 0, len( data ), chunk )] + [decoder.flush( )] )
+
+	def test_encodings( self ):
+		for encoding, data in ( ( None, BODY ), ( "identity", BODY ), ( "gzip", gzip.compress( BODY ) ), ( "x-gzip", gzip.compress( BODY ) ),
+		                        ( " Deflate ", zlib.compress( BODY ) ), ( "deflate", zlib.compress( BODY )[2:-4] ) ):
+			self.assertEqual( self._decode( encoding, data ), BODY, encoding )
+		self.assertRaises( utorrent.uTorrentError, ContentDecoder, "br" )
+
+	def test_truncated( self ):
+		for encoding, data in ( ( "gzip", gzip.compress( BODY ) ), ( "deflate", zlib.compress( BODY ) ), ( "deflate", zlib.compress( BODY )[2:-4] ) ):
+			for end in ( 1, len( data ) // 2, len( data ) - 9 ):
+				self.assertRaises( utorrent.uTorrentError, self._decode, encoding, data[:end] )
+
+	def test_corrupt( self ):
+		data = bytearray( gzip.compress( BODY ) )
+		data[20:30] = b"\xff" * 10
+		self.assertRaises( utorrent.uTorrentError, self._decode, "gzip", bytes( data ) )
+		self.assertRaises( utorrent.uTorrentError, self._decode, "gzip", b"not gzip at all" )
+		self.assertRaises( utorrent.uTorrentError, self._decode, "deflate", b"\xff" * 20 )
+
+
+class CompressedResponseTest( unittest.TestCase ):
+
+	def _utorrent( self, server ):
+		return Connection( server.host, server.login, server.password ).utorrent( "falcon" )
+
+	def _check( self, compression ):
+		with MockServer( Population( torrents = 200, files = 1 ), compression = compression ) as server:
+			ut = self._utorrent( server )
+			connection = ut._connection
+			received, decoded = connection.bytes_received, connection.bytes_decoded
+			torrents = ut.torrent_list( )
+			streamed = [t.hash_code for t in self._utorrent( server ).iter_torrents( )]
+			self.assertEqual( sorted( torrents ), sorted( server.population.torrent_hash( i ) for i in range( 200 ) ) )
+			self.assertEqual( sorted( streamed ), sorted( torrents ) )
+			body = server.encode_json( server.population.list( ) )
+			return connection.bytes_received - received, connection.bytes_decoded - decoded, len( body )
+
+	def test_gzip( self ):
+		received, decoded, size = self._check( "gzip" )
+		self.assertLess( received, decoded // 2 )
+		# the list is built for the request, it differs only in the cache id
+		self.assertAlmostEqual( decoded, size, delta = 10 )
+
+	def test_deflate( self ):
+		received, decoded, size = self._check( "deflate" )
+		self.assertLess( received, decoded // 2 )
+		self.assertAlmostEqual( decoded, size, delta = 10 )
+
+	def test_uncompressed( self ):
+		received, decoded, size = self._check( False )
+		self.assertEqual( received, decoded )
+		self.assertAlmostEqual( decoded, size, delta = 10 )
+
+	def _check_error( self, compress ):
+		with MockServer( Population( torrents = 200, files = 1 ) ) as server:
+			ut = self._utorrent( server )
+			with mock.patch.object( utorrent.mock_server.gzip, "compress", side_effect = compress ):
+				self.assertRaises( utorrent.uTorrentError, ut.torrent_list )
+				self.assertRaises( utorrent.uTorrentError, list, self._utorrent( server ).iter_torrents( ) )
+			# the broken connection isn't reused
+			self.assertEqual( len( ut.torrent_list( ) ), 200 )
+
+	def test_truncated( self ):
+		self._check_error( lambda data, level: _gzip( data, level )[:-20] )
+
+	def test_corrupt( self ):
+		def corrupt( data, level ):
+			out = bytearray( _gzip( data, level ) )
+			out[len( out ) // 2:len( out ) // 2 + 16] = b"\xff" * 16
+			return bytes( out )
+
+		self._check_error( corrupt )
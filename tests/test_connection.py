@@ -0,0 +1,97 @@
+import socket
+import unittest
+
+from tests.webui import WebUI
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+
+
+class KeepAliveTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.webui = WebUI( ).start( )
+
+	def tearDown( self ):
+		self.webui.stop( )
+
+	def _connection( self, keep_alive ):
+		return Connection( self.webui.host, "admin", "", keep_alive = keep_alive )
+
+	def test_connection_is_reused( self ):
+		connection = self._connection( True )
+		for i in range( 10 ):
+			self.assertEqual( connection.do_action( "getsettings" ), WebUI.response )
+		# the token request opened the only connection
+		self.assertEqual( self.webui.connection_count, 1 )
+		self.assertEqual( connection.connect_count, 1 )
+		self.assertEqual( connection.reuse_count, 10 )
+
+	def test_connection_is_closed_without_keep_alive( self ):
+		connection = self._connection( False )
+		for i in range( 10 ):
+			connection.do_action( "getsettings" )
+		self.assertEqual( self.webui.connection_count, 11 )
+		self.assertEqual( connection.reuse_count, 0 )
+
+	def test_server_closing_the_connection( self ):
+		self.webui.keep_alive = False
+		connection = self._connection( True )
+		connection.do_action( "getsettings" )
+		# the client doesn't keep the connection the server asked to close
+		self.assertEqual( self.webui.connection_count, 2 )
+		self.assertEqual( connection.reuse_count, 0 )
+
+	def test_dropped_connection_is_reopened( self ):
+		connection = self._connection( True )
+		connection.do_action( "getsettings" )
+		self.webui.drop_connections( )
+		self.assertEqual( connection.do_action( "getsettings" ), WebUI.response )
+		self.assertEqual( connection.reconnect_count, 1 )
+		self.assertEqual( self.webui.connection_count, 2 )
+		self.assertEqual( len( self.webui.requests ), 3 )
+
+
+class MockServerKeepAliveTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 3, files = 1 ) ).start( )
+
+	def tearDown( self ):
+		self.server.stop( )
+
+	def _connection( self, keep_alive ):
+		return Connection( self.server.host, self.server.login, self.server.password, keep_alive = keep_alive )
+
+	def _accepted( self, ut, count = 10 ):
+		hsh = self.server.population.torrent_hash( 0 )
+		ut.torrent_list( )
+		before = self.server.connection_count
+		for i in range( count ):
+			ut.torrent_stop( hsh )
+		return self.server.connection_count - before
+
+	def test_connection_is_reused( self ):
+		connection = self._connection( True )
+		ut = connection.utorrent( "falcon" )
+		self.assertEqual( self._accepted( ut ), 0 )
+		self.assertEqual( connection.connect_count, 1 )
+		self.assertGreaterEqual( connection.reuse_count, 10 )
+		# the pool hands back the same connection every time
+		conn = connection._pool.acquire( )
+		connection._pool.release( conn )
+		ut.torrent_stop( self.server.population.torrent_hash( 0 ) )
+		self.assertIs( connection._pool.acquire( ), conn )
+
+	def test_connection_is_closed_without_keep_alive( self ):
+		connection = self._connection( False )
+		self.assertEqual( self._accepted( connection.utorrent( "falcon" ) ), 10 )
+		self.assertEqual( connection.reuse_count, 0 )
+
+	def test_pooled_socket_has_nodelay( self ):
+		connection = self._connection( True )
+		connection.utorrent( "falcon" ).torrent_list( )
+		conn = connection._pool.acquire( )
+		try:
+			self.assertTrue( conn.sock.getsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY ) )
+		finally:
+			connection._pool.release( conn )
@@ -0,0 +1,61 @@
+import json
+import unittest
+from unittest import mock
+
+import utorrent.jsonstream
+from utorrent.connection import decode_json
+
+
+class DecodeJsonTest( unittest.TestCase ):
+	"""
+	Every case is checked with orjson (if it's installed) and with the json module.
+	"""
+
+	def assertDecodes( self, text, expected ):
+		if utorrent.jsonstream.orjson is not None:
+			self.assertEqual( decode_json( text ), expected )
+		with mock.patch.object( utorrent.jsonstream, "orjson", None ):
+			self.assertEqual( decode_json( text ), expected )
+
+	def test_no_duplicates( self ):
+		self.assertDecodes( '{"build":1,"label":[["a",1]],"torrents":[["H",1]]}', { "build": 1, "label": [["a", 1]], "torrents": [["H", 1]] } )
+		self.assertDecodes( "[1,2]", [1, 2] )
+
+	def test_adjacent_duplicates( self ):
+		self.assertDecodes( '{"build":1,"files":["A",[1]],"files":["B",[2]],"files":["C",[]]}',
+		                    { "build": 1, "files": ["A", [1], "B", [2], "C", []] } )
+
+	def test_empty_duplicates( self ):
+		self.assertDecodes( '{"files":[],"files":[],"build":1}', { "files": [], "build": 1 } )
+
+	def test_separated_duplicates( self ):
+		self.assertDecodes( '{"files":["A"],"build":1,"files":["B"]}', { "files": ["A", "B"], "build": 1 } )
+
+	def test_whitespace( self ):
+		self.assertDecodes( '{ "files" : ["A"] ,\n "files": ["B"] }', { "files": ["A", "B"] } )
+		# the number of '":[' matches the number of list keys, but "a" is not compact
+		self.assertDecodes( '{"a": [1],"files":["A"],"files":["B"]}', { "a": [1], "files": ["A", "B"] } )
+		# the number of '":[' matches the number of list keys, but the duplicate isn't compact
+		self.assertDecodes( '{"a":[1],"b":[2],"a" :[3]}', { "a": [1, 3], "b": [2] } )
+
+	def test_strings_with_pattern( self ):
+		name = 'x],"files":["y'
+		text = json.dumps( { "files": ["A", [[name, 1]]] }, separators = ( ",", ":" ) )
+		text = text[:-1] + ',"files":' + json.dumps( ["B", [[name + "]", 2]]], separators = ( ",", ":" ) ) + "}"
+		self.assertDecodes( text, { "files": ["A", [[name, 1]], "B", [[name + "]", 2]]] } )
+		self.assertDecodes( '{"label":[["],\\"label\\":[",1]]}', { "label": [['],"label":[', 1]] } )
+
+	def test_nested_duplicates( self ):
+		# nested objects keep the last value like the native decoder does, only the top-level lists are joined
+		self.assertDecodes( '{"files":["A",{"x":[1],"files":[2],"files":[3]}],"files":["B"]}',
+		                    { "files": ["A", { "x": [1], "files": [3] }, "B"] } )
+
+	def test_several_duplicate_keys( self ):
+		self.assertDecodes( '{"files":["A"],"files":["B"],"props":[1],"props":[2]}', { "files": ["A", "B"], "props": [1, 2] } )
+
+	def test_invalid( self ):
+		for text in ( '{"files":[1],"files":[2]', '{"files":[1],"files":}' ):
+			if utorrent.jsonstream.orjson is not None:
+				self.assertRaises( ValueError, decode_json, text )
+			with mock.patch.object( utorrent.jsonstream, "orjson", None ):
+				self.assertRaises( ValueError, decode_json, text )
@@ -0,0 +1,28 @@
+import unittest
+
+import utorrent.index
+
+
+class TorrentIndexTest( unittest.TestCase ):
+
+	def test_lookups( self ):
+		rows = { h: [h, 201 if i % 2 else 136, name, 0, 0, 0, 0, 0, 0, 0, 0, label] for i, ( h, name, label ) in
+		         enumerate( ( ( "AB01", "Ubuntu 24.04", "linux" ), ( "AB02", "Debian", "linux" ), ( "CD03", "Some Album", "" ) ) )}
+		index = utorrent.index.TorrentIndex( rows )
+		self.assertEqual( index.label( "linux" ), { "AB01", "AB02" } )
+		self.assertEqual( index.labels( ), ["", "linux"] )
+		self.assertEqual( index.hash_prefix( "ab" ), ["AB01", "AB02"] )
+		self.assertEqual( index.name_contains( "UBUNTU 24" ), { "AB01" } )
+		self.assertEqual( index.name_contains( "an" ), { "AB02" } )
+		self.assertEqual( index.status( "started" ), { "AB02" } )
+		self.assertRaises( KeyError, index.status, "unknown" )
+
+		new = list( rows["AB01"] )
+		new[11] = "iso"
+		index.update( rows["AB01"], new )
+		rows["AB01"] = new
+		index.remove( rows.pop( "CD03" ) )
+		self.assertEqual( index.label( "linux" ), { "AB02" } )
+		self.assertEqual( index.labels( ), ["iso", "linux"] )
+		self.assertEqual( index.hash_prefix( "c" ), [] )
+		self.assertEqual( index.name_contains( "album" ), set( ) )
@@ -0,0 +1,134 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import utorrent
+from utorrent.connection import Connection
+from utorrent.instrument import ActionStats, Instrumentation, RequestRecord
+from utorrent.mock_server import MockServer, Population
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+
+def _record( action, error = None, **values ):
+	record = RequestRecord( action )
+	for name, value in values.items( ):
+		setattr( record, name, value )
+	record.error = error
+	return record
+
+
+class InstrumentationTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.instrumentation = Instrumentation( )
+		self.instrumentation.record( _record( "list", connect = 0.001, wait = 0.01, transfer = 0.002, decode = 0.003, bytes_sent = 100,
+		                                      bytes_received = 2048, retries = 1 ) )
+		self.instrumentation.record( _record( "getfiles", wait = 0.004, bytes_sent = 50, bytes_received = 512 ) )
+		self.instrumentation.record( _record( "list", "Timeout after 3 tries", wait = 0.02, bytes_sent = 100, retries = 2, reconnects = 1 ) )
+		self.instrumentation.record( _record( "list", build = 0.0005, request = False ) )
+
+	def test_action_stats( self ):
+		actions = self.instrumentation.actions
+		self.assertEqual( list( actions ), ["list", "getfiles"] )
+		stats = actions["list"]
+		self.assertEqual( ( stats.requests, stats.errors, stats.retries, stats.reconnects ), ( 2, 1, 3, 1 ) )
+		self.assertEqual( ( stats.bytes_sent, stats.bytes_received ), ( 200, 2048 ) )
+		self.assertAlmostEqual( stats.connect, 0.001 )
+		self.assertAlmostEqual( stats.wait, 0.03 )
+		self.assertAlmostEqual( stats.transfer, 0.002 )
+		self.assertAlmostEqual( stats.decode, 0.003 )
+		self.assertAlmostEqual( stats.total, 0.0365 )
+		self.assertEqual( actions["getfiles"].requests, 1 )
+
+	def test_build( self ):
+		with self.instrumentation.build( "getfiles" ) as record:
+			self.assertFalse( record.request )
+		stats = self.instrumentation.actions["getfiles"]
+		self.assertEqual( ( stats.requests, stats.errors ), ( 1, 0 ) )
+		self.assertGreater( record.build, 0 )
+		self.assertAlmostEqual( stats.build, record.build )
+
+	def test_build_error( self ):
+		with self.assertRaises( KeyError ):
+			with self.instrumentation.build( "getfiles" ):
+				raise KeyError( "x" )
+		stats = self.instrumentation.actions["getfiles"]
+		# build isn't a request, but its error is counted
+		self.assertEqual( ( stats.requests, stats.errors ), ( 1, 1 ) )
+
+	def test_listeners( self ):
+		records = []
+		self.instrumentation.add_listener( records.append )
+		record = _record( "list" )
+		self.instrumentation.record( record )
+		self.instrumentation.remove_listener( records.append )
+		self.instrumentation.record( _record( "list" ) )
+		self.assertEqual( records, [record] )
+
+	def test_reset( self ):
+		self.instrumentation.reset( )
+		self.assertEqual( self.instrumentation.actions, { } )
+		self.assertEqual( self.instrumentation.summary( ).splitlines( )[1].split( ), ["total", "0", "0", "0", "0"] + ["0.0"] * 6 + ["0B", "0B"] )
+
+	def test_summary( self ):
+		self.assertEqual( self.instrumentation.summary( ).splitlines( ), [
+			"action    reqs  errors  retries  reconn  connect  wait  transfer  decode  build  total  sent  received",
+			"list         2       1        3       1      1.0  30.0       2.0     3.0    0.5   36.5  200B   2.00kiB",
+			"getfiles     1       0        0       0      0.0   4.0       0.0     0.0    0.0    4.0   50B      512B",
+			"total        3       1        3       1      1.0  34.0       2.0     3.0    0.5   40.5  250B   2.50kiB",
+		] )
+
+	def test_action_stats_add( self ):
+		stats = ActionStats( "list" )
+		stats.add( _record( "list", bytes_received = 10, decode = 0.5 ) )
+		build = _record( "list", build = 0.25 )
+		build.request = False
+		stats.add( build )
+		self.assertEqual( ( stats.requests, stats.bytes_received, stats.total ), ( 1, 10, 0.75 ) )
+
+
+class ConnectionTimingsTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 50, files = 3 ) ).start( )
+
+	def tearDown( self ):
+		self.server.stop( )
+
+	def test_requests_are_recorded( self ):
+		connection = Connection( self.server.host, self.server.login, self.server.password )
+		ut = connection.utorrent( "falcon" )
+		connection.instrumentation.reset( )
+		received = connection.bytes_received
+		ut.torrent_list( )
+		ut.file_list( [self.server.population.torrent_hash( 0 )] )
+		actions = connection.instrumentation.actions
+		self.assertEqual( list( actions ), ["list", "getfiles"] )
+		self.assertEqual( ( actions["list"].requests, actions["getfiles"].requests ), ( 1, 1 ) )
+		self.assertEqual( actions["list"].bytes_received + actions["getfiles"].bytes_received, connection.bytes_received - received )
+		self.assertGreater( actions["list"].build, 0 )
+		self.assertGreater( actions["list"].decode, 0 )
+		self.assertEqual( actions["list"].errors, 0 )
+
+	def test_timings_printed_on_exit( self ):
+		config = tempfile.mkdtemp( )
+		try:
+			env = dict( os.environ, XDG_CONFIG_HOME = config, XDG_CACHE_HOME = config )
+			out = subprocess.run( [sys.executable, os.path.join( ROOT, "utorrentctl.py" ), "-H", self.server.host, "-U", self.server.login, "-P",
+			                       self.server.password, "--api", "falcon", "-l", "--timings"], cwd = ROOT, env = env, capture_output = True,
+			                      text = True, timeout = 60 )
+		finally:
+			shutil.rmtree( config )
+		self.assertEqual( out.returncode, 0, out.stderr )
+		lines = out.stderr.splitlines( )
+		self.assertEqual( lines[0].split( ), ["action", "reqs", "errors", "retries", "reconn", "connect", "wait", "transfer", "decode", "build",
+		                                      "total", "sent", "received"] )
+		rows = { line.split( )[0]: line.split( ) for line in lines[1:] }
+		self.assertEqual( rows["list"][1:3], ["1", "0"] )
+		self.assertIn( "total", rows )
+		# torrents and the totals line
+		self.assertEqual( len( out.stdout.splitlines( ) ), 51 )
@@ -0,0 +1,134 @@
+import json
+import random
+import unittest
+from unittest import mock
+
+import utorrent.jsonstream
+import utorrent.uTorrent
+from utorrent.connection import Connection
+from utorrent.jsonstream import ObjectStreamParser
+from utorrent.mock_server import MockServer, Population
+
+
+def _list_text( ):
+	out = Population( torrents = 6, files = 1 ).list( )
+	# names that look like the boundaries of the rows or of the strings
+	names = ['a],["b', 'quote " and \\ backslash', "жé \U0001f600", "", "[[", "12345"]
+	for row, name in zip( out["torrents"], names ):
+		row[2] = name
+	out["torrents"][0].append( [1, [2, "],["]] )
+	return json.dumps( out, separators = ( ",", ":" ) ), out
+
+
+def _parse( chunks ):
+	parser = ObjectStreamParser( ( "torrents", "rssfeeds", "rssfilters" ) )
+	rows = []
+	for chunk in chunks:
+		rows.extend( parser.feed( chunk ) )
+	rows.extend( parser.close( ) )
+	return rows, parser.result
+
+
+class ObjectStreamParserTest( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		cls.text, cls.expected = _list_text( )
+
+	def assertParsed( self, chunks ):
+		rows, result = _parse( chunks )
+		self.assertEqual( [row for key, row in rows if key == "torrents"], self.expected["torrents"] )
+		self.assertEqual( result, { k: v if k not in ( "torrents", "rssfeeds", "rssfilters" ) else [] for k, v in self.expected.items( ) } )
+
+	def test_every_split( self ):
+		for i in range( len( self.text ) + 1 ):
+			self.assertParsed( [self.text[:i], self.text[i:]] )
+
+	def test_single_chars( self ):
+		self.assertParsed( list( self.text ) )
+
+	def test_random_chunks( self ):
+		rnd = random.Random( 1 )
+		for i in range( 50 ):
+			chunks, pos = [], 0
+			while pos < len( self.text ):
+				size = rnd.randint( 1, 40 )
+				chunks.append( self.text[pos:pos + size] )
+				pos += size
+			self.assertParsed( chunks )
+
+	def test_whitespace( self ):
+		text = json.dumps( self.expected, indent = 1 )
+		for i in range( 0, len( text ) + 1, 7 ):
+			self.assertParsed( [text[:i], text[i:]] )
+
+	def test_number_at_chunk_end( self ):
+		rows, result = _parse( ['{"build":12', '34,"torrentc":"5"}'] )
+		self.assertEqual( result, { "build": 1234, "torrentc": "5" } )
+
+	def test_incomplete( self ):
+		for text in ( self.text[:-1], self.text[:len( self.text ) // 2], '{"torrents":[[1],' ):
+			self.assertRaises( ValueError, _parse, [text] )
+
+	def test_nested_rows( self ):
+		# rss feed rows hold the list of the feed items, the rows can't be told apart by '],['
+		feeds = [[i, True, False, False, False, 0, "http://feed/{}|".format( i ), 1600000000 + i,
+		          [["Item {}.{} \\ \"q\" ],[".format( i, j ), "full ]", "http://item/{}".format( j ), 4, 2, 1600000000, 1, j, 0, i, 0, False]
+		           for j in range( 5 )]] for i in range( 200 )]
+		text = json.dumps( { "build": 1, "rssfeeds": feeds, "torrentc": "1" }, separators = ( ",", ":" ) )
+		decoded = []
+		with mock.patch.object( utorrent.jsonstream, "loads", side_effect = lambda t: decoded.append( len( t ) ) or json.loads( t ) ):
+			for size in ( 1, 7, 64, 4096 ):
+				rows, result = _parse( [text[i:i + size] for i in range( 0, len( text ), size )] )
+				self.assertEqual( [row for key, row in rows], feeds )
+				self.assertEqual( result, { "build": 1, "rssfeeds": [], "torrentc": "1" } )
+				# every element is decoded once, not again with every chunk
+				self.assertLess( sum( decoded ), 3 * len( text ) )
+				del decoded[:]
+
+	def test_large_element( self ):
+		row = [["x" * 10, [i, "],["]] for i in range( 2000 )]
+		text = json.dumps( { "rssfeeds": [row, row] } )
+		decoded = []
+		with mock.patch.object( utorrent.jsonstream, "loads", side_effect = lambda t: decoded.append( len( t ) ) or json.loads( t ) ):
+			rows, result = _parse( [text[i:i + 100] for i in range( 0, len( text ), 100 )] )
+		self.assertEqual( [row for key, row in rows], [row, row] )
+		self.assertLess( sum( decoded ), 3 * len( text ) )
+
+	def test_invalid_elements( self ):
+		for text in ( '{"torrents":[1,,2]}', '{"torrents":[1,]}', '{"torrents":[[1],}', '{"rssfeeds":[[[1]],x]}' ):
+			self.assertRaises( ValueError, _parse, [text] )
+			self.assertRaises( ValueError, _parse, list( text ) )
+
+	def test_list_stream( self ):
+		stream = utorrent.uTorrent._ListStream( )
+		rows = []
+		for i in range( 0, len( self.text ), 13 ):
+			rows.extend( stream.feed( self.text[i:i + 13] ) )
+		rows.extend( stream.close( ) )
+		self.assertEqual( [row for key, row in rows if key == "torrents"], self.expected["torrents"] )
+		out = stream.result( )
+		self.assertEqual( out["torrents"], { row[0]: row for row in self.expected["torrents"] } )
+		self.assertEqual( out["torrentc"], self.expected["torrentc"] )
+
+
+class IterTorrentsTest( unittest.TestCase ):
+
+	def test_small_chunks( self ):
+		stream_action = Connection.stream_action
+
+		def small_chunks( connection, *args, **kwargs ):
+			for chunk in stream_action( connection, *args, **kwargs ):
+				for i in range( 0, len( chunk ), 7 ):
+					yield chunk[i:i + 7]
+
+		with MockServer( Population( torrents = 50, files = 1 ) ) as server:
+			ut = Connection( server.host, server.login, server.password ).utorrent( "falcon" )
+			expected = sorted( server.population.torrent_hash( i ) for i in range( 50 ) )
+			with mock.patch.object( Connection, "stream_action", small_chunks ):
+				self.assertEqual( sorted( t.hash_code for t in ut.iter_torrents( ) ), expected )
+				# the delta is applied to the cached rows
+				server.population.churn( 10 )
+				torrents = { t.hash_code: t for t in ut.iter_torrents( ) }
+			self.assertEqual( sorted( torrents ), expected )
+			self.assertEqual( { h: t.ul_speed for h, t in torrents.items( ) }, { h: t.ul_speed for h, t in ut.torrent_list( ).items( ) } )
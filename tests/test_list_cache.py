@@ -0,0 +1,221 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import utorrent
+import utorrent.cache
+import utorrent.changes
+import utorrent.retry
+import utorrent.uTorrent
+from utorrent.connection import Connection
+from utorrent.instrument import Instrumentation
+from utorrent.mock_server import MockServer, Population
+
+HASHES = ["{:040X}".format( i ) for i in range( 1, 4 )]
+
+
+def _row( hsh, name, ul_speed = 0 ):
+	return [hsh, 201, name, 1024, 1000, 1024, 0, 0, ul_speed, 0, 0, "", 0, 0, 0, 0, 65536, -1, 0]
+
+
+class ScriptedConnection:
+	"""
+	Connection answering the list requests with the prepared responses, the list params of the requests are recorded.
+	"""
+
+	def __init__( self, cache, responses ):
+		self.cache = cache
+		self.responses = list( responses )
+		self.params = []
+		self.instrumentation = Instrumentation( )
+
+	def do_action( self, action, params = None, **kwargs ):
+		self.params.append( params )
+		out = self.responses.pop( 0 )
+		if isinstance( out, Exception ):
+			raise out
+		return out
+
+
+def _full_list( cid, rows ):
+	return { "build": 1, "label": [], "torrents": rows, "rssfeeds": [], "rssfilters": [], "torrentc": cid }
+
+
+def _delta( cid, changed = ( ), removed = ( ) ):
+	return { "build": 1, "label": [], "torrentp": list( changed ), "torrentm": list( removed ), "rssfeedp": [], "rssfeedm": [], "rssfilterp": [],
+	         "rssfilterm": [], "torrentc": cid }
+
+
+class ListSnapshotRestoreTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.cache_dir = tempfile.mkdtemp( )
+		self.cache = utorrent.cache.HostCache( self.cache_dir, "http_127.0.0.1_8080", "admin" )
+		first = ScriptedConnection( self.cache, [_full_list( "1", [_row( h, "T" + h[-1] ) for h in HASHES] )] )
+		ut = utorrent.uTorrent.Desktop( first )
+		ut.torrent_list( )
+		ut.save_list_cache( )
+
+	def tearDown( self ):
+		shutil.rmtree( self.cache_dir )
+
+	def test_delta_from_the_snapshot( self ):
+		connection = ScriptedConnection( self.cache, [_delta( "2", [_row( HASHES[0], "T1", 100 )], [HASHES[2]] )] )
+		ut = utorrent.uTorrent.Desktop( connection )
+		torrents = ut.torrent_list( )
+		self.assertEqual( connection.params, [{ "cid": "1" }] )
+		self.assertEqual( sorted( torrents ), HASHES[:2] )
+		self.assertEqual( torrents[HASHES[0]].ul_speed, 100 )
+		ut.save_list_cache( )
+		# the delta is saved too
+		connection = ScriptedConnection( self.cache, [_delta( "2" )] )
+		self.assertEqual( sorted( utorrent.uTorrent.Desktop( connection ).torrent_list( ) ), HASHES[:2] )
+		self.assertEqual( connection.params, [{ "cid": "2" }] )
+
+	def test_rejected_cid( self ):
+		connection = ScriptedConnection( self.cache, [utorrent.uTorrentError( "invalid request" ), _full_list( "5", [_row( HASHES[1], "T2" )] )] )
+		self.assertEqual( list( utorrent.uTorrent.Desktop( connection ).torrent_list( ) ), [HASHES[1]] )
+		self.assertEqual( connection.params, [{ "cid": "1" }, None] )
+
+	def test_other_api( self ):
+		connection = ScriptedConnection( self.cache, [_full_list( "1", [] )] )
+		self.assertEqual( utorrent.uTorrent.Falcon( connection ).torrent_list( ), { } )
+		# rows of the other API aren't used
+		self.assertEqual( connection.params, [None] )
+
+
+class ListDeltaTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 5, files = 1 ) ).start( )
+		self.ut = Connection( self.server.host, self.server.login, self.server.password ).utorrent( "falcon" )
+		self.ut.torrent_list( )
+		# the torrent disappeared from the cache, but the server still tracks it as known to the client
+		self.removed = self.server.population.torrent_hash( 0 )
+		del self.ut._torrent_cache[self.removed]
+		self.server.population.remove( self.removed )
+
+	def tearDown( self ):
+		self.server.stop( )
+
+	def _hashes( self ):
+		return sorted( self.server.population.torrent_hash( i ) for i in range( 1, 5 ) )
+
+	def test_mismatch_gets_full_list( self ):
+		cache = dict( self.ut._torrent_cache )
+		self.assertRaises( utorrent.ListDeltaError, self.ut._update_list_cache, self.server.population.list( int( self.ut._list_cache_id ) ) )
+		# nothing is applied from the delta that doesn't match
+		self.assertEqual( self.ut._torrent_cache, cache )
+		self.assertEqual( sorted( self.ut.torrent_list( ) ), self._hashes( ) )
+
+	def test_mismatch_changes( self ):
+		self.assertRaises( utorrent.ListDeltaError, utorrent.changes.ListChanges( ).compare, self.ut,
+		                   self.server.population.list( int( self.ut._list_cache_id ) ) )
+		self.assertEqual( self.ut.torrent_changes( ).removed, [] )
+
+	def test_mismatch_iter_torrents( self ):
+		self.assertEqual( sorted( t.hash_code for t in self.ut.iter_torrents( ) ), self._hashes( ) )
+
+	def test_other_errors_are_raised( self ):
+		with mock.patch.object( utorrent.uTorrent.Falcon, "_update_list_cache", side_effect = KeyError( "bug" ) ):
+			self.assertRaises( KeyError, self.ut.torrent_list )
+
+	def _requests( self, error, call, method = "do_action" ):
+		# the first list request fails with the error, the rest go to the server
+		request = getattr( Connection, method )
+		errors = [error]
+
+		def fail_first( connection, action, *args, **kwargs ):
+			if errors:
+				raise errors.pop( )
+			return request( connection, action, *args, **kwargs )
+
+		with mock.patch.object( Connection, method, autospec = True, side_effect = fail_first ) as m:
+			try:
+				call( )
+			finally:
+				calls = m.call_count
+		return calls
+
+	def test_transport_errors_are_raised( self ):
+		self.ut.torrent_list( )
+		for error in ( utorrent.uTorrentError( "Connection refused" ), utorrent.uTorrentError( "Timeout after 3 tries" ),
+		               utorrent.retry.CircuitOpenError( "Circuit breaker is open", 1. ) ):
+			# the full list isn't requested after the delta failed
+			self.assertRaises( type( error ), self._requests, error, self.ut.torrent_list )
+			self.assertRaises( type( error ), self._requests, error, lambda: list( self.ut.iter_torrents( ) ), "stream_action" )
+			self.assertIsNotNone( self.ut._list_cache_id )
+
+	def test_rejected_cid_gets_full_list( self ):
+		self.ut.torrent_list( )
+		self.assertEqual( self._requests( utorrent.uTorrentError( "invalid request" ), self.ut.torrent_list ), 2 )
+		self.assertEqual( self._requests( utorrent.uTorrentError( "invalid request" ), lambda: list( self.ut.iter_torrents( ) ), "stream_action" ), 2 )
+
+
+class TorrentHashTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 3, files = 1 ) ).start( )
+
+	def tearDown( self ):
+		self.server.stop( )
+
+	def _utorrent( self ):
+		return Connection( self.server.host, self.server.login, self.server.password ).utorrent( "falcon" )
+
+	def test_malformed_hash( self ):
+		ut = self._utorrent( )
+		ut.torrent_list( )
+		cache = dict( ut._torrent_cache )
+		self.server.population.add( "not a hash", "Bad", [1] )
+		# in the delta
+		self.assertRaises( utorrent.uTorrentError, ut.torrent_list )
+		self.assertEqual( ut._torrent_cache, cache )
+		# in the full list
+		self.assertRaises( utorrent.uTorrentError, self._utorrent( ).torrent_list )
+		self.assertRaises( utorrent.uTorrentError, list, self._utorrent( ).iter_torrents( ) )
+
+
+class ListSnapshotTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.cache_dir = tempfile.mkdtemp( )
+		self.server = MockServer( Population( torrents = 50, files = 1 ) ).start( )
+
+	def tearDown( self ):
+		self.server.stop( )
+		shutil.rmtree( self.cache_dir )
+
+	def _utorrent( self ):
+		return Connection( self.server.host, self.server.login, self.server.password, cache_dir = self.cache_dir ).utorrent( "falcon" )
+
+	def _poll( self, ut, count ):
+		save = utorrent.cache.HostCache.save_compressed
+		with mock.patch.object( utorrent.cache.HostCache, "save_compressed", autospec = True, side_effect = save ) as save_compressed:
+			for i in range( count ):
+				self.server.population.churn( 5 )
+				ut.torrent_list( )
+		return save_compressed.call_count
+
+	def test_saved_at_the_end( self ):
+		ut = self._utorrent( )
+		# the whole list isn't written again for every delta
+		self.assertEqual( self._poll( ut, 5 ), 0 )
+		ut.save_list_cache( )
+		ut.save_list_cache( )
+		cid = ut._list_cache_id
+		self.assertEqual( len( [f for f in os.listdir( self.cache_dir ) if f.endswith( ".json.gz" )] ), 1 )
+
+		restored = self._utorrent( )
+		with mock.patch.object( Connection, "do_action", autospec = True, side_effect = Connection.do_action ) as do_action:
+			self.assertEqual( { h: t.ul_speed for h, t in restored.torrent_list( ).items( ) },
+			                  { h: t.ul_speed for h, t in ut.torrent_list( ).items( ) } )
+		# the restored list is updated with the delta
+		self.assertEqual( do_action.call_args_list[0][1]["params"], { "cid": cid } )
+
+	def test_interval( self ):
+		ut = self._utorrent( )
+		ut.list_snapshot_interval = 0
+		self.assertEqual( self._poll( ut, 3 ), 2 )
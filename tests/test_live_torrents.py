@@ -0,0 +1,56 @@
+import random
+import unittest
+
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+
+
+class LiveTorrentsTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 50, files = 1 ) ).start( )
+		self.population = self.server.population
+		self.ut = Connection( self.server.host, self.server.login, self.server.password ).utorrent( "falcon" )
+
+	def tearDown( self ):
+		self.server.stop( )
+
+	def _rows( self ):
+		return { row[0]: row for row in self.population.list( )["torrents"] }
+
+	def test_updated_in_place( self ):
+		self.ut.live_torrents = True
+		first = self.ut.torrent_list( )
+		uploaded = { hsh: t.uploaded for hsh, t in first.items( ) }
+		removed = self.population.torrent_hash( 0 )
+		labeled = self.population.torrent_hash( 1 )
+		self.population.churn( 20, random.Random( 1 ) )
+		self.population.set_prop( labeled, "label", "changed" )
+		self.population.remove( removed )
+		self.population.add( "F" * 40, "added", [100] )
+		second = self.ut.torrent_list( )
+
+		rows = self._rows( )
+		self.assertEqual( sorted( second ), sorted( rows ) )
+		self.assertNotIn( removed, second )
+		self.assertEqual( second["F" * 40].name, "added" )
+		for hsh, torrent in second.items( ):
+			if hsh in first:
+				# surviving torrents are the same objects
+				self.assertIs( torrent, first[hsh] )
+			row = rows[hsh]
+			self.assertEqual( ( torrent.uploaded, torrent.ul_speed, torrent.ratio, torrent.label ),
+			                  ( row[6], row[8], row[7] / 1000, row[11] ) )
+		self.assertEqual( second[labeled].label, "changed" )
+		self.assertGreater( sum( 1 for hsh, t in second.items( ) if hsh in uploaded and t.uploaded != uploaded[hsh] ), 0 )
+
+	def test_disabled( self ):
+		first = self.ut.torrent_list( )
+		second = self.ut.torrent_list( )
+		hsh = self.population.torrent_hash( 0 )
+		self.assertIsNot( first[hsh], second[hsh] )
+		self.ut.live_torrents = True
+		live = self.ut.torrent_list( )
+		self.assertIs( self.ut.torrent_list( )[hsh], live[hsh] )
+		self.ut.live_torrents = False
+		self.assertIsNot( self.ut.torrent_list( )[hsh], live[hsh] )
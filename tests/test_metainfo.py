@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import utorrent
+import utorrent.uTorrent
+from utorrent.connection import Connection
+from utorrent.metainfo import TorrentMetainfo
+from utorrent.mock_server import MockServer, Population
+
+META = {
+	"announce": "http://tracker.example.com/announce",
+	"comment": "test",
+	"info": {
+		"name": "test",
+		"piece length": 16384,
+		"pieces": b"\x01" * 20 * 3,
+		"files": [{ "length": 10, "path": ["a", "b.bin"] }, { "length": 20, "path": ["c.bin"] }],
+	},
+}
+
+
+class TorrentMetainfoTest( unittest.TestCase ):
+
+	def setUp( self ):
+		fd, self.filename = tempfile.mkstemp( suffix = ".torrent" )
+		with os.fdopen( fd, "wb" ) as f:
+			f.write( utorrent.bencode( META ) )
+
+	def tearDown( self ):
+		os.remove( self.filename )
+
+	def test_values( self ):
+		with TorrentMetainfo.open( self.filename ) as meta:
+			self.assertEqual( meta.name, "test" )
+			self.assertEqual( meta.files, [( "a/b.bin", 10 ), ( "c.bin", 20 )] )
+			self.assertEqual( meta.size, 30 )
+			self.assertEqual( meta.piece_count, 3 )
+			self.assertEqual( meta.trackers, ["http://tracker.example.com/announce"] )
+			self.assertEqual( meta.info_hash, utorrent.info_hash( utorrent.bencode( META ) ) )
+
+	def test_info_hash_v2( self ):
+		self.assertIsNone( TorrentMetainfo( utorrent.bencode( META ) ).info_hash_v2 )
+		info = dict( META["info"], **{ "meta version": 2, "file tree": { "c.bin": { "": { "length": 20 } } } } )
+		data = utorrent.bencode( dict( META, info = info ) )
+		meta = TorrentMetainfo( data )
+		self.assertTrue( meta.is_v2 )
+		self.assertEqual( meta.info_hash, utorrent.info_hash( data ) )
+		self.assertEqual( meta.info_hash_v2, utorrent.info_hash( data, 2 ) )
+		self.assertEqual( len( meta.info_hash_v2 ), 64 )
+
+	def test_invalid_utf8( self ):
+		info = dict( META["info"], files = [{ "length": 10, "path": ["a", b"b\xff.bin"] }], name = b"t\xffst" )
+		meta = TorrentMetainfo( utorrent.bencode( dict( META, info = info, announce = b"http://tracker.example.com/\xff" ) ) )
+		self.assertEqual( meta.name, "t\ufffdst" )
+		self.assertEqual( meta.files, [( "a/b\ufffd.bin", 10 )] )
+		self.assertEqual( meta.trackers, ["http://tracker.example.com/\ufffd"] )
+		del info["files"]
+		info["length"] = 10
+		self.assertEqual( TorrentMetainfo( utorrent.bencode( dict( META, info = info ) ) ).files, [( "t\ufffdst", 10 )] )
+
+	def test_v2_binary_keys( self ):
+		layer = b"\xfe" * 32
+		tree = { "a": { b"b\xff.bin": { "": { "length": 10, "pieces root": layer } }, "c.bin": { "": { "length": 20 } } } }
+		info = dict( META["info"], **{ "meta version": 2, "file tree": tree } )
+		del info["files"]
+		meta = TorrentMetainfo( utorrent.bencode( dict( META, info = info, **{ "piece layers": { layer: b"\xff" * 64 } } ) ) )
+		# piece layers are keyed by the raw hashes
+		self.assertEqual( meta.get( "piece layers" ), { layer: b"\xff" * 64 } )
+		self.assertEqual( meta.files, [( "a/b\ufffd.bin", 10 ), ( "a/c.bin", 20 )] )
+
+	def test_not_torrent( self ):
+		self.assertRaises( ValueError, TorrentMetainfo, b"d4:infoi1" )
+		self.assertRaises( ValueError, TorrentMetainfo, b"d3:fooi1ee" )
+		self.assertRaises( ValueError, TorrentMetainfo, b"" )
+		with open( self.filename, "wb" ) as f:
+			f.write( b"d3:fooi1ee" )
+		self.assertRaises( ValueError, TorrentMetainfo.open, self.filename )
+
+	def test_failed_upload_keeps_error( self ):
+		server = MockServer( Population( torrents = 1, files = 1 ) ).start( )
+		try:
+			ut = Connection( server.host, server.login, server.password ).utorrent( "falcon" )
+			with mock.patch.object( Connection, "_make_request", side_effect = utorrent.uTorrentError( "mid-request" ) ):
+				# the mmap of the file used to fail to close with BufferError, hiding the error of the request
+				with self.assertRaisesRegex( utorrent.uTorrentError, "mid-request" ):
+					ut.torrent_add_file( self.filename )
+			self.assertEqual( ut.torrent_add_file( self.filename ), utorrent.info_hash( utorrent.bencode( META ) ) )
+		finally:
+			server.stop( )
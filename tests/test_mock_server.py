@@ -0,0 +1,75 @@
+import random
+import unittest
+
+import utorrent
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+
+
+class PopulationTest( unittest.TestCase ):
+
+	def test_seed( self ):
+		first = Population( torrents = 20, seed = 1 ).list( )
+		self.assertEqual( first, Population( torrents = 20, seed = 1 ).list( ) )
+		self.assertNotEqual( first["torrents"], Population( torrents = 20, seed = 2 ).list( )["torrents"] )
+
+	def test_row_format( self ):
+		for api, length in ( ( "desktop", 19 ), ( "falcon", 27 ), ( "linux", 27 ) ):
+			rows = Population( torrents = 2, api = api ).list( )["torrents"]
+			self.assertEqual( [len( row ) for row in rows], [length, length] )
+		self.assertRaises( utorrent.uTorrentError, Population, api = "other" )
+
+	def test_delta( self ):
+		population = Population( torrents = 50, feeds = 1, filters = 1 )
+		full = population.list( )
+		self.assertEqual( len( full["torrents"] ), 50 )
+		cid = int( full["torrentc"] )
+		population.churn( 5, random.Random( 0 ) )
+		population.remove( population.torrent_hash( 0 ) )
+		delta = population.list( cid )
+		self.assertNotIn( "torrents", delta )
+		self.assertEqual( delta["torrentm"], [population.torrent_hash( 0 )] )
+		self.assertLessEqual( len( delta["torrentp"] ), 5 )
+		self.assertEqual( ( delta["rssfeedp"], delta["rssfilterp"] ), ( [], [] ) )
+		population.forget_cids( )
+		self.assertEqual( len( population.list( int( delta["torrentc"] ) )["torrents"] ), 49 )
+
+	def test_files( self ):
+		population = Population( torrents = 2, files = 5 )
+		hsh = population.torrent_hash( 1 )
+		files = population.files( hsh )
+		self.assertEqual( len( files ), 5 )
+		self.assertEqual( files, population.files( hsh ) )
+		self.assertIsNone( population.files( "0" * 40 ) )
+
+
+class MockServerTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 10, files = 3 ) ).start( )
+		self.addCleanup( self.server.stop )
+
+	def _utorrent( self, api = None ):
+		return Connection( self.server.host, self.server.login, self.server.password ).utorrent( api )
+
+	def test_autodetect( self ):
+		self.assertIsInstance( self._utorrent( ), utorrent.uTorrent.Falcon )
+
+	def test_lists( self ):
+		ut = self._utorrent( "falcon" )
+		torrents = ut.torrent_list( )
+		self.assertEqual( len( torrents ), 10 )
+		hsh = self.server.population.torrent_hash( 3 )
+		self.assertEqual( len( ut.file_list( hsh )[hsh] ), 3 )
+		self.assertEqual( list( ut.torrent_info( hsh ) ), [hsh] )
+		self.assertEqual( len( ut.torrent_list( ) ), 10 )
+
+	def test_stop( self ):
+		ut = self._utorrent( "falcon" )
+		hsh = self.server.population.torrent_hash( 0 )
+		ut.torrent_stop( hsh )
+		self.assertFalse( ut.torrent_list( )[hsh].status.started )
+
+	def test_wrong_password( self ):
+		with self.assertRaises( utorrent.uTorrentError ):
+			Connection( self.server.host, self.server.login, "wrong" ).utorrent( "falcon" )
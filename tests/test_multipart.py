@@ -0,0 +1,97 @@
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import utorrent
+import utorrent.multipart
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+from utorrent.multipart import MultipartUpload
+
+TORRENT = utorrent.bencode( { "announce": "http://tracker/ann", "info": { "name": "Big Torrent", "length": 1 << 40, "piece length": 1 << 22,
+                                                                       "pieces": bytes( range( 256 ) ) * 4000 } } )
+
+
+def _baseline_body( boundary, filename, data ):
+	# multipart body as it was built in memory before it was streamed
+	return "\r\n".join( (
+	"--" + boundary, 'Content-Disposition: form-data; name="torrent_file"; filename="{}"'.format( utorrent._url_quote( filename ) ),
+	"Content-Type: application/x-bittorrent", "", data.decode( "latin1" ), "--" + boundary, "",
+	) ).encode( "latin1" )
+
+
+class MultipartUploadTest( unittest.TestCase ):
+
+	def _upload( self, payload, filename = "some file [1].torrent" ):
+		with mock.patch.object( utorrent.multipart.os, "urandom", return_value = b"\x5a" * 16 ):
+			return MultipartUpload( "torrent_file", filename, payload, "application/x-bittorrent" )
+
+	def test_baseline_body( self ):
+		for filename in ( "default.torrent", "some file [1].torrent", "жé.torrent" ):
+			with self._upload( TORRENT, filename ) as upload:
+				self.assertEqual( upload.boundary, "----utorrentctl" + "5a" * 16 )
+				self.assertEqual( upload.content_type, "multipart/form-data; boundary=----utorrentctl" + "5a" * 16 )
+				body = b"".join( upload )
+				self.assertEqual( body, _baseline_body( upload.boundary, filename, TORRENT ) )
+				self.assertEqual( len( upload ), len( body ) )
+				# retried request sends the same body
+				self.assertEqual( b"".join( upload ), body )
+
+	def test_empty_payload( self ):
+		with self._upload( b"" ) as upload:
+			self.assertEqual( b"".join( upload ), _baseline_body( upload.boundary, "some file [1].torrent", b"" ) )
+			self.assertEqual( len( upload ), len( b"".join( upload ) ) )
+
+	def test_payload_chunks( self ):
+		m = mmap.mmap( -1, len( TORRENT ) )
+		try:
+			m.write( TORRENT )
+			with self._upload( m ) as upload:
+				parts = list( upload )
+				payload = parts[1:-1]
+				self.assertEqual( len( payload ), -( -len( TORRENT ) // upload.chunk_size ) )
+				for part in payload:
+					self.assertIsInstance( part, memoryview )
+					self.assertLessEqual( len( part ), upload.chunk_size )
+					# views of the mapping, nothing is copied
+					self.assertIs( part.obj, m )
+				self.assertEqual( b"".join( payload ), TORRENT )
+				del parts, payload, part
+		finally:
+			m.close( )
+
+
+class UploadTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 1, files = 1 ) ).start( )
+		self.ut = Connection( self.server.host, self.server.login, self.server.password ).utorrent( "falcon" )
+		self.tmp = tempfile.mkdtemp( )
+
+	def tearDown( self ):
+		self.server.stop( )
+		shutil.rmtree( self.tmp )
+
+	def test_add_file( self ):
+		filename = os.path.join( self.tmp, "big.torrent" )
+		with open( filename, "wb" ) as f:
+			f.write( TORRENT )
+		hsh = utorrent.info_hash( TORRENT )
+		lengths = []
+		send = Connection._send_request
+
+		def send_request( connection, conn, loc, headers, data, record ):
+			if data is not None:
+				lengths.append( ( int( headers["Content-Length"] ), sum( map( len, data ) ) ) )
+			return send( connection, conn, loc, headers, data, record )
+
+		with mock.patch.object( Connection, "_send_request", autospec = True, side_effect = send_request ):
+			self.assertEqual( self.ut.torrent_add_file( filename ), hsh )
+		self.assertEqual( len( lengths ), 1 )
+		self.assertEqual( lengths[0][0], lengths[0][1] )
+		self.assertGreater( lengths[0][0], len( TORRENT ) )
+		self.assertIn( hsh, self.ut.torrent_list( ) )
+		self.assertEqual( self.ut.torrent_list( )[hsh].name, "Big Torrent" )
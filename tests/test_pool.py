@@ -0,0 +1,115 @@
+import threading
+import unittest
+
+import utorrent
+from tests.webui import WebUI
+from utorrent.connection import Connection, ConnectionPool
+from utorrent.mock_server import MockServer, Population
+
+
+class CountingPool( ConnectionPool ):
+	"""
+	Pool recording the largest number of the connections handed out at the same time and the number of the created ones.
+	"""
+
+	def __init__( self, factory, size = 1 ):
+		self.lock = threading.Lock( )
+		self.in_use = self.max_in_use = self.created = 0
+
+		def create( ):
+			with self.lock:
+				self.created += 1
+			return factory( )
+
+		ConnectionPool.__init__( self, create, size )
+
+	def acquire( self, timeout = None ):
+		conn = ConnectionPool.acquire( self, timeout )
+		with self.lock:
+			self.in_use += 1
+			self.max_in_use = max( self.max_in_use, self.in_use )
+		return conn
+
+	def release( self, conn ):
+		with self.lock:
+			self.in_use -= 1
+		ConnectionPool.release( self, conn )
+
+
+class ConnectionPoolTest( unittest.TestCase ):
+
+	def test_threads_share_the_pool( self ):
+		threads_count, size = 8, 3
+		with WebUI( ) as webui:
+			connection = Connection( webui.host, "admin", "", keep_alive = True, pool_size = size )
+			connection._pool = pool = CountingPool( connection._create_connection, size )
+			errors = []
+			results = []
+			start = threading.Barrier( threads_count )
+
+			def run( ):
+				start.wait( )
+				try:
+					for j in range( 20 ):
+						results.append( connection.do_action( "getsettings" ) )
+				except Exception as e:
+					errors.append( e )
+
+			threads = [threading.Thread( target = run ) for i in range( threads_count )]
+			for t in threads:
+				t.start( )
+			for t in threads:
+				t.join( )
+			connection.close( )
+
+			self.assertEqual( errors, [] )
+			self.assertEqual( results, [WebUI.response] * threads_count * 20 )
+			self.assertLessEqual( pool.max_in_use, size )
+			self.assertLessEqual( pool.created, size )
+			self.assertEqual( pool.in_use, 0 )
+			# the token connection and at most one per slot of the pool
+			self.assertLessEqual( webui.connection_count, size + 1 )
+
+	def test_concurrent_requests( self ):
+		threads_count, size = 8, 3
+		with MockServer( Population( torrents = threads_count, files = 5 ), latency = 0.01 ) as server:
+			connection = Connection( server.host, server.login, server.password, keep_alive = True, pool_size = size )
+			connection._pool = pool = CountingPool( connection._create_connection, size )
+			ut = connection.utorrent( "falcon" )
+			errors = []
+			results = { }
+
+			def run( i ):
+				hsh = server.population.torrent_hash( i )
+				try:
+					for j in range( 5 ):
+						files = ut.file_list( hsh )
+						results.setdefault( hsh, [] ).append( [f.name for f in files[hsh]] )
+						ut.torrent_stop( hsh )
+				except Exception as e:
+					errors.append( e )
+
+			threads = [threading.Thread( target = run, args = ( i, ) ) for i in range( threads_count )]
+			for t in threads:
+				t.start( )
+			for t in threads:
+				t.join( )
+			connection.close( )
+
+			self.assertEqual( errors, [] )
+			for i in range( threads_count ):
+				hsh = server.population.torrent_hash( i )
+				# every thread got the files of its own torrent
+				self.assertEqual( results[hsh], [[f[0] for f in server.population.files( hsh )]] * 5 )
+			self.assertGreater( pool.max_in_use, 1 )
+			self.assertLessEqual( pool.max_in_use, size )
+			self.assertLessEqual( pool.created, size )
+			self.assertEqual( pool.in_use, 0 )
+
+	def test_bound( self ):
+		pool = ConnectionPool( object, 2 )
+		first, second = pool.acquire( ), pool.acquire( )
+		self.assertRaises( utorrent.uTorrentError, pool.acquire, 0.05 )
+		pool.release( first )
+		self.assertIs( pool.acquire( 0.05 ), first )
+		pool.release( second )
@@ -0,0 +1,98 @@
+import unittest
+from unittest import mock
+
+import utorrent
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+from utorrent.query import Query, torrent_state
+
+QUERIES = (
+	"label = tv",
+	"label = tv or label = music",
+	"not label = tv",
+	"status = seeding",
+	"status = paused or status = downloading",
+	"flag = started and ratio > 1",
+	"status = queued or flag = paused",
+	"eta = -1 and not status = stopped",
+	"name ~ flac",
+	"name ~ Torrent.00001",
+	"name ~ 72",
+	"label = tv and name ~ 720p",
+	"hash_code ^= a",
+	"hash_code ^= 0 or label = books",
+	"size >= 2GiB and (label = linux or name ~ x64)",
+)
+
+
+class QueryPushdownTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 300, files = 1 ) ).start( )
+		self.ut = Connection( self.server.host, self.server.login, self.server.password ).utorrent( "falcon" )
+
+	def tearDown( self ):
+		self.server.stop( )
+
+	def _scanned( self, where ):
+		# without the indexes the whole condition is evaluated over all the rows
+		with mock.patch.object( Query, "_candidates", return_value = None ):
+			return self.ut._select_hashes( where )
+
+	def assertPushdownMatches( self ):
+		for where in QUERIES:
+			hashes = self.ut.torrent_hashes( where )
+			self.assertEqual( hashes, self._scanned( where ), where )
+			self.assertEqual( sorted( row[0] for row in self.ut._select_rows( Query( where ) ) ), hashes, where )
+
+	def test_pushdown( self ):
+		# the name index is built on the second lookup
+		self.assertPushdownMatches( )
+		self.assertPushdownMatches( )
+		self.assertGreater( len( self.ut.torrent_hashes( "label = tv" ) ), 0 )
+
+	def test_index_follows_changes( self ):
+		self.assertPushdownMatches( )
+		self.assertPushdownMatches( )
+		population = self.server.population
+		population.churn( 50 )
+		for i in range( 10 ):
+			population.set_prop( population.torrent_hash( i ), "label", "tv" if i % 2 else "" )
+		population.remove( population.torrent_hash( 20 ) )
+		population.add( "A" * 40, "Added.Torrent.FLAC", [1 << 31] )
+		self.assertPushdownMatches( )
+		index = self.ut.torrent_index( )
+		self.assertIn( "A" * 40, index.name_contains( "added.tor" ) )
+		self.assertNotIn( population.torrent_hash( 20 ), index )
+		self.assertEqual( len( index ), 300 )
+
+	def test_status_is_state( self ):
+		# queued, forced and paused variants of every state
+		statuses = ( 200, 201, 137, 136, 233, 169, 130, 152, 0 )
+		self.ut.torrent_hashes( )
+		for i, row in enumerate( self.ut._torrent_cache.values( ) ):
+			row[1] = statuses[i % len( statuses )]
+		self.ut._torrent_index = None
+		for state in ( "queued", "paused", "seeding", "downloading", "checking", "error", "stopped", "finished", "not loaded" ):
+			expected = sorted( row[0] for row in self.ut._torrent_cache.values( ) if torrent_state( row[1], row[4] / 10 ) == state )
+			self.assertGreater( len( expected ), 0, state )
+			self.assertEqual( self.ut.torrent_hashes( 'status = "{}"'.format( state ) ), expected, state )
+			self.assertEqual( sorted( row[0] for row in self.ut._select_rows( Query( 'status = "{}"'.format( state ) ) ) ), expected, state )
+		# queued bit is set for the seeding and downloading torrents too
+		self.assertGreater( len( self.ut.torrent_hashes( "flag = queued" ) ), len( self.ut.torrent_hashes( "status = queued" ) ) )
+		self.assertEqual( self.ut.torrent_hashes( "flag = queued" ),
+		                  sorted( row[0] for row in self.ut._torrent_cache.values( ) if row[1] & 64 ) )
+
+	def test_invalid_status( self ):
+		for where in ( "status = started", "flag = seeding", "status > paused", "flag ~ paused" ):
+			self.assertRaises( utorrent.uTorrentError, self.ut.torrent_hashes, where )
+
+	def test_negative_value( self ):
+		self.assertEqual( self.ut.torrent_hashes( "eta = -1" ), sorted( row[0] for row in self.ut._torrent_cache.values( ) if row[10] == -1 ) )
+		self.assertGreater( len( self.ut.torrent_hashes( "eta = -1" ) ), 0 )
+
+	def test_select_keeps_list_order( self ):
+		self.ut.torrent_hashes( )
+		for where in ( "label = tv", "label = tv or label = music", "hash_code ^= a" ):
+			order = [row[0] for row in self.ut._select_rows( Query( where ) )]
+			self.assertEqual( order, [h for h in self.ut._torrent_cache if h in set( order )], where )
@@ -0,0 +1,166 @@
+import http.client
+import time
+import unittest
+
+import utorrent
+import utorrent.retry
+from tests.webui import WebUI
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+from utorrent.retry import CircuitBreaker, CircuitOpenError, RetryBudget, RetryPolicy, RetryRegistry
+
+FAST = RetryPolicy( max_retries = 10, base_delay = 0.001, max_delay = 0.005, timeout = 5. )
+
+
+class UnavailableServerTest( unittest.TestCase ):
+
+	def test_refused_connections_open_the_circuit( self ):
+		webui = WebUI( ).start( )
+		registry = RetryRegistry( )
+		connection = Connection( webui.host, "admin", "", retry_policy = RetryPolicy( max_retries = 1 ), retry_registry = registry )
+		webui.stop( )
+		for i in range( 5 ):
+			self.assertRaises( utorrent.uTorrentError, connection.do_action, "getsettings" )
+		self.assertEqual( connection.circuit_breaker.state, CircuitBreaker.OPEN )
+		# the server isn't contacted anymore, other connections to it share the breaker
+		self.assertRaises( CircuitOpenError, connection.do_action, "getsettings" )
+		self.assertIs( registry.for_host( connection._url )[0], connection.circuit_breaker )
+
+
+class RetryTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.server = MockServer( Population( torrents = 2, files = 1 ), seed = 1 ).start( )
+		self.hsh = self.server.population.torrent_hash( 0 )
+		# breaker state doesn't leak to the other tests
+		self.registry = RetryRegistry( )
+
+	def tearDown( self ):
+		self.server.stop( )
+		self.registry.clear( )
+
+	def _share( self, breaker, budget ):
+		"""
+		Makes the connections to the server use the breaker and the budget.
+		"""
+		self.registry.set( "http://{}/".format( self.server.host ), breaker, budget )
+
+	def _utorrent( self, retry_policy = FAST ):
+		# without keep-alive every attempt is a retry, stale reused connection would be reconnected first
+		return Connection( self.server.host, self.server.login, self.server.password, retry_policy = retry_policy,
+		                   retry_registry = self.registry ).utorrent( "falcon" )
+
+	def test_retried_after_drops( self ):
+		self._share( CircuitBreaker( 100 ), RetryBudget( 1, 100 ) )
+		ut = self._utorrent( )
+		self.server.drop_rate = 0.3
+		for i in range( 10 ):
+			self.assertEqual( len( ut.torrent_list( ) ), 2 )
+			ut.torrent_stop( self.hsh )
+		self.assertGreater( self.server.dropped_count, 0 )
+		self.assertEqual( sum( a.retries for a in ut.instrumentation.actions.values( ) ), self.server.dropped_count )
+
+	def test_budget_exhausted( self ):
+		self._share( CircuitBreaker( 100 ), RetryBudget( 0.5, 2 ) )
+		ut = self._utorrent( )
+		self.server.drop_rate = 1.
+		requests = self.server.request_count
+		with self.assertRaisesRegex( utorrent.uTorrentError, "Retry budget exhausted" ):
+			ut.torrent_stop( self.hsh )
+		# the first attempt and the two saved up retries
+		self.assertEqual( self.server.request_count - requests, 3 )
+		with self.assertRaisesRegex( utorrent.uTorrentError, "Retry budget exhausted" ):
+			ut.torrent_stop( self.hsh )
+		self.assertEqual( self.server.request_count - requests, 4 )
+		# successful requests earn the retries back
+		self.server.drop_rate = 0.
+		ut.torrent_stop( self.hsh )
+		ut.torrent_stop( self.hsh )
+		self.assertEqual( ut._connection.retry_budget.tokens, 1. )
+
+	def test_breaker_per_host( self ):
+		breaker = CircuitBreaker( 2, 0.05 )
+		self._share( breaker, RetryBudget( ) )
+		ut = self._utorrent( RetryPolicy( max_retries = 1 ) )
+		other_ut = self._utorrent( )
+		self.assertIs( ut._connection.circuit_breaker, other_ut._connection.circuit_breaker )
+		with MockServer( Population( torrents = 1, files = 1 ) ) as healthy:
+			healthy_ut = Connection( healthy.host, healthy.login, healthy.password, retry_registry = self.registry ).utorrent( "falcon" )
+			self.assertIsNot( healthy_ut._connection.circuit_breaker, breaker )
+
+			self.server.drop_rate = 1.
+			for i in range( 2 ):
+				# the error of the last attempt is raised as it is
+				self.assertRaises( ( utorrent.uTorrentError, http.client.HTTPException ), ut.torrent_stop, self.hsh )
+			self.assertEqual( breaker.state, CircuitBreaker.OPEN )
+			# the other connection to the host doesn't even try, the other host isn't affected
+			requests = self.server.request_count
+			self.assertRaises( CircuitOpenError, other_ut.torrent_stop, self.hsh )
+			self.assertEqual( self.server.request_count, requests )
+			healthy_ut.torrent_stop( healthy.population.torrent_hash( 0 ) )
+			self.assertEqual( healthy_ut._connection.circuit_breaker.state, CircuitBreaker.CLOSED )
+
+			# the probe after the timeout closes the circuit again
+			self.server.drop_rate = 0.
+			time.sleep( 0.06 )
+			other_ut.torrent_stop( self.hsh )
+			self.assertEqual( breaker.state, CircuitBreaker.CLOSED )
+
+	def test_registry( self ):
+		url = "http://{}/".format( self.server.host )
+		ut = self._utorrent( )
+		self.assertNotIn( url, utorrent.retry.registry )
+		self.assertIs( self.registry.for_host( url )[0], ut._connection.circuit_breaker )
+		# connections with the default registry don't share the state with the injected one
+		default_ut = Connection( self.server.host, self.server.login, self.server.password ).utorrent( "falcon" )
+		self.addCleanup( utorrent.retry.registry.drop, url )
+		self.assertIsNot( default_ut._connection.circuit_breaker, ut._connection.circuit_breaker )
+		self.assertIs( utorrent.retry.for_host( url )[0], default_ut._connection.circuit_breaker )
+		# dropped state isn't shared with the new connections
+		self.registry.drop( url )
+		self.assertNotIn( url, self.registry )
+		self.assertIsNot( self._utorrent( )._connection.circuit_breaker, ut._connection.circuit_breaker )
+		self.registry.clear( )
+		self.assertEqual( len( self.registry ), 0 )
+
+
+class CircuitBreakerTest( unittest.TestCase ):
+
+	def test_half_open( self ):
+		breaker = CircuitBreaker( 2, 0.05, 0.2 )
+		breaker.record_failure( )
+		self.assertTrue( breaker.allow( ) )
+		breaker.record_failure( )
+		self.assertEqual( breaker.state, CircuitBreaker.OPEN )
+		self.assertFalse( breaker.allow( ) )
+		self.assertRaises( CircuitOpenError, breaker.check )
+		time.sleep( 0.06 )
+		# only a single probe is let through
+		self.assertTrue( breaker.allow( ) )
+		self.assertEqual( breaker.state, CircuitBreaker.HALF_OPEN )
+		self.assertFalse( breaker.allow( ) )
+		# failed probe opens the circuit for twice as long
+		breaker.record_failure( )
+		self.assertEqual( breaker.state, CircuitBreaker.OPEN )
+		self.assertGreater( breaker.retry_after, 0.06 )
+		time.sleep( 0.11 )
+		self.assertTrue( breaker.allow( ) )
+		breaker.record_success( )
+		self.assertEqual( breaker.state, CircuitBreaker.CLOSED )
+		self.assertEqual( breaker.retry_after, 0. )
+
+	def test_budget( self ):
+		budget = RetryBudget( 0.5, 2 )
+		self.assertTrue( budget.withdraw( ) )
+		self.assertTrue( budget.withdraw( ) )
+		self.assertFalse( budget.withdraw( ) )
+		budget.deposit( )
+		self.assertFalse( budget.withdraw( ) )
+		budget.deposit( )
+		self.assertTrue( budget.withdraw( ) )
+
+	def test_delay( self ):
+		policy = RetryPolicy( base_delay = 0.5, max_delay = 2. )
+		for attempt, limit in ( ( 1, 0.5 ), ( 2, 1. ), ( 3, 2. ), ( 10, 2. ) ):
+			for i in range( 20 ):
+				self.assertTrue( 0 <= policy.delay( attempt ) <= limit )
@@ -0,0 +1,116 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+import utorrent.cache
+import utorrent.uTorrent
+from tests.webui import WebUI
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+
+
+class SessionCacheTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.cache_dir = os.path.join( tempfile.mkdtemp( ), "utorrentctl" )
+		self.webui = WebUI( ).start( )
+
+	def tearDown( self ):
+		self.webui.stop( )
+		shutil.rmtree( os.path.dirname( self.cache_dir ) )
+
+	def _connection( self ):
+		return Connection( self.webui.host, "admin", "", cache_dir = self.cache_dir )
+
+	def test_session_is_restored( self ):
+		self._connection( ).utorrent( )
+		self.assertEqual( len( self.webui.requests ), 2 )
+		# neither the token nor the version is asked for again
+		ut = self._connection( ).utorrent( )
+		self.assertIsInstance( ut, utorrent.uTorrent.Desktop )
+		self.assertEqual( ut.version( ).build, 1 )
+		self.assertEqual( len( self.webui.requests ), 2 )
+
+	def test_stale_token( self ):
+		self._connection( ).utorrent( )
+		self.webui.token += "0"
+		connection = self._connection( )
+		self.assertEqual( connection.do_action( "getsettings" ), WebUI.response )
+		# the token is fetched again once the action is rejected
+		self.assertEqual( len( [r for r in self.webui.requests if r.startswith( "/gui/token.html" )] ), 2 )
+		self.assertEqual( connection.cache.load( "session" )["token"], self.webui.token )
+
+	def test_private_files( self ):
+		self._connection( ).utorrent( )
+		self.assertEqual( stat.S_IMODE( os.stat( self.cache_dir ).st_mode ), 0o700 )
+		for name in os.listdir( self.cache_dir ):
+			self.assertEqual( stat.S_IMODE( os.stat( os.path.join( self.cache_dir, name ) ).st_mode ), 0o600 )
+
+
+class HostCacheTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.cache_dir = tempfile.mkdtemp( )
+
+	def tearDown( self ):
+		shutil.rmtree( self.cache_dir )
+
+	def test_documents( self ):
+		cache = utorrent.cache.HostCache( self.cache_dir, "http_127.0.0.1:8080", "admin" )
+		self.assertEqual( cache.key, "admin@http_127.0.0.1_8080" )
+		self.assertIsNone( cache.load( "session" ) )
+		cache.save( "session", { "token": "abc" } )
+		self.assertEqual( cache.load( "session" ), { "token": "abc" } )
+		# other login is a different session
+		self.assertIsNone( utorrent.cache.HostCache( self.cache_dir, "http_127.0.0.1:8080", "guest" ).load( "session" ) )
+		with open( cache.path( "session" ), "w" ) as f:
+			f.write( "{" )
+		self.assertIsNone( cache.load( "session" ) )
+		cache.remove( "session" )
+		self.assertEqual( os.listdir( self.cache_dir ), [] )
+
+
+class MockServerSessionCacheTest( unittest.TestCase ):
+
+	def setUp( self ):
+		self.cache_dir = os.path.join( tempfile.mkdtemp( ), "utorrentctl" )
+
+	def tearDown( self ):
+		shutil.rmtree( os.path.dirname( self.cache_dir ) )
+
+	def _connection( self, server ):
+		return Connection( server.host, server.login, server.password, cache_dir = self.cache_dir )
+
+	def _detect( self, server ):
+		"""
+		Returns API detected with the cached token and number of token requests it took.
+		"""
+		with mock.patch.object( Connection, "_fetch_token", autospec = True, side_effect = Connection._fetch_token ) as fetch_token:
+			connection = self._connection( server )
+			ut = connection.utorrent( )
+		return ut, fetch_token.call_count
+
+	def test_desktop_probe_keeps_token( self ):
+		with MockServer( Population( torrents = 1, files = 1, api = "desktop" ) ) as server:
+			# session with the token, but without detected API
+			self._connection( server ).utorrent( "desktop" )
+			ut, token_requests = self._detect( server )
+			self.assertIsInstance( ut, utorrent.uTorrent.Desktop )
+			self.assertNotIsInstance( ut, utorrent.uTorrent.Falcon )
+			# getversion is always rejected by the desktop client, it doesn't mean that the token is stale
+			self.assertEqual( token_requests, 0 )
+
+	def test_stale_token( self ):
+		with MockServer( Population( torrents = 1, files = 1, api = "linux" ) ) as server:
+			self._connection( server ).utorrent( "linux" )
+			session = utorrent.cache.HostCache( self.cache_dir, "http_" + server.host, server.login )
+			data = session.load( "session" )
+			data["token"] = "stale"
+			session.save( "session", data )
+			ut, token_requests = self._detect( server )
+			# getversion rejected because of the stale token is asked again with the new one
+			self.assertIsInstance( ut, utorrent.uTorrent.LinuxServer )
+			self.assertEqual( token_requests, 1 )
@@ -0,0 +1,95 @@
+import operator
+import unittest
+from unittest import mock
+
+import utorrent.table
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+
+FIELDS = ( "size", "ratio", "progress", "ul_speed", "name", "label" )
+
+
+class TorrentTableTest( unittest.TestCase ):
+	"""
+	Checks the table and torrent_top against plain sorting of torrent_list( ) without NumPy, see NumpyTorrentTableTest.
+	"""
+	numpy = None
+
+	def setUp( self ):
+		patcher = mock.patch.object( utorrent.table, "numpy", self.numpy )
+		patcher.start( )
+		self.addCleanup( patcher.stop )
+		self.server = MockServer( Population( torrents = 300, files = 1 ) ).start( )
+		self.ut = Connection( self.server.host, self.server.login, self.server.password ).utorrent( "falcon" )
+		self.torrents = list( self.ut.torrent_list( ).values( ) )
+
+	def tearDown( self ):
+		self.server.stop( )
+
+	def _sorted( self, field, desc, torrents = None ):
+		# ties are ordered by hash
+		out = sorted( self.torrents if torrents is None else torrents, key = operator.attrgetter( "hash_code" ) )
+		return sorted( out, key = operator.attrgetter( field ), reverse = desc )
+
+	def test_sort( self ):
+		table = self.ut.torrent_table( )
+		for field in FIELDS:
+			for desc in ( False, True ):
+				with self.subTest( field = field, desc = desc ):
+					expected = [t.hash_code for t in self._sorted( field, desc )]
+					rows = table.sort( [( field, desc ), "hash_code"] )
+					self.assertEqual( [t.hash_code for t in table.torrents( rows )], expected )
+					for count in ( 0, 1, 10, 300, 400 ):
+						rows = table.top( [( field, desc ), "hash_code"], count )
+						self.assertEqual( [t.hash_code for t in table.torrents( rows )], expected[:count] )
+					# single key, ties can come in any order
+					rows = table.top( [( field, desc )], 10 )
+					self.assertEqual( [getattr( t, field ) for t in table.torrents( rows )],
+					                  [getattr( t, field ) for t in self._sorted( field, desc )[:10]] )
+
+	def test_top( self ):
+		for field in FIELDS:
+			for desc in ( False, True ):
+				with self.subTest( field = field, desc = desc ):
+					top = self.ut.torrent_top( field, 10, desc )
+					self.assertEqual( [getattr( t, field ) for t in top], [getattr( t, field ) for t in self._sorted( field, desc )[:10]] )
+					top = self.ut.torrent_top( field, 5, desc, label = "tv", where = "ratio > 1" )
+					matching = [t for t in self.torrents if t.label == "tv" and t.ratio > 1]
+					self.assertEqual( [getattr( t, field ) for t in top], [getattr( t, field ) for t in self._sorted( field, desc, matching )[:5]] )
+					self.assertTrue( all( t.label == "tv" and t.ratio > 1 for t in top ) )
+
+	def test_group_sum( self ):
+		names = ( "size", "downloaded", "ul_speed" )
+		expected = { }
+		for t in self.torrents:
+			group = expected.setdefault( t.label, dict.fromkeys( names, 0 ) )
+			for name in names:
+				group[name] += getattr( t, name )
+		seeding = [t for t in self.torrents if t.progress == 100]
+		table = self.ut.torrent_table( )
+		self.assertEqual( table.group_sum( "label", names ), expected )
+		indices = table.mask( "progress", "=", 100 ).indices( )
+		self.assertEqual( table.sum( "size", indices ), sum( t.size for t in seeding ) )
+		self.assertEqual( table.sum( "size" ), sum( t.size for t in self.torrents ) )
+		ratios = table.group_sum( "label", ( "ratio", ) )
+		for label, group in ratios.items( ):
+			self.assertAlmostEqual( group["ratio"], sum( t.ratio for t in self.torrents if t.label == label ) )
+
+	def test_group_sum_is_exact( self ):
+		# sums above 2 ** 53 aren't exact in float64
+		size = 2 ** 53 + 1
+		for i in range( 3 ):
+			hsh = "{:040X}".format( i + 1 )
+			self.server.population.add( hsh, "Big.{}".format( i ), [size] )
+			self.server.population.set_prop( hsh, "label", "big" )
+		table = self.ut.torrent_table( )
+		self.assertEqual( table.group_sum( "label", ( "size", ) )["big"], { "size": 3 * size } )
+		self.assertEqual( table.sum( "size", table.mask( "label", "=", "big" ).indices( ) ), 3 * size )
+
+
+@unittest.skipIf( utorrent.table.numpy is None, "NumPy is not installed" )
+class NumpyTorrentTableTest( TorrentTableTest ):
+	"""
+	Same checks with NumPy.
+	"""
+	numpy = utorrent.table.numpy
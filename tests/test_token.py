@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import utorrent.aio
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+
+
+class TokenRefreshTest( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		cls.server = MockServer( Population( torrents = 3, files = 1 ) ).start( )
+
+	@classmethod
+	def tearDownClass( cls ):
+		cls.server.stop( )
+
+	def _expire_session( self ):
+		self.server.token += "0"
+		self.server.guid += "0"
+
+	def test_expired_token( self ):
+		ut = Connection( self.server.host, self.server.login, self.server.password ).utorrent( "falcon" )
+		ut.torrent_list( )
+		self._expire_session( )
+		with mock.patch.object( Connection, "_fetch_token", autospec = True, side_effect = Connection._fetch_token ) as fetch_token:
+			self.assertEqual( len( ut.torrent_list( ) ), 3 )
+			ut.torrent_stop( self.server.population.torrent_hash( 0 ) )
+		self.assertEqual( fetch_token.call_count, 1 )
+
+	def test_async_expired_token( self ):
+		async def run( ):
+			connection = utorrent.aio.AsyncConnection( self.server.host, self.server.login, self.server.password )
+			try:
+				ut = await connection.utorrent( "falcon" )
+				await ut.torrent_list( )
+				old_token = connection._token
+				self._expire_session( )
+				torrents = await ut.torrent_list( )
+				await ut.torrent_stop( self.server.population.torrent_hash( 0 ) )
+				return torrents, old_token, connection._token
+			finally:
+				await connection.close( )
+
+		torrents, old_token, token = asyncio.run( run( ) )
+		self.assertEqual( len( torrents ), 3 )
+		self.assertNotEqual( token, old_token )
+
+	def test_async_invalid_request_is_raised_once( self ):
+		async def run( ):
+			connection = utorrent.aio.AsyncConnection( self.server.host, self.server.login, self.server.password )
+			try:
+				ut = await connection.utorrent( "falcon" )
+				# unknown action is rejected with the fresh token too
+				await connection.do_action( "no-such-action" )
+			finally:
+				await connection.close( )
+
+		self.assertRaises( utorrent.uTorrentError, asyncio.run, run( ) )
@@ -0,0 +1,116 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import utorrent
+import utorrent.uTorrent
+import utorrent.file
+import utorrent.job_info
+import utorrent.torrent
+from utorrent.connection import Connection
+from utorrent.mock_server import MockServer, Population
+from utorrent.torrent import Torrent, Torrent_API2, _FormatArgs
+from utorrent.uTorrent import Falcon
+
+HASH = "0123456789ABCDEF0123456789ABCDEF01234567"
+ROW = [HASH, 201, "Some Torrent", 1 << 30, 500, 1 << 29, 1 << 28, 1500, 2048, 512, 3600, "tv", 3, 10, 5, 20, 65535, 1, 1 << 29]
+ROW_API2 = ROW + ["http://example.com/t", "", "Downloading 50.0 %", "", 1600000000, 0, "", "/data"]
+
+
+class TorrentFormatTest( unittest.TestCase ):
+
+	def test_default_format( self ):
+		self.assertEqual( Torrent( None, list( ROW ) ).verbose_str( ),
+		                  HASH + " Downloading      50.0%   1.00GiB                 2.00kiB/s 1.50   5/20    eta: 1h 0m   Some Torrent" + " " * 49 +
+		                  "(tv)" )
+
+	def test_default_format_api2( self ):
+		# status column is the status message of the server
+		self.assertEqual( Torrent_API2( None, list( ROW_API2 ) ).verbose_str( ),
+		                  HASH + " Downloading 50.0 %  50.0%   1.00GiB                 2.00kiB/s 1.50   5/20    eta: 1h 0m   Some Torrent" +
+		                  " " * 49 + "(tv)" )
+
+	def test_format_specs( self ):
+		torrent = Torrent( None, list( ROW ) )
+		self.assertEqual( torrent.verbose_str( "|{size}|{downloaded}|{dl_remain}|{availability}|{status}|" ),
+		                  "|  1.00GiB|512.00MiB|512.00MiB|  1.0|Downloading    |" )
+		# explicit spec replaces the default one
+		self.assertEqual( torrent.verbose_str( "{ratio:.1f} {progress:.0f}" ), "1.5 50" )
+
+	def test_format_specs_api2( self ):
+		torrent = Torrent_API2( None, list( ROW_API2 ) )
+		self.assertEqual( torrent.verbose_str( "{added_on}|{download_dir}|{status}" ),
+		                  "{}|/data{}|Downloading 50.0 %".format( datetime.fromtimestamp( 1600000000 ), " " * 15 ) )
+		# the specs of the API2 torrent don't change the ones of the desktop torrent
+		self.assertEqual( Torrent( None, list( ROW ) ).verbose_str( "{status}|" ), "Downloading    |" )
+
+	def test_format_args( self ):
+		args = _FormatArgs( Torrent( None, list( ROW ) ) )
+		self.assertEqual( args["peer_info"], "5/20" )
+		self.assertEqual( args["label"], "(tv)" )
+		# speeds below 1 kiB/s are not shown
+		self.assertEqual( args["dl_speed_h"], "" )
+		self.assertEqual( args["ul_speed_h"], "2.00kiB/s" )
+		self.assertEqual( args["name"], "Some Torrent" )
+		self.assertRaises( KeyError, args.__getitem__, "unknown" )
+
+		finished = list( ROW )
+		finished[4], finished[11], finished[18] = 1000, "", 0
+		args = _FormatArgs( Torrent( None, finished ) )
+		self.assertEqual( args["peer_info"], "3/10" )
+		self.assertEqual( args["label"], "" )
+		self.assertEqual( args["dl_remain_h"], "" )
+
+
+class TorrentAttributesTest( unittest.TestCase ):
+
+	def test_set_label( self ):
+		row = list( ROW )
+		torrent = Torrent( None, row )
+		torrent.label = "movies"
+		self.assertEqual( torrent.label, "movies" )
+		self.assertIn( "(movies)", torrent.verbose_str( ) )
+		# the row may be shared with the list cache, it's not changed
+		self.assertEqual( row[11], "tv" )
+		self.assertEqual( Torrent.get_public_attrs( ), ( "label", ) )
+
+	def test_set_without_row( self ):
+		torrent = Torrent_API2( None )
+		torrent.download_dir = "/data"
+		self.assertEqual( torrent.download_dir, "/data" )
+		self.assertEqual( Torrent_API2._empty_row[26], "" )
+
+	def test_extra_attributes( self ):
+		torrent = Torrent( None, list( ROW ) )
+		torrent.note = "mine"
+		self.assertEqual( torrent.note, "mine" )
+
+	def test_job_info( self ):
+		info = utorrent.job_info.JobInfo( None, HASH )
+		self.assertEqual( info.trackers, [] )
+		info.trackers = ["http://a/announce", "http://b/announce"]
+		info.ulrate = 1024
+		self.assertEqual( info.trackers, ["http://a/announce", "http://b/announce"] )
+		self.assertEqual( info.ulrate_h, "1.00kiB/s" )
+		self.assertEqual( utorrent.job_info.JobInfo._empty_row["ulrate"], 0 )
+
+	def test_file_hash_is_checked( self ):
+		with MockServer( Population( torrents = 1, files = 3 ) ) as server:
+			ut = Connection( server.host, server.login, server.password ).utorrent( "falcon" )
+			hsh = server.population.torrent_hash( 0 )
+			f = ut.file_list( [hsh] )[hsh][2]
+			self.assertEqual( f.file_hash, hsh + ".2" )
+			self.assertEqual( f.name, server.population.files( hsh )[2][0] )
+			with mock.patch.object( Falcon, "do_action", return_value = { "files": [hsh, [], "not a hash", [["a.bin", 100, 50, 2]]] } ):
+				self.assertRaises( utorrent.uTorrentError, ut.file_list, [hsh] )
+
+
+class TorrentRowTest( unittest.TestCase ):
+
+	def test_attributes_read_the_row( self ):
+		row = list( ROW )
+		torrent = Torrent( None, row )
+		self.assertEqual( ( torrent.hash_code, torrent.name, torrent.progress, torrent.ratio ), ( HASH, "Some Torrent", 50.0, 1.5 ) )
+		row[2] = "Renamed"
+		self.assertEqual( torrent.name, "Renamed" )
+		self.assertIn( "eta", Torrent.get_readonly_attrs( ) )
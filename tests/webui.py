@@ -0,0 +1,114 @@
+"""
+Minimal WebUI for the tests of the HTTP side of the connection: it serves the token page and answers every action with the same JSON
+object (or "invalid request" if the token doesn't match), counting the accepted connections and the requests.
+"""
+
+import http.server
+import json
+import socket
+import threading
+
+
+class _Handler( http.server.BaseHTTPRequestHandler ):
+	protocol_version = "HTTP/1.1"
+
+	def setup( self ):
+		http.server.BaseHTTPRequestHandler.setup( self )
+		# headers and body are written separately, Nagle's algorithm would delay the body until the client acknowledges the headers
+		self.request.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+		with self.server.webui.lock:
+			self.server.webui.connection_count += 1
+			self.server.webui.sockets.add( self.request )
+
+	def finish( self ):
+		with self.server.webui.lock:
+			self.server.webui.sockets.discard( self.request )
+		http.server.BaseHTTPRequestHandler.finish( self )
+
+	def do_GET( self ):
+		webui = self.server.webui
+		length = int( self.headers.get( "Content-Length", 0 ) )
+		if length > 0:
+			self.rfile.read( length )
+		with webui.lock:
+			webui.requests.append( self.path )
+		status = 200
+		if self.path.startswith( "/gui/token.html" ):
+			body = "<html><div id='token' style='display:none;'>{}</div></html>".format( webui.token ).encode( "utf8" )
+			content_type = "text/html"
+		elif "token={}&".format( webui.token ) not in self.path:
+			# that's how uTorrent answers to the stale token
+			status = 400
+			body = b"invalid request"
+			content_type = "text/plain"
+		else:
+			body = json.dumps( webui.response ).encode( "utf8" )
+			content_type = "text/plain"
+		self.send_response( status )
+		self.send_header( "Content-Type", content_type )
+		self.send_header( "Content-Length", str( len( body ) ) )
+		if not webui.keep_alive:
+			self.send_header( "Connection", "close" )
+			self.close_connection = True
+		self.end_headers( )
+		self.wfile.write( body )
+
+	do_POST = do_GET
+
+	def log_message( self, format, *args ):
+		pass
+
+
+class WebUI:
+	"""
+	Serves in the background thread until it's stopped, use as context manager or call start and stop.
+	"""
+	token = "stub-token"
+	response = { "build": 1 }
+
+	def __init__( self, keep_alive = True ):
+		"""
+		:param keep_alive: False makes the server close the connection after every response
+		"""
+		self.keep_alive = keep_alive
+		self.lock = threading.Lock( )
+		self.connection_count = 0
+		self.requests = []
+		self.sockets = set( )
+		self._server = http.server.ThreadingHTTPServer( ( "127.0.0.1", 0 ), _Handler )
+		self._server.daemon_threads = True
+		self._server.webui = self
+		self._thread = None
+
+	@property
+	def host( self ):
+		return "{}:{}".format( *self._server.server_address )
+
+	def start( self ):
+		self._thread = threading.Thread( target = self._server.serve_forever, args = ( 0.05, ), daemon = True )
+		self._thread.start( )
+		return self
+
+	def stop( self ):
+		self.drop_connections( )
+		self._server.shutdown( )
+		self._server.server_close( )
+		self._thread.join( )
+
+	def drop_connections( self ):
+		"""
+		Closes the open connections without telling the clients, like a server dropping idle keep-alive connections.
+		"""
+		with self.lock:
+			sockets = list( self.sockets )
+		for sock in sockets:
+			try:
+				sock.shutdown( socket.SHUT_RDWR )
+			except OSError:
+				pass
+
+	def __enter__( self ):
+		return self.start( )
+
+	def __exit__( self, exc_type, exc_val, exc_tb ):
+		self.stop( )
@@ -18,6 +18,8 @@ utorrent - uTorrent remote control library
 
 """
 
+import hashlib
+import itertools
 import re
 import urllib.parse
 
@@ -29,57 +31,210 @@ class uTorrentError( Exception ):
 	pass
 
 
+class ListDeltaError( uTorrentError ):
+	"""
+	Delta list response doesn't match the cached rows, e.g. it removes the torrent that is not cached
+	"""
+	pass
+
+
+def _bencoded_buffer( data ):
+	"""
+	Returns data as the buffer that can be searched and sliced. bytes, bytearray and mmap.mmap are used as they are, so is the object
+	behind the memoryview of the whole of it. Other memoryviews (e.g. slices) and iterables of ints are copied to bytes.
+	"""
+	if isinstance( data, memoryview ):
+		obj = data.obj
+		if hasattr( obj, "find" ) and data.c_contiguous and data.nbytes == len( obj ):
+			return obj
+		return data.tobytes( )
+	if not isinstance( data, ( bytes, bytearray ) ) and not hasattr( data, "find" ):
+		return bytes( data )
+	return data
+
+
+# key of the dictionary being decoded is not read yet
+_no_key = object( )
+
+
 def bdecode( data, str_encoding = "utf8" ):
 	"""
 	Decode binary string to object using bencode encoding.
 	http://en.wikipedia.org/wiki/Bencode
-	:type data: bytes
+	Strings that can't be decoded with str_encoding are returned as bytearray, dictionary keys as bytes (e.g. piece layers of BitTorrent v2
+	torrents are keyed by the raw hashes).
+	:param data: memoryview of part of the buffer and iterable of ints are copied first
+	:type data: bytes, bytearray, memoryview, mmap.mmap or iterable of ints
 	:type str_encoding: string
 	:rtype: None, list, object, string, dict
 	"""
-	if not hasattr( data, "__next__" ):
-		data = iter( data )
-	out = None
-	t = chr( next( data ) )
-	if t == "e": # end of list/dict
-		return None
-	elif t == "i": # integer
-		out = ""
-		c = chr( next( data ) )
-		while c != "e":
-			out += c
-			c = chr( next( data ) )
-		out = int( out )
-	elif t == "l": # list
-		out = []
+	data = _bencoded_buffer( data )
+	find = data.find
+	size = len( data )
+	# containers are decoded without recursion, the ones that are not finished yet are kept on the stack
+	stack = []
+	container = None
+	is_list = False
+	key = _no_key
+	pos = 0
+	try:
 		while True:
-			e = bdecode( data )
-			if e is None:
-				break
-			out.append( e )
-	elif t == "d": # dictionary
-		out = { }
+			c = data[pos]
+			if 0x30 <= c <= 0x39: # string
+				# lengths of dictionary keys and most of the strings are one or two digits
+				c2 = data[pos + 1]
+				if c2 == 0x3a:
+					start = pos + 2
+					pos = start + c - 0x30
+				elif data[pos + 2] == 0x3a and 0x30 <= c2 <= 0x39:
+					start = pos + 3
+					pos = start + ( c - 0x30 ) * 10 + c2 - 0x30
+				else:
+					colon = find( b":", pos + 1 )
+					if colon < 0:
+						raise ValueError( "Invalid bencoded data at {}".format( pos ) )
+					start = colon + 1
+					pos = start + int( data[pos:colon] )
+				if pos > size:
+					raise IndexError( pos )
+				value = data[start:pos]
+				try:
+					value = value.decode( str_encoding )
+				except UnicodeDecodeError:
+					value = bytearray( value )
+			elif c == 0x69: # integer
+				end = find( b"e", pos + 1 )
+				if end < 0:
+					raise IndexError( pos )
+				value = int( data[pos + 1:end] )
+				pos = end + 1
+			elif c == 0x6c or c == 0x64: # list or dictionary
+				stack.append( ( container, is_list, key ) )
+				is_list = c == 0x6c
+				container = [] if is_list else { }
+				key = _no_key
+				pos += 1
+				continue
+			elif c == 0x65: # end of list/dict
+				pos += 1
+				if container is None:
+					return None
+				value = container
+				container, is_list, key = stack.pop( )
+			else:
+				raise ValueError( "Invalid bencoded data at {}".format( pos ) )
+			if container is None:
+				return value
+			if is_list:
+				container.append( value )
+			elif key is _no_key:
+				# bytearray is not hashable
+				key = bytes( value ) if type( value ) is bytearray else value
+			else:
+				container[key] = value
+				key = _no_key
+	except IndexError:
+		raise ValueError( "Unexpected end of bencoded data" ) from None
+
+
+def bencoded_end( data, pos = 0 ):
+	"""
+	Returns offset right after the bencoded value that starts at pos, the value is skipped without decoding.
+	:type data: bytes, bytearray, mmap.mmap
+	:type pos: int
+	:rtype: int
+	"""
+	find = data.find
+	depth = 0
+	try:
 		while True:
-			k = bdecode( data )
-			if k is None:
-				break
-			out[k] = bdecode( data )
-	elif t.isdigit( ): # string
-		l = t
-		c = chr( next( data ) )
-		while c != ":":
-			l += c
-			c = chr( next( data ) )
-		bout = bytearray( )
-		for i in range( int( l ) ):
-			bout.append( next( data ) )
+			c = data[pos]
+			if 0x30 <= c <= 0x39: # string
+				c2 = data[pos + 1]
+				if c2 == 0x3a:
+					pos += 2 + c - 0x30
+				elif data[pos + 2] == 0x3a and 0x30 <= c2 <= 0x39:
+					pos += 3 + ( c - 0x30 ) * 10 + c2 - 0x30
+				else:
+					colon = find( b":", pos + 1 )
+					if colon < 0:
+						raise IndexError( pos )
+					pos = colon + 1 + int( data[pos:colon] )
+			elif c == 0x69: # integer
+				end = find( b"e", pos + 1 )
+				if end < 0:
+					raise IndexError( pos )
+				pos = end + 1
+			elif c == 0x6c or c == 0x64: # list or dictionary
+				depth += 1
+				pos += 1
+				continue
+			elif c == 0x65 and depth > 0: # end of list/dict
+				depth -= 1
+				pos += 1
+			else:
+				raise ValueError( "Invalid bencoded data at {}".format( pos ) )
+			if depth == 0:
+				if pos > len( data ):
+					raise IndexError( pos )
+				return pos
+	except IndexError:
+		raise ValueError( "Unexpected end of bencoded data" ) from None
+
+
+def bencoded_dict_spans( data, pos = 0 ):
+	"""
+	Returns offsets of the values of the bencoded dictionary that starts at pos, nothing is decoded except for the keys.
+	:type data: bytes, bytearray, mmap.mmap
+	:type pos: int
+	:return: key -> ( start, end ) of the value, the key is bytes if it isn't valid utf8
+	:rtype: dict
+	"""
+	if data[pos:pos + 1] != b"d":
+		raise ValueError( "Bencoded dictionary expected at {}".format( pos ) )
+	out = { }
+	pos += 1
+	while data[pos:pos + 1] != b"e":
+		if pos >= len( data ):
+			raise ValueError( "Unexpected end of bencoded data" )
+		colon = data.find( b":", pos )
+		if colon < 0 or not data[pos:colon].isdigit( ):
+			raise ValueError( "Invalid bencoded dictionary key at {}".format( pos ) )
+		start = colon + 1
+		pos = start + int( data[pos:colon] )
+		key = data[start:pos]
 		try:
-			out = bout.decode( str_encoding )
+			key = key.decode( "utf8" )
 		except UnicodeDecodeError:
-			out = bout
+			key = bytes( key )
+		end = bencoded_end( data, pos )
+		out[key] = ( pos, end )
+		pos = end
 	return out
 
 
+def info_hash( torrent_data, version = 1 ):
+	"""
+	Returns info-hash of the torrent as uppercase hex string: SHA-1 of the info dictionary for version 1, SHA-256 for version 2. The
+	dictionary is hashed as it's stored in the file, so the hash is right even if it isn't encoded canonically.
+	:param torrent_data: contents of .torrent file, mmap.mmap of the file works without reading it, decoded metainfo dict is encoded
+	:type torrent_data: bytes, bytearray, memoryview, mmap.mmap, dict
+	:type version: int
+	:rtype: str
+	"""
+	if version not in ( 1, 2 ):
+		raise ValueError( "Unknown info-hash version: {}".format( version ) )
+	if isinstance( torrent_data, dict ):
+		info = bytearray( )
+		bencode_to( torrent_data["info"], info )
+		return ( hashlib.sha1 if version == 1 else hashlib.sha256 )( info ).hexdigest( ).upper( )
+	data = _bencoded_buffer( torrent_data )
+	start, end = bencoded_dict_spans( data )["info"]
+	with memoryview( data ) as view:
+		digest = ( hashlib.sha1 if version == 1 else hashlib.sha256 )( view[start:end] )
+	return digest.hexdigest( ).upper( )
+
+
 def bencode( obj, str_encoding = "utf8" ):
 	"""
 	Encode object into binary string using bencode encoding.
@@ -89,32 +244,68 @@ def bencode( obj, str_encoding = "utf8" ):
 	:rtype: bytes
 	"""
 	out = bytearray( )
-	t = type( obj )
-	if t == int:
-		out.extend( "i{}e".format( obj ).encode( str_encoding ) )
-	elif t == dict:
-		out.extend( b"d" )
-		for k in sorted( obj.keys( ) ):
-			out.extend( bencode( k ) )
-			out.extend( bencode( obj[k] ) )
-		out.extend( b"e" )
-	elif t in ( bytes, bytearray ):
-		out.extend( str( len( obj ) ).encode( str_encoding ) )
-		out.extend( b":" )
-		out.extend( obj )
-	elif is_list_type( obj ):
-		out.extend( b"l" )
-		for e in map( bencode, obj ):
-			out.extend( e )
-		out.extend( b"e" )
-	else:
-		obj = str( obj ).encode( str_encoding )
-		out.extend( str( len( obj ) ).encode( str_encoding ) )
-		out.extend( b":" )
-		out.extend( obj )
+	bencode_to( obj, out, str_encoding )
 	return bytes( out )
 
 
+def bencode_to( obj, out, str_encoding = "utf8", flush_size = 1 << 16 ):
+	"""
+	Encode object using bencode encoding, appending it to the bytearray or writing it to the file-like object or socket. Everything is
+	written into single buffer without intermediate objects, the file gets it in chunks of about flush_size bytes.
+	:type obj: object, int, dict, bytes
+	:param out: bytearray, object with write method or socket
+	:type str_encoding: string
+	:type flush_size: int
+	"""
+	if isinstance( out, bytearray ):
+		buf = out
+		write = None
+	else:
+		buf = bytearray( )
+		write = out.write if hasattr( out, "write" ) else out.sendall
+	# iterators of the lists and dicts being encoded, dicts yield keys and values in turn
+	stack = [iter( ( obj, ) )]
+	while len( stack ) > 0:
+		for obj in stack[-1]:
+			t = type( obj )
+			if t is str:
+				obj = obj.encode( str_encoding )
+				buf += b"%d:" % len( obj )
+				buf += obj
+			elif t is int:
+				buf += b"i%de" % obj
+			elif t is dict:
+				buf += b"d"
+				try:
+					keys = sorted( obj.keys( ) )
+				except TypeError:
+					# bytes keys of decoded metainfo along with str ones, utf8 keeps the order of the code points
+					keys = sorted( obj.keys( ), key = lambda k: k.encode( str_encoding ) if type( k ) is str else k )
+				stack.append( itertools.chain.from_iterable( zip( keys, map( obj.__getitem__, keys ) ) ) )
+				break
+			elif t is bytes or t is bytearray:
+				buf += b"%d:" % len( obj )
+				buf += obj
+			elif is_list_type( obj ):
+				buf += b"l"
+				stack.append( iter( obj ) )
+				break
+			else:
+				obj = str( obj ).encode( str_encoding )
+				buf += b"%d:" % len( obj )
+				buf += obj
+		else:
+			# list/dict is finished, the outermost iterator is the object itself
+			stack.pop( )
+			if len( stack ) > 0:
+				buf += b"e"
+		if write is not None and len( buf ) >= flush_size:
+			write( buf )
+			buf = bytearray( )
+	if write is not None and len( buf ) > 0:
+		write( buf )
+
+
 def is_list_type( obj ):
 	"""
 	Returns true if object is traversable, but not a string or bytes.
@@ -172,6 +363,23 @@ def _get_external_attrs( cls ):
 	return [i for i in dir( cls ) if not re.search( "^_|_h$", i ) and not hasattr( getattr( cls, i ), "__call__" )]
 
 
+def _item_property( key ):
+	"""
+	Returns property with the item of the raw row (list or dict) kept by the object in _row attribute. The row may be shared with the
+	list cache, so setting the property changes the copy of the row that the object keeps from then on.
+
+	:type key: int, str
+	:rtype: property
+	"""
+
+	def fset( self, value ):
+		row = dict( self._row ) if isinstance( self._row, dict ) else list( self._row )
+		row[key] = value
+		self._row = row
+
+	return property( lambda self: self._row[key], fset )
+
+
 def _url_quote( string ):
 	"""
 	:type string: string
@@ -0,0 +1,982 @@
+"""
+asyncio counterparts of Connection and Desktop/Falcon/LinuxServer
+
+Every method that talks to the server is a coroutine, otherwise the API is the same as the one of the blocking classes:
+
+	conn = AsyncConnection( "localhost:8080", "admin", "password" )
+	ut = await conn.utorrent( )
+	torrents = await ut.torrent_list( )
+	await conn.close( )
+"""
+
+import asyncio
+import codecs
+import http.client
+import http.cookiejar
+import io
+import os
+import posixpath
+import socket
+import ssl as ssl_module
+import time
+import urllib.request
+from base64 import b64encode
+
+import utorrent
+import utorrent.changes
+import utorrent.instrument
+import utorrent.metainfo
+import utorrent.retry
+import utorrent.rss
+import utorrent.uTorrent
+from utorrent.connection import Connection, ContentDecoder, set_nodelay
+
+
+class AsyncResponse:
+	"""
+	HTTP/1.1 response read from asyncio stream, mimics the parts of http.client.HTTPResponse used by the library.
+	"""
+	status = 0
+	reason = ""
+	msg = None
+	""" :type: http.client.HTTPMessage """
+	length = None
+	will_close = False
+
+	_reader = None
+	""" :type: asyncio.StreamReader """
+	_chunked = False
+	_chunk_left = 0
+	_done = False
+
+	def __init__( self, reader ):
+		self._reader = reader
+
+	async def begin( self ):
+		line = await self._reader.readline( )
+		if not line:
+			raise http.client.RemoteDisconnected( "Remote end closed connection without response" )
+		try:
+			version, status, reason = ( line.decode( "iso-8859-1" ).rstrip( "\r\n" ).split( None, 2 ) + [""] )[:3]
+			self.status = int( status )
+		except ValueError:
+			raise http.client.BadStatusLine( line )
+		self.reason = reason.strip( )
+		raw = bytearray( )
+		while True:
+			line = await self._reader.readline( )
+			raw.extend( line )
+			if line in ( b"\r\n", b"\n", b"" ):
+				break
+		self.msg = http.client.parse_headers( io.BytesIO( bytes( raw ) ) )
+		conn_header = ( self.msg.get( "Connection" ) or "" ).lower( )
+		self.will_close = version == "HTTP/1.0" and conn_header != "keep-alive" or conn_header == "close"
+		self._chunked = ( self.msg.get( "Transfer-Encoding" ) or "" ).lower( ) == "chunked"
+		if not self._chunked and self.msg.get( "Content-Length" ) is not None:
+			self.length = int( self.msg.get( "Content-Length" ) )
+		elif not self._chunked:
+			# body is delimited by the end of the connection
+			self.will_close = True
+		if self.status in ( 204, 304 ) or self.length == 0:
+			self._done = True
+
+	def info( self ):
+		return self.msg
+
+	def getheader( self, name, default = None ):
+		return self.msg.get( name, default )
+
+	async def read_chunk( self, size = 65536 ):
+		"""
+		Returns next piece of body or empty bytes when it's fully read.
+
+		:rtype: bytes
+		"""
+		if self._done:
+			return b""
+		if self._chunked:
+			if self._chunk_left == 0:
+				self._chunk_left = int( ( await self._reader.readline( ) ).split( b";", 1 )[0], 16 )
+				if self._chunk_left == 0:
+					# skip trailers
+					while ( await self._reader.readline( ) ) not in ( b"\r\n", b"\n", b"" ):
+						pass
+					self._done = True
+					return b""
+			buf = await self._reader.read( min( size, self._chunk_left ) )
+			if not buf:
+				raise asyncio.IncompleteReadError( b"", self._chunk_left )
+			self._chunk_left -= len( buf )
+			if self._chunk_left == 0:
+				await self._reader.readline( )
+		elif self.length is not None:
+			buf = await self._reader.read( min( size, self.length ) )
+			if not buf:
+				raise asyncio.IncompleteReadError( b"", self.length )
+			self.length -= len( buf )
+			if self.length == 0:
+				self._done = True
+		else:
+			buf = await self._reader.read( size )
+			if not buf:
+				self._done = True
+		return buf
+
+	async def read( self ):
+		out = bytearray( )
+		while True:
+			buf = await self.read_chunk( )
+			if not buf:
+				break
+			out.extend( buf )
+		return bytes( out )
+
+
+class AsyncStream:
+	reader = None
+	""" :type: asyncio.StreamReader """
+	writer = None
+	""" :type: asyncio.StreamWriter """
+
+	def __init__( self, reader, writer ):
+		self.reader = reader
+		self.writer = writer
+
+	def is_open( self ):
+		return not self.writer.is_closing( ) and not self.reader.at_eof( )
+
+	def close( self ):
+		self.writer.close( )
+
+
+class AsyncConnectionPool:
+	"""
+	Pool of keep-alive connections to a single host, at most `size` of them are in use at the same time.
+	"""
+	_host = ""
+	_port = 80
+	_ssl_context = None
+	_size = 1
+	_semaphore = None
+	""" :type: asyncio.Semaphore """
+	_idle = None
+	""" :type: list """
+
+	@property
+	def size( self ):
+		return self._size
+
+	def __init__( self, host, port, ssl_context = None, size = 10 ):
+		if size < 1:
+			raise utorrent.uTorrentError( "Connection pool size must be positive" )
+		self._host = host
+		self._port = port
+		self._ssl_context = ssl_context
+		self._size = size
+		self._semaphore = asyncio.Semaphore( size )
+		self._idle = []
+
+	async def acquire( self, timeout = None ):
+		"""
+		Returns connection and flag telling whether it was already used for a previous request.
+
+		:rtype: (AsyncStream, bool)
+		"""
+		await self._semaphore.acquire( )
+		try:
+			while len( self._idle ) > 0:
+				stream = self._idle.pop( )
+				if stream.is_open( ):
+					return stream, True
+				stream.close( )
+			return await self.connect( timeout ), False
+		except BaseException:
+			self._semaphore.release( )
+			raise
+
+	async def connect( self, timeout = None ):
+		"""
+		:rtype: AsyncStream
+		"""
+		reader, writer = await asyncio.wait_for(
+			asyncio.open_connection( self._host, self._port, ssl = self._ssl_context, server_hostname = self._host if self._ssl_context else None ),
+			timeout )
+		sock = writer.get_extra_info( "socket" )
+		if sock is not None:
+			set_nodelay( sock )
+		return AsyncStream( reader, writer )
+
+	def release( self, stream, reuse = True ):
+		"""
+		:type stream: AsyncStream
+		:type reuse: bool
+		"""
+		if reuse and stream.is_open( ):
+			self._idle.append( stream )
+		else:
+			stream.close( )
+		self._semaphore.release( )
+
+	async def close( self ):
+		idle, self._idle = self._idle, []
+		for stream in idle:
+			stream.close( )
+		for stream in idle:
+			try:
+				await stream.writer.wait_closed( )
+			except ( OSError, ssl_module.SSLError ):
+				pass
+
+
+class AsyncConnection:
+	"""
+	asyncio version of utorrent.connection.Connection. Security token is fetched on the first request.
+	"""
+	_host = ""
+	_pool = None
+	""" :type: AsyncConnectionPool """
+	_request = None
+	_cookies = None
+	""" :type: http.cookiejar.CookieJar """
+	_token = None
+	_token_lock = None
+	""" :type: asyncio.Lock """
+
+	_retry_policy = None
+	""" :type: utorrent.retry.RetryPolicy """
+	_retry_budget = None
+	""" :type: utorrent.retry.RetryBudget """
+	_circuit_breaker = None
+	""" :type: utorrent.retry.CircuitBreaker """
+
+	_utorrent = None
+	_instrumentation = None
+	""" :type: utorrent.instrument.Instrumentation """
+
+	_connect_count = 0
+	_reuse_count = 0
+	_reconnect_count = 0
+	_compression = True
+	_bytes_received = 0
+	_bytes_decoded = 0
+
+	_max_url_length = 4096
+	_post_actions = frozenset( )
+
+	# request building is the same as for the blocking connection
+	_action = Connection._action
+	_action_args = Connection._action_args
+	_action_batches = Connection._action_batches
+	_action_val = Connection._action_val
+	_request_headers = Connection._request_headers
+	_cookie_header = Connection._cookie_header
+	_request_size = Connection._request_size
+
+	@property
+	def request_obj( self ):
+		return self._request
+
+	@property
+	def pool_size( self ):
+		return self._pool.size
+
+	@property
+	def connect_count( self ):
+		return self._connect_count
+
+	@property
+	def reuse_count( self ):
+		return self._reuse_count
+
+	@property
+	def reconnect_count( self ):
+		return self._reconnect_count
+
+	@property
+	def retry_policy( self ):
+		return self._retry_policy
+
+	@property
+	def circuit_breaker( self ):
+		return self._circuit_breaker
+
+	@property
+	def retry_budget( self ):
+		return self._retry_budget
+
+	@property
+	def bytes_received( self ):
+		return self._bytes_received
+
+	@property
+	def bytes_decoded( self ):
+		return self._bytes_decoded
+
+	@property
+	def instrumentation( self ):
+		"""
+		:rtype: utorrent.instrument.Instrumentation
+		"""
+		return self._instrumentation
+
+	def __init__( self, host, login, password, ssl = False, ssl_verify = True, pool_size = 10, compression = True, retry_policy = None,
+	              max_url_length = 4096, post_actions = None, instrumentation = None, retry_registry = None ):
+		ssl_context = None
+		if ssl:
+			self._url = "https://{}/".format( host )
+			ssl_context = ssl_module.create_default_context( ) if ssl_verify else ssl_module._create_unverified_context( )
+		else:
+			self._url = "http://{}/".format( host )
+		self._host = host
+		hostname, _, port = host.rpartition( ":" )
+		if not hostname or not port.isdigit( ):
+			hostname, port = host, 443 if ssl else 80
+		self._pool = AsyncConnectionPool( hostname.strip( "[]" ), int( port ), ssl_context, pool_size )
+		self._request = urllib.request.Request( self._url )
+		self._cookies = http.cookiejar.CookieJar( )
+		self._token_lock = asyncio.Lock( )
+		self._instrumentation = instrumentation if instrumentation is not None else utorrent.instrument.Instrumentation( )
+		self._compression = compression
+		self._max_url_length = max_url_length
+		if post_actions is not None:
+			self._post_actions = frozenset( post_actions )
+		self._retry_policy = retry_policy if retry_policy is not None else utorrent.retry.RetryPolicy( )
+		# shared with blocking connections to the same host
+		registry = retry_registry if retry_registry is not None else utorrent.retry.registry
+		self._circuit_breaker, self._retry_budget = registry.for_host( self._url )
+		self._request.add_header( "Authorization", "Basic " + b64encode( "{}:{}".format( login, password ).encode( "latin1" ) ).decode( "ascii" ) )
+
+	async def __aenter__( self ):
+		return self
+
+	async def __aexit__( self, exc_type, exc, tb ):
+		await self.close( )
+
+	async def close( self ):
+		await self._pool.close( )
+
+	async def _send_request( self, stream, reused, loc, headers, data, record ):
+		start = time.monotonic( )
+		try:
+			resp = await self._write_request( stream, loc, headers, data )
+		finally:
+			record.wait += time.monotonic( ) - start
+		record.bytes_sent += self._request_size( "GET" if data is None else "POST", loc, headers, data )
+		if reused:
+			self._reuse_count += 1
+		else:
+			self._connect_count += 1
+		return resp
+
+	async def _write_request( self, stream, loc, headers, data ):
+		method = "GET" if data is None else "POST"
+		if data is not None and "Content-Length" not in headers:
+			headers["Content-Length"] = str( len( data ) )
+		head = ["{} {} HTTP/1.1".format( method, self._request.selector + loc ), "Host: {}".format( self._host )]
+		head.extend( "{}: {}".format( k, v ) for k, v in headers.items( ) )
+		stream.writer.write( ( "\r\n".join( head ) + "\r\n\r\n" ).encode( "latin1" ) )
+		if isinstance( data, bytes ):
+			stream.writer.write( data )
+		elif data is not None:
+			for part in data:
+				stream.writer.write( part )
+				# don't let the transport buffer the whole upload
+				await stream.writer.drain( )
+		await stream.writer.drain( )
+		resp = AsyncResponse( stream.reader )
+		await resp.begin( )
+		return resp
+
+	def _attempt_timeout( self, deadline ):
+		timeout = self._retry_policy.timeout
+		remaining = Connection._remaining( deadline )
+		if remaining is not None:
+			if remaining <= 0:
+				raise utorrent.uTorrentError( "Deadline exceeded" )
+			timeout = min( timeout, remaining )
+		return timeout
+
+	async def _make_request( self, loc, headers, data, retry, deadline, record ):
+		last_e = None
+		attempt = 0
+		max_retries = self._retry_policy.max_retries if retry else 1
+		self._circuit_breaker.check( )
+		while True:
+			timeout = self._attempt_timeout( deadline )
+			start = time.monotonic( )
+			try:
+				stream, reused = await self._pool.acquire( timeout )
+				if not reused:
+					# includes waiting for a free slot in the pool
+					record.connect += time.monotonic( ) - start
+			except socket.gaierror as e:
+				raise utorrent.uTorrentError( e.strerror )
+			except asyncio.TimeoutError:
+				stream = None
+				last_e = utorrent.uTorrentError( "Timeout after {} tries".format( attempt + 1 ) )
+			except OSError as e:
+				self._circuit_breaker.record_failure( )
+				raise utorrent.uTorrentError( e.strerror )
+			if stream is not None:
+				try:
+					cookie = self._cookie_header( )
+					if cookie is not None:
+						headers["Cookie"] = cookie
+					try:
+						resp = await asyncio.wait_for( self._send_request( stream, reused, loc, headers, data, record ), timeout )
+					except ( http.client.RemoteDisconnected, ConnectionError ):
+						if not reused:
+							raise
+						# server has closed idle keep-alive connection, this is not an error, just open a new one
+						stream.close( )
+						self._reconnect_count += 1
+						record.reconnects += 1
+						start = time.monotonic( )
+						stream = await self._pool.connect( timeout )
+						record.connect += time.monotonic( ) - start
+						resp = await asyncio.wait_for( self._send_request( stream, False, loc, headers, data, record ), timeout )
+					if resp.status >= 500:
+						# server is overloaded or broken, worth retrying later
+						last_e = utorrent.uTorrentError( "{}: {}".format( resp.reason, resp.status ) )
+					else:
+						# any response, even an error one, means that WebUI is alive
+						self._circuit_breaker.record_success( )
+						self._retry_budget.deposit( )
+						if resp.status == 400:
+							raise utorrent.uTorrentError( ( await resp.read( ) ).decode( "utf8" ).strip( ) )
+						elif resp.status == 404 or resp.status == 401:
+							raise utorrent.uTorrentError( "Request {}: {}".format( loc, resp.reason ) )
+						elif resp.status != 200 and resp.status != 206:
+							raise utorrent.uTorrentError( "{}: {}".format( resp.reason, resp.status ) )
+						self._cookies.extract_cookies( resp, self._request )
+						return stream, resp
+				# retry when utorrent returns bad data or times out
+				except ( http.client.BadStatusLine, asyncio.IncompleteReadError, ConnectionError ) as e:
+					last_e = e
+				except asyncio.TimeoutError:
+					last_e = utorrent.uTorrentError( "Timeout after {} tries".format( attempt + 1 ) )
+				except BaseException:
+					self._pool.release( stream, False )
+					raise
+				self._pool.release( stream, False )
+			self._circuit_breaker.record_failure( )
+			attempt += 1
+			if attempt >= max_retries:
+				break
+			if not self._retry_budget.withdraw( ):
+				last_e = utorrent.uTorrentError( "Retry budget exhausted, last error: {}".format( last_e ) )
+				break
+			delay = self._retry_policy.delay( attempt )
+			remaining = Connection._remaining( deadline )
+			if remaining is not None and remaining <= delay:
+				last_e = utorrent.uTorrentError( "Deadline exceeded, last error: {}".format( last_e ) )
+				break
+			await asyncio.sleep( delay )
+			record.retries += 1
+			self._circuit_breaker.check( )
+		raise last_e
+
+	async def _get_data( self, loc, data = None, retry = True, range_start = None, range_len = None, save_buffer = None, progress_cb = None,
+	                     deadline = None, form = None, record = None ):
+		if record is not None:
+			return await self._get_response_body( loc, data, retry, range_start, range_len, save_buffer, progress_cb, deadline, form, record )
+		record = utorrent.instrument.RequestRecord( loc.split( "?", 1 )[0] )
+		try:
+			return await self._get_response_body( loc, data, retry, range_start, range_len, save_buffer, progress_cb, deadline, form, record )
+		except Exception as e:
+			record.error = str( e )
+			raise
+		finally:
+			self._instrumentation.record( record )
+
+	async def _get_response_body( self, loc, data, retry, range_start, range_len, save_buffer, progress_cb, deadline, form, record ):
+		headers, data = self._request_headers( data, range_start, range_len, save_buffer, form )
+		stream, resp = await self._make_request( loc, headers, data, retry, deadline, record )
+		timeout = self._attempt_timeout( deadline )
+		start = time.monotonic( )
+		try:
+			if save_buffer:
+				read = 0
+				resp_len = Connection._parse_content_range( resp.length, resp.getheader( "Content-Range" ) )
+				while True:
+					buf = await asyncio.wait_for( resp.read_chunk( 10240 ), timeout )
+					read += len( buf )
+					record.bytes_received += len( buf )
+					if progress_cb:
+						progress_cb( range_start, read, resp_len )
+					if len( buf ) == 0:
+						break
+					save_buffer.write( buf )
+				out = None
+			else:
+				decoder = ContentDecoder( resp.getheader( "Content-Encoding" ) )
+				received = 0
+				out = []
+				while True:
+					buf = await asyncio.wait_for( resp.read_chunk( ), timeout )
+					if len( buf ) == 0:
+						break
+					received += len( buf )
+					out.append( decoder.decompress( buf ) )
+				out.append( decoder.flush( ) )
+				out = b"".join( out )
+				self._bytes_received += received
+				self._bytes_decoded += len( out )
+				record.bytes_received += received
+				out = out.decode( "utf8" )
+		except BaseException:
+			# response is not fully read, connection can't be reused
+			self._pool.release( stream, False )
+			raise
+		finally:
+			record.transfer += time.monotonic( ) - start
+		self._pool.release( stream, not resp.will_close )
+		return out
+
+	async def _fetch_token( self, rejected_token = None ):
+		"""
+		Fetches the new token unless other task has already replaced the one that was rejected, or fetched the first one if it's None.
+		"""
+		async with self._token_lock:
+			if self._token == rejected_token:
+				self._cookies.clear( )
+				self._token = Connection._parse_token( await self._get_data( "gui/token.html" ) )
+
+	async def _with_token( self, send, refresh = True ):
+		"""
+		Awaits send( ) that makes the request using the current token, repeats it once with the new token if the old one was rejected, see
+		Connection._with_token( ).
+		"""
+		if self._token is None:
+			await self._fetch_token( )
+		token = self._token
+		try:
+			return await send( )
+		except utorrent.uTorrentError as e:
+			if not refresh or not Connection._token_rejected( e ):
+				raise e
+			await self._fetch_token( token )
+			return await send( )
+
+	async def stream_action( self, action, params = None, params_str = None, timeout = None ):
+		"""
+		Sends the action and yields its response body as str chunks while it's being received, see Connection.stream_action( ).
+		"""
+		deadline = time.monotonic( ) + timeout if timeout is not None else None
+		record = utorrent.instrument.RequestRecord( action )
+		try:
+			headers, data = self._request_headers( )
+			stream, resp = await self._with_token(
+				lambda: self._make_request( self._action( action, params, params_str ), dict( headers ), None, True, deadline, record ) )
+			timeout = self._attempt_timeout( deadline )
+			decoder = ContentDecoder( resp.getheader( "Content-Encoding" ) )
+			text_decoder = codecs.getincrementaldecoder( "utf8" )( )
+			received = 0
+			complete = False
+			try:
+				while True:
+					start = time.monotonic( )
+					buf = await asyncio.wait_for( resp.read_chunk( ), timeout )
+					received += len( buf )
+					final = len( buf ) == 0
+					buf = decoder.flush( ) if final else decoder.decompress( buf )
+					self._bytes_decoded += len( buf )
+					text = text_decoder.decode( buf, final )
+					record.transfer += time.monotonic( ) - start
+					if text:
+						yield text
+					if final:
+						break
+				complete = True
+			finally:
+				self._bytes_received += received
+				record.bytes_received += received
+				# response that is not fully read leaves the connection unusable
+				self._pool.release( stream, complete and not resp.will_close )
+		except Exception as e:
+			record.error = str( e )
+			raise
+		finally:
+			self._instrumentation.record( record )
+
+	async def _single_action( self, action, params = None, params_str = None, data = None, retry = True, range_start = None, range_len = None,
+	                          save_buffer = None, progress_cb = None, deadline = None, refresh_token = True ):
+		record = utorrent.instrument.RequestRecord( action )
+
+		async def send( ):
+			# the location has the token, so it's built again when the request is repeated with the new one
+			form = None
+			if action in self._post_actions:
+				loc = self._action( action )
+				form = self._action_args( params, params_str )
+			else:
+				loc = self._action( action, params, params_str )
+			return await self._get_data( loc, data = data, retry = retry, range_start = range_start, range_len = range_len, save_buffer = save_buffer,
+			                             progress_cb = progress_cb, deadline = deadline, form = form, record = record )
+
+		try:
+			res = await self._with_token( send, refresh_token )
+			start = time.monotonic( )
+			res = Connection._decode_response( res )
+			record.decode = time.monotonic( ) - start
+			return res
+		except Exception as e:
+			record.error = str( e )
+			raise
+		finally:
+			self._instrumentation.record( record )
+
+	async def do_action( self, action, params = None, params_str = None, data = None, retry = True, range_start = None, range_len = None,
+	                     save_buffer = None, progress_cb = None, timeout = None ):
+		deadline = time.monotonic( ) + timeout if timeout is not None else None
+		if self._token is None:
+			# the length of the URLs of the batches depends on the token
+			await self._fetch_token( )
+		if data is not None or save_buffer is not None:
+			batches = [( params, params_str )]
+		else:
+			batches = self._action_batches( action, params, params_str )
+		responses = []
+		# parts of the split action are sent one after another as the server may depend on their order
+		for batch_params, batch_params_str in batches:
+			responses.append( await self._single_action( action, batch_params, batch_params_str, data = data, retry = retry,
+			                                             range_start = range_start, range_len = range_len, save_buffer = save_buffer,
+			                                             progress_cb = progress_cb, deadline = deadline ) )
+		return Connection._merge_responses( responses )
+
+	async def utorrent( self, api = None ):
+		api_classes = { "linux": AsyncLinuxServer, "desktop": AsyncDesktop, "falcon": AsyncFalcon }
+		if api in api_classes:
+			return api_classes[api]( self )
+		else: # auto-detect
+			# windows desktop uTorrent client rejects getversion, it's not taken for the rejected token
+			try:
+				ver = utorrent.uTorrent.Version( await self._single_action( "getversion", retry = False, refresh_token = False ) )
+			except utorrent.uTorrentError as e:
+				if e.args[0] == "invalid request": # windows desktop uTorrent client
+					ver = utorrent.uTorrent.Version.detect_from_settings( await self.do_action( "getsettings" ) )
+				else:
+					raise e
+			return api_classes[Connection._api_for_version( ver )]( self, ver )
+
+
+def _read_file( filename ):
+	with open( filename, "rb" ) as f:
+		return f.read( )
+
+
+class AsyncDesktop( utorrent.uTorrent.Desktop ):
+	"""
+	asyncio version of utorrent.uTorrent.Desktop
+	"""
+	_connection = None
+	""" :type: AsyncConnection """
+
+	async def resolve_torrent_hashes( self, hashes, torrent_list = None ):
+		if torrent_list is None:
+			await self._fetch_torrent_list( )
+			return self._resolve_cached_hashes( hashes )
+		return utorrent.uTorrent.Desktop.resolve_torrent_hashes( self, hashes, torrent_list )
+
+	async def resolve_feed_ids( self, ids, rss_list = None ):
+		if rss_list is None:
+			rss_list = await self.rss_list( )
+		return utorrent.uTorrent.Desktop.resolve_feed_ids( self, ids, rss_list )
+
+	async def resolve_filter_ids( self, ids, filter_list = None ):
+		if filter_list is None:
+			filter_list = await self.rssfilter_list( )
+		return utorrent.uTorrent.Desktop.resolve_filter_ids( self, ids, filter_list )
+
+	async def _handle_download_dir( self, download_dir ):
+		out = None
+		if download_dir:
+			out = ( await self.settings_get( ) )["dir_active_download"]
+			if not self._pathmodule.isabs( download_dir ):
+				download_dir = out + self._pathmodule.sep + download_dir
+			await self.settings_set( { "dir_active_download": download_dir } )
+		return out
+
+	async def _handle_prev_dir( self, prev_dir ):
+		if prev_dir:
+			await self.settings_set( { "dir_active_download": prev_dir } )
+
+	async def do_action( self, action, params = None, params_str = None, data = None, retry = True, range_start = None, range_len = None,
+	                     save_buffer = None, progress_cb = None, timeout = None ):
+		return await self._connection.do_action( action = action, params = params, params_str = params_str, data = data, retry = retry,
+		                                         range_start = range_start, range_len = range_len, save_buffer = save_buffer,
+		                                         progress_cb = progress_cb, timeout = timeout )
+
+	async def version( self ):
+		if not self._version:
+			self._version = utorrent.uTorrent.Version( await self.do_action( "start" ) )
+		return self._version
+
+	async def _fetch_torrent_list( self, changes = None ):
+		params = self._list_params( )
+		try:
+			return self._apply_list( await self.do_action( "list", params ), changes )
+		except utorrent.uTorrentError as e:
+			if params is None or not self._list_cache_rejected( e ):
+				raise
+			# cache id is not recognized anymore (e.g. uTorrent was restarted) or cached rows don't match the delta, get full list
+			out = await self.do_action( "list" )
+			if changes is not None:
+				changes.compare( self, out )
+			self._reset_list_cache( )
+			return self._update_list_cache( out )
+
+	async def torrent_list( self, labels = None, rss_feeds = None, rss_filters = None ):
+		res = await self._fetch_torrent_list( )
+		return self._build_torrent_list( res, labels, rss_feeds, rss_filters )
+
+	async def torrent_table( self, label = None, where = None ):
+		await self._fetch_torrent_list( )
+		return self._build_torrent_table( label, where )
+
+	async def torrent_hashes( self, where = None ):
+		await self._fetch_torrent_list( )
+		return self._select_hashes( where )
+
+	async def torrent_top( self, sort_field, count, desc = False, label = None, where = None ):
+		await self._fetch_torrent_list( )
+		return self._build_torrent_top( sort_field, count, desc, label, where )
+
+	async def torrent_index( self ):
+		await self._fetch_torrent_list( )
+		return self._get_torrent_index( )
+
+	async def torrent_changes( self ):
+		changes = utorrent.changes.ListChanges( )
+		await self._fetch_torrent_list( changes )
+		return changes
+
+	async def _stream_list( self, params, key, stream ):
+		chunks = self._connection.stream_action( "list", params )
+		try:
+			async for chunk in chunks:
+				for k, row in stream.feed( chunk ):
+					if k == key:
+						stream.yielded += 1
+						yield row
+			for k, row in stream.close( ):
+				if k == key:
+					stream.yielded += 1
+					yield row
+		finally:
+			await chunks.aclose( )
+
+	async def _iter_list( self, key, cache_attr ):
+		params = self._list_params( )
+		stream = utorrent.uTorrent._ListStream( )
+		try:
+			async for row in self._stream_list( params, key, stream ):
+				yield row
+			out = self._update_list_cache( stream.result( ) )
+		except utorrent.uTorrentError as e:
+			if params is None or stream.yielded > 0 or not self._list_cache_rejected( e ):
+				raise
+			# cache id is not recognized anymore (e.g. uTorrent was restarted) or cached rows don't match the delta, get full list
+			self._reset_list_cache( )
+			stream = utorrent.uTorrent._ListStream( )
+			async for row in self._stream_list( None, key, stream ):
+				yield row
+			out = self._update_list_cache( stream.result( ) )
+		if key not in out and getattr( self, cache_attr ) is not None:
+			for row in list( getattr( self, cache_attr ).values( ) ):
+				yield row
+
+	async def iter_torrents( self ):
+		async for row in self._iter_list( "torrents", "_torrent_cache" ):
+			self.check_hash( row[0] )
+			yield self._TorrentClass( self, row )
+
+	async def iter_rss_feeds( self ):
+		async for row in self._iter_list( "rssfeeds", "_rssfeed_cache" ):
+			yield utorrent.rss.Feed( row )
+
+	async def iter_rss_filters( self ):
+		async for row in self._iter_list( "rssfilters", "_rssfilter_cache" ):
+			yield utorrent.rss.Filter( row )
+
+	async def torrent_info( self, torrents ):
+		return self._parse_torrent_info( await self.do_action( "getprops", { "hash": self._get_hashes( torrents ) } ) )
+
+	async def torrent_add_url( self, url, download_dir = None ):
+		prev_dir = await self._handle_download_dir( download_dir )
+		res = await self.do_action( "add-url", { "s": url } )
+		await self._handle_prev_dir( prev_dir )
+		self._check_add_result( res )
+		return self._magnet_hash( url )
+
+	async def torrent_add_data( self, torrent_data, download_dir = None, filename = "default.torrent" ):
+		torrent_data = self._encode_torrent_data( torrent_data )
+		prev_dir = await self._handle_download_dir( download_dir )
+		with self._create_torrent_upload( torrent_data, filename ) as upload:
+			res = await self.do_action( "add-file", data = upload )
+		await self._handle_prev_dir( prev_dir )
+		self._check_add_result( res )
+		return self.get_info_hash( torrent_data )
+
+	async def torrent_add_file( self, filename, download_dir = None ):
+		torrent_data = await asyncio.get_running_loop( ).run_in_executor( None, _read_file, filename )
+		try:
+			# checked to be a torrent before sending like the sync version does
+			utorrent.metainfo.TorrentMetainfo( torrent_data )
+		except ValueError as e:
+			raise utorrent.uTorrentError( "{}: {}".format( filename, e ) )
+		return await self.torrent_add_data( torrent_data, download_dir, os.path.basename( filename ) )
+
+	async def torrent_set_props( self, props ):
+		await self.do_action( "setprops", params_str = self._set_props_args( props ) )
+
+	async def torrent_start( self, torrents, force = False ):
+		if force:
+			await self.do_action( "forcestart", { "hash": self._get_hashes( torrents ) } )
+		else:
+			await self.do_action( "start", { "hash": self._get_hashes( torrents ) } )
+
+	async def torrent_forcestart( self, torrents ):
+		return await self.torrent_start( torrents, True )
+
+	async def torrent_stop( self, torrents ):
+		await self.do_action( "stop", { "hash": self._get_hashes( torrents ) } )
+
+	async def torrent_pause( self, torrents ):
+		await self.do_action( "pause", { "hash": self._get_hashes( torrents ) } )
+
+	async def torrent_resume( self, torrents ):
+		await self.do_action( "unpause", { "hash": self._get_hashes( torrents ) } )
+
+	async def torrent_recheck( self, torrents ):
+		await self.do_action( "recheck", { "hash": self._get_hashes( torrents ) } )
+
+	async def torrent_remove( self, torrents, with_data = False ):
+		if with_data:
+			await self.do_action( "removedata", { "hash": self._get_hashes( torrents ) } )
+		else:
+			await self.do_action( "remove", { "hash": self._get_hashes( torrents ) } )
+
+	async def torrent_remove_with_data( self, torrents ):
+		return await self.torrent_remove( torrents, True )
+
+	async def torrent_get_magnet( self, torrents, self_tracker = False ):
+		out = { }
+		await self._fetch_torrent_list( )
+		for t in torrents:
+			t = t.upper( )
+			self.check_hash( t )
+			if t in self._torrent_cache:
+				if self_tracker:
+					trackers = [self._connection.request_obj.get_full_url( ) + "announce"]
+				else:
+					trackers = ( await self.torrent_info( t ) )[t].trackers
+				out[t] = self._magnet_link( t, self._TorrentClass( self, self._torrent_cache[t] ).name, trackers )
+		return out
+
+	async def file_list( self, torrents ):
+		return self._parse_file_list( await self.do_action( "getfiles", { "hash": self._get_hashes( torrents ) } ) )
+
+	async def file_set_priority( self, files ):
+		priorities = self._parse_file_priorities( files )
+		need_count = list( { parent_hash for parent_hash, index, prio in priorities if index is None } )
+		counts = await asyncio.gather( *[self.file_list( parent_hash ) for parent_hash in need_count] )
+		filecount_cache = { parent_hash: len( files[parent_hash] ) for parent_hash, files in zip( need_count, counts ) }
+		await self.do_action( "setprio", params_str = self._set_priority_args( priorities, filecount_cache ) )
+
+	async def settings_get( self ):
+		return self._parse_settings( await self.do_action( "getsettings" ) )
+
+	async def settings_set( self, settings ):
+		await self.do_action( "setsetting", params_str = self._settings_set_args( settings ) )
+
+	async def rss_list( self ):
+		rss_feeds = { }
+		await self.torrent_list( rss_feeds = rss_feeds )
+		return rss_feeds
+
+	async def rssfilter_list( self ):
+		rss_filters = { }
+		await self.torrent_list( rss_filters = rss_filters )
+		return rss_filters
+
+
+class AsyncFalcon( AsyncDesktop ):
+	"""
+	asyncio version of utorrent.uTorrent.Falcon
+	"""
+	_TorrentClass = utorrent.uTorrent.Falcon._TorrentClass
+	_JobInfoClass = utorrent.uTorrent.Falcon._JobInfoClass
+	_FileClass = utorrent.uTorrent.Falcon._FileClass
+
+	api_version = utorrent.uTorrent.Falcon.api_version
+
+	_parse_settings = utorrent.uTorrent.Falcon._parse_settings
+	_rss_ident = staticmethod( utorrent.uTorrent.Falcon._rss_ident )
+	_filter_ident = staticmethod( utorrent.uTorrent.Falcon._filter_ident )
+
+	async def torrent_remove( self, torrents, with_data = False, with_torrent = False ):
+		if with_data:
+			if with_torrent:
+				await self.do_action( "removedatatorrent", { "hash": self._get_hashes( torrents ) } )
+			else:
+				await self.do_action( "removedata", { "hash": self._get_hashes( torrents ) } )
+		else:
+			if with_torrent:
+				await self.do_action( "removetorrent", { "hash": self._get_hashes( torrents ) } )
+			else:
+				await self.do_action( "remove", { "hash": self._get_hashes( torrents ) } )
+
+	async def torrent_remove_with_torrent( self, torrents ):
+		return await self.torrent_remove( torrents, False, True )
+
+	async def torrent_remove_with_data_torrent( self, torrents ):
+		return await self.torrent_remove( torrents, True, True )
+
+	async def file_get( self, file_hash, buffer, range_start = None, range_len = None, progress_cb = None ):
+		parent_hash, index = self.parse_hash_prop( file_hash )
+		await self.do_action( "proxy", { "id": parent_hash, "file": index }, range_start = range_start, range_len = range_len, save_buffer = buffer,
+		                      progress_cb = progress_cb )
+
+	async def settings_get( self, extended_attributes = False ):
+		return self._parse_settings( await self.do_action( "getsettings" ) )
+
+	async def rss_add( self, url ):
+		return await self.rss_update( -1, { "url": url } )
+
+	async def rss_update( self, feed_id, params ):
+		params["feed-id"] = feed_id
+		return self._rss_ident( await self.do_action( "rss-update", params ), feed_id )
+
+	async def rss_remove( self, feed_id ):
+		await self.do_action( "rss-remove", { "feed-id": feed_id } )
+
+	async def rssfilter_add( self, feed_id = -1 ):
+		return await self.rssfilter_update( -1, { "feed-id": feed_id } )
+
+	async def rssfilter_update( self, filter_id, params ):
+		params["filter-id"] = filter_id
+		return self._filter_ident( await self.do_action( "filter-update", params ), filter_id )
+
+	async def rssfilter_remove( self, filter_id ):
+		await self.do_action( "filter-remove", { "filter-id": filter_id } )
+
+	async def xfer_history_get( self ):
+		return ( await self.do_action( "getxferhist" ) )["transfer_history"]
+
+	async def xfer_history_reset( self ):
+		await self.do_action( "resetxferhist" )
+
+
+class AsyncLinuxServer( AsyncFalcon ):
+	"""
+	asyncio version of utorrent.uTorrent.LinuxServer
+	"""
+	_pathmodule = posixpath
+
+	api_version = utorrent.uTorrent.LinuxServer.api_version
+
+	async def version( self ):
+		if not self._version:
+			self._version = utorrent.uTorrent.Version( await self.do_action( "getversion" ) )
+		return self._version
@@ -0,0 +1,130 @@
+"""
+Cache
+
+On-disk storage of per-host data that is expensive to get from the server and can be reused between runs.
+"""
+
+import gzip
+import http.cookiejar
+import json
+import os
+import re
+import tempfile
+
+
+class HostCache:
+	"""
+	Directory backed storage of named JSON documents for a single uTorrent instance.
+	"""
+	_cache_dir = ""
+	_key = ""
+
+	@property
+	def cache_dir( self ):
+		return self._cache_dir
+
+	@property
+	def key( self ):
+		"""
+		File name prefix identifying the uTorrent instance.
+
+		:rtype: str
+		"""
+		return self._key
+
+	def __init__( self, cache_dir, host, login = "" ):
+		"""
+		:type cache_dir: str
+		:type host: str
+		:type login: str
+		"""
+		self._cache_dir = cache_dir
+		self._key = re.sub( "[^0-9A-Za-z._@-]", "_", "{}@{}".format( login, host ) if login else host )
+
+	def path( self, name, ext = ".json" ):
+		return os.path.join( self._cache_dir, "{}.{}{}".format( self._key, name, ext ) )
+
+	def load( self, name ):
+		"""
+		Returns stored document or None if it's missing or corrupted.
+
+		:type name: str
+		:rtype: dict
+		"""
+		try:
+			with open( self.path( name ), "r", encoding = "utf8" ) as f:
+				return json.load( f )
+		except ( OSError, ValueError ):
+			return None
+
+	def save( self, name, obj ):
+		"""
+		:type name: str
+		:type obj: dict
+		"""
+		self._write( self.path( name ), json.dumps( obj, separators = ( ",", ":" ) ).encode( "utf8" ) )
+
+	def load_compressed( self, name ):
+		"""
+		Returns document stored with save_compressed() or None if it's missing or corrupted.
+
+		:type name: str
+		:rtype: dict
+		"""
+		try:
+			with gzip.open( self.path( name, ".json.gz" ), "rb" ) as f:
+				return json.loads( f.read( ).decode( "utf8" ) )
+		except ( OSError, EOFError, ValueError ):
+			return None
+
+	def save_compressed( self, name, obj ):
+		"""
+		Same as save(), but the document is gzipped, meant for large documents like the torrent list.
+
+		:type name: str
+		:type obj: dict
+		"""
+		data = json.dumps( obj, separators = ( ",", ":" ) ).encode( "utf8" )
+		self._write( self.path( name, ".json.gz" ), gzip.compress( data, 6 ) )
+
+	def remove( self, name, ext = ".json" ):
+		try:
+			os.remove( self.path( name, ext ) )
+		except OSError:
+			pass
+
+	def _write( self, path, data ):
+		# write to temporary file first so that concurrent runs never see partially written cache,
+		# mkstemp also makes it readable only by the owner as it contains session credentials
+		try:
+			# the directory is created readable only by the owner as well
+			os.makedirs( self._cache_dir, mode = 0o700, exist_ok = True )
+			fd, tmp_path = tempfile.mkstemp( dir = self._cache_dir, prefix = ".tmp" )
+			try:
+				with os.fdopen( fd, "wb" ) as f:
+					f.write( data )
+				os.replace( tmp_path, path )
+			except BaseException:
+				os.remove( tmp_path )
+				raise
+		except OSError:
+			# cache is an optimization, failing to write it is not an error
+			pass
+
+
+def cookies_to_list( cookie_jar ):
+	"""
+	:type cookie_jar: http.cookiejar.CookieJar
+	:rtype: list
+	"""
+	return [{ "name": c.name, "value": c.value, "domain": c.domain, "path": c.path, "secure": c.secure, "expires": c.expires } for c in cookie_jar]
+
+
+def cookies_from_list( cookie_jar, cookies ):
+	"""
+	:type cookie_jar: http.cookiejar.CookieJar
+	:type cookies: list
+	"""
+	for c in cookies:
+		cookie_jar.set_cookie( http.cookiejar.Cookie( 0, c["name"], c["value"], None, False, c["domain"], True, c["domain"].startswith( "." ),
+		                                              c["path"], True, c["secure"], c["expires"], c["expires"] is None, None, None, { } ) )
@@ -0,0 +1,176 @@
+"""
+Changes
+
+Field-level changes of torrents, RSS feeds and filters between list responses.
+"""
+
+import utorrent
+import utorrent.rss as rss
+import utorrent.table as table
+
+
+class Change:
+	"""
+	Change of a single torrent, RSS feed or filter.
+	"""
+	ADDED = "added"
+	REMOVED = "removed"
+	CHANGED = "changed"
+
+	kind = CHANGED
+	id = None
+	""" hash of the torrent, id of the feed or filter """
+	old = None
+	""" object before the change, None if it was added """
+	new = None
+	""" object after the change, None if it was removed """
+	fields = None
+	""" :type: dict[str, tuple] attribute name -> ( old value, new value ), empty unless the kind is CHANGED """
+
+	def __init__( self, kind, id, old = None, new = None, fields = None ):
+		self.kind = kind
+		self.id = id
+		self.old = old
+		self.new = new
+		self.fields = fields if fields is not None else { }
+
+	def __str__( self ):
+		out = "{} {}".format( self.kind, self.new if self.new is not None else self.old )
+		if len( self.fields ) > 0:
+			out += ": " + ", ".join( "{} {} -> {}".format( name, old, new ) for name, ( old, new ) in sorted( self.fields.items( ) ) )
+		return out
+
+	@property
+	def status_flags( self ):
+		"""
+		Returns torrent status flags that were flipped, e.g. { "started": ( True, False ) }.
+
+		:rtype: dict[str, tuple]
+		"""
+		if "status" not in self.fields:
+			return { }
+		old, new = self.fields["status"]
+		out = { }
+		for name in table.STATUS_BITS:
+			if getattr( old, name ) != getattr( new, name ):
+				out[name] = ( getattr( old, name ), getattr( new, name ) )
+		return out
+
+
+class ListChanges:
+	"""
+	Changes made by a list response to the rows cached from the previous one.
+	"""
+	torrents = None
+	""" :type: list[Change] """
+	rss_feeds = None
+	""" :type: list[Change] """
+	rss_filters = None
+	""" :type: list[Change] """
+
+	def __init__( self ):
+		self.torrents = []
+		self.rss_feeds = []
+		self.rss_filters = []
+
+	def __len__( self ):
+		return len( self.torrents ) + len( self.rss_feeds ) + len( self.rss_filters )
+
+	def __iter__( self ):
+		yield from self.torrents
+		yield from self.rss_feeds
+		yield from self.rss_filters
+
+	@staticmethod
+	def _of_kind( changes, kind ):
+		return [c for c in changes if c.kind == kind]
+
+	@property
+	def added( self ):
+		"""
+		:rtype: list[Change]
+		"""
+		return self._of_kind( self, Change.ADDED )
+
+	@property
+	def removed( self ):
+		"""
+		:rtype: list[Change]
+		"""
+		return self._of_kind( self, Change.REMOVED )
+
+	@property
+	def changed( self ):
+		"""
+		:rtype: list[Change]
+		"""
+		return self._of_kind( self, Change.CHANGED )
+
+	@staticmethod
+	def _diff_fields( fields, old_obj, new_obj, old_row, new_row ):
+		out = { }
+		for i, name in enumerate( fields ):
+			if name.startswith( "_" ):
+				continue
+			if i >= len( old_row ) or i >= len( new_row ) or old_row[i] != new_row[i]:
+				out[name] = ( getattr( old_obj, name ), getattr( new_obj, name ) )
+		return out
+
+	@classmethod
+	def _compare_rows( cls, cache, out, full_key, delta_key, removed_key, build ):
+		"""
+		Returns changes of the single kind of rows, raises ListDeltaError if the removed row is not in the cache.
+
+		:param cache: rows before the response keyed by id, None if there were none
+		:param build: callable creating object from the row
+		:rtype: list[Change]
+		"""
+		cache = cache if cache is not None else { }
+		changes = []
+		if delta_key in out:
+			unknown = [i for i in out.get( removed_key, [] ) if i not in cache]
+			if len( unknown ) > 0:
+				raise utorrent.ListDeltaError( "Removed {} {} is not cached".format( removed_key, unknown[0] ) )
+			removed = [( i, cache[i] ) for i in out.get( removed_key, [] )]
+			changed = out[delta_key]
+		elif full_key in out:
+			rows = out[full_key]
+			rows = rows.values( ) if isinstance( rows, dict ) else rows
+			ids = set( )
+			changed = []
+			for row in rows:
+				ids.add( row[0] )
+				# unchanged rows are skipped without building any objects
+				if cache.get( row[0] ) != row:
+					changed.append( row )
+			removed = [( i, row ) for i, row in cache.items( ) if i not in ids]
+		else:
+			return changes
+		for row in changed:
+			new = build( row )
+			if row[0] in cache:
+				old = build( cache[row[0]] )
+				fields = cls._diff_fields( type( new )._fields, old, new, cache[row[0]], row )
+				if len( fields ) > 0:
+					changes.append( Change( Change.CHANGED, row[0], old, new, fields ) )
+			else:
+				changes.append( Change( Change.ADDED, row[0], new = new ) )
+		for i, row in removed:
+			changes.append( Change( Change.REMOVED, i, old = build( row ) ) )
+		return changes
+
+	def compare( self, utorrent_obj, out ):
+		"""
+		Replaces the changes with the ones the list response makes to the cache of the client, the cache is not modified. Raises
+		utorrent.ListDeltaError if the response is a delta that doesn't match the cache.
+
+		:type utorrent_obj: utorrent.uTorrent.Desktop
+		:param out: decoded list response
+		:type out: dict
+		"""
+		torrent_class = utorrent_obj.TorrentClass
+		torrents = self._compare_rows( utorrent_obj._torrent_cache, out, "torrents", "torrentp", "torrentm",
+		                               lambda row: torrent_class( utorrent_obj, row ) )
+		rss_feeds = self._compare_rows( utorrent_obj._rssfeed_cache, out, "rssfeeds", "rssfeedp", "rssfeedm", rss.Feed )
+		rss_filters = self._compare_rows( utorrent_obj._rssfilter_cache, out, "rssfilters", "rssfilterp", "rssfilterm", rss.Filter )
+		self.torrents, self.rss_feeds, self.rss_filters = torrents, rss_feeds, rss_filters
@@ -2,162 +2,781 @@
 uTorrentConnection
 """
 
-import email.generator
+import codecs
 import errno
 import http.client
 import http.cookiejar
 import json
 import re
 import socket
+import queue
 import ssl as ssl_module
+import threading
 import time
 import urllib.parse
 import urllib.request
 import urllib.request
+import zlib
 from base64 import b64encode
 
 import utorrent
+import utorrent.cache
+import utorrent.instrument
+import utorrent.jsonstream
+import utorrent.retry
 import utorrent.uTorrent
 
+_json_decoder = json.JSONDecoder( )
+_json_whitespace = re.compile( "[ \t\n\r]*" )
+
+
+_loads = utorrent.jsonstream.loads
+
+
+def _duplicate_keys( text, obj ):
+	"""
+	Returns top-level keys with list values that occur in the text more than once.
+	"""
+	# uTorrent can send several top-level keys with the same name (e.g. "files" for every requested torrent), native decoders keep only
+	# the last one; only list values are merged, so only those keys matter
+	list_keys = [k for k, v in obj.items( ) if isinstance( v, list )]
+	# the key can be followed by whitespace, so the quoted key itself is counted; the string value equal to the key only makes the text
+	# decoded again with the duplicates checked
+	return [k for k in list_keys if text.count( '"{}"'.format( k ) ) > 1]
+
+
+def _loads_joining_adjacent( text, key ):
+	"""
+	Decodes JSON object concatenating list values of the top-level key which duplicates follow each other, like "files" of getfiles with
+	several hashes. The text is split at every '],"key":[' and the parts are decoded natively, None is returned unless every split is
+	between the top-level values.
+	"""
+	sep = '],"{}":['.format( key )
+	positions = []
+	pos = text.find( sep )
+	while pos >= 0:
+		positions.append( pos )
+		pos = text.find( sep, pos + len( sep ) )
+	# all but one key must be at the splits, the others would be nested or kept only once by the native decoder
+	if len( positions ) == 0 or text.count( '"{}":'.format( key ) ) != len( positions ) + 1:
+		return None
+	try:
+		# the parts are complete JSON values only if the splits are at the top level, otherwise the brackets don't match
+		out = _loads( text[:positions[0] + 1] + "}" )
+		if not isinstance( out, dict ) or not isinstance( out.get( key ), list ):
+			return None
+		values = out[key]
+		for start, end in zip( positions, positions[1:] ):
+			values.extend( _loads( text[start + len( sep ) - 1:end + 1] ) )
+		rest = _loads( '{"' + key + '":' + text[positions[-1] + len( sep ) - 1:] )
+	except ValueError:
+		return None
+	values.extend( rest.pop( key ) )
+	out.update( rest )
+	return out
+
+
+def _loads_merging_keys( text ):
+	"""
+	Decodes JSON object concatenating list values of the duplicate top-level keys, the values themselves are decoded natively.
+	"""
+	ws = _json_whitespace.match
+	pos = ws( text ).end( )
+	if text[pos:pos + 1] != "{":
+		return json.loads( text )
+	out = { }
+	pos = ws( text, pos + 1 ).end( )
+	if text[pos:pos + 1] == "}":
+		return out
+	while True:
+		key, pos = _json_decoder.raw_decode( text, pos )
+		pos = ws( text, pos ).end( )
+		if text[pos:pos + 1] != ":":
+			raise json.JSONDecodeError( "Expecting ':' delimiter", text, pos )
+		value, pos = _json_decoder.raw_decode( text, ws( text, pos + 1 ).end( ) )
+		if key in out and isinstance( out[key], list ) and isinstance( value, list ):
+			out[key].extend( value )
+		else:
+			out[key] = value
+		pos = ws( text, pos ).end( )
+		delimiter = text[pos:pos + 1]
+		if delimiter == "}":
+			break
+		if delimiter != ",":
+			raise json.JSONDecodeError( "Expecting ',' delimiter", text, pos )
+		pos = ws( text, pos + 1 ).end( )
+	if ws( text, pos + 1 ).end( ) != len( text ):
+		raise json.JSONDecodeError( "Extra data", text, pos + 1 )
+	return out
+
+
+def decode_json( text ):
+	"""
+	Decodes WebUI response, list values of the duplicate top-level keys are concatenated. orjson is used if it's installed.
+
+	:type text: str
+	"""
+	out = _loads( text )
+	if not isinstance( out, dict ):
+		return out
+	keys = _duplicate_keys( text, out )
+	if not keys:
+		return out
+	if len( keys ) == 1:
+		joined = _loads_joining_adjacent( text, keys[0] )
+		if joined is not None:
+			return joined
+	# duplicates are not adjacent or there are nested keys of the same name, the top-level values are decoded one by one
+	return _loads_merging_keys( text )
+
+
+class ContentDecoder:
+	"""
+	Incremental decoder of the response body according to its Content-Encoding.
+	"""
+	_decompressor = None
+	_encoding = ""
+
+	def __init__( self, encoding ):
+		"""
+		:param encoding: value of Content-Encoding header, None for uncompressed response
+		:type encoding: str
+		"""
+		self._encoding = ( encoding or "identity" ).strip( ).lower( )
+		if self._encoding in ( "gzip", "x-gzip" ):
+			self._decompressor = zlib.decompressobj( 16 + zlib.MAX_WBITS )
+		elif self._encoding == "deflate":
+			self._decompressor = zlib.decompressobj( )
+		elif self._encoding != "identity":
+			raise utorrent.uTorrentError( "Unsupported content encoding: {}".format( encoding ) )
+
+	def decompress( self, buf ):
+		"""
+		:type buf: bytes
+		:rtype: bytes
+		"""
+		if self._decompressor is None:
+			return buf
+		try:
+			try:
+				return self._decompressor.decompress( buf )
+			except zlib.error:
+				# some servers send raw deflate stream without zlib header
+				if self._encoding != "deflate" or self._decompressor.unused_data or self._decompressor.eof:
+					raise
+				self._decompressor = zlib.decompressobj( -zlib.MAX_WBITS )
+				self._encoding = "raw deflate"
+				return self._decompressor.decompress( buf )
+		except zlib.error as e:
+			raise utorrent.uTorrentError( "Corrupt {} response: {}".format( self._encoding, e ) )
+
+	def flush( self ):
+		"""
+		Returns the rest of the decoded body, raises uTorrentError if the compressed stream is incomplete.
+
+		:rtype: bytes
+		"""
+		if self._decompressor is None:
+			return b""
+		out = self._decompressor.flush( )
+		if not self._decompressor.eof:
+			raise utorrent.uTorrentError( "Truncated {} response".format( self._encoding ) )
+		return out
+
+
+def set_nodelay( sock ):
+	"""
+	Disables Nagle algorithm on the socket, requests and multipart uploads are sent in several writes and on the reused connection
+	the last one would wait for the delayed ACK of the server.
+	"""
+	try:
+		sock.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+	except OSError as e:
+		# not every platform implements it
+		if e.errno != errno.ENOPROTOOPT:
+			raise
+
+
+class ConnectionPool:
+	"""
+	Thread-safe pool of HTTP connections to a single host. At most `size` connections are handed out at the same time, the
+	rest of the callers wait in acquire() until one is released.
+	"""
+	_factory = None
+	_size = 1
+	_idle = None
+	""" :type: queue.LifoQueue """
+	_slots = None
+	""" :type: threading.BoundedSemaphore """
+
+	@property
+	def size( self ):
+		return self._size
+
+	def __init__( self, factory, size = 1 ):
+		"""
+		:param factory: callable that creates a new http.client.HTTPConnection
+		:type size: int
+		"""
+		if size < 1:
+			raise utorrent.uTorrentError( "Connection pool size must be positive" )
+		self._factory = factory
+		self._size = size
+		# LIFO so that the most recently used connection, which is the most likely to still be open, is reused first
+		self._idle = queue.LifoQueue( )
+		self._slots = threading.BoundedSemaphore( size )
+
+	def acquire( self, timeout = None ):
+		"""
+		:type timeout: float
+		:rtype: http.client.HTTPConnection
+		"""
+		if not self._slots.acquire( timeout = timeout ):
+			raise utorrent.uTorrentError( "Timeout waiting for a free connection" )
+		try:
+			return self._idle.get_nowait( )
+		except queue.Empty:
+			pass
+		try:
+			return self._factory( )
+		except Exception:
+			self._slots.release( )
+			raise
+
+	def release( self, conn ):
+		"""
+		:type conn: http.client.HTTPConnection
+		"""
+		self._idle.put( conn )
+		self._slots.release( )
+
+	def close( self ):
+		while True:
+			try:
+				self._idle.get_nowait( ).close( )
+			except queue.Empty:
+				break
+
 
 class Connection:
-	_connection = None
+	_host = ""
+	_ssl_context = None
+	_pool = None
+	""" :type: ConnectionPool """
 	_request = None
-	_cookies = http.cookiejar.CookieJar( )
+	_cookies = None
+	""" :type: http.cookiejar.CookieJar """
 	_token = ""
+	_token_lock = None
+	""" :type: threading.Lock """
+	_stats_lock = None
+	""" :type: threading.Lock """
+
+	_compression = True
+	_max_url_length = 4096
+	_post_actions = frozenset( )
+	_bytes_received = 0
+	_bytes_decoded = 0
 
-	_retry_max = 3
+	_cache = None
+	""" :type: utorrent.cache.HostCache """
+	_cached_api = None
+	_cached_version = None
+	""" :type: utorrent.uTorrent.Version """
+
+	_retry_policy = None
+	""" :type: utorrent.retry.RetryPolicy """
+	_retry_budget = None
+	""" :type: utorrent.retry.RetryBudget """
+	_circuit_breaker = None
+	""" :type: utorrent.retry.CircuitBreaker """
 
 	_utorrent = None
 
+	_keep_alive = False
+	_instrumentation = None
+	""" :type: utorrent.instrument.Instrumentation """
+	_connect_count = 0
+	_reuse_count = 0
+	_reconnect_count = 0
+
 	@property
 	def request_obj( self ):
 		return self._request
 
-	def __init__(self, host, login, password, ssl=False, ssl_verify=True):
+	@property
+	def keep_alive( self ):
+		"""
+		Whether the underlying HTTP connection is reused between requests.
+
+		:rtype: bool
+		"""
+		return self._keep_alive
+
+	@property
+	def connect_count( self ):
+		"""
+		Number of requests that had to open a new connection to the server.
+
+		:rtype: int
+		"""
+		return self._connect_count
+
+	@property
+	def reuse_count( self ):
+		"""
+		Number of requests that were sent over an already open keep-alive connection.
+
+		:rtype: int
+		"""
+		return self._reuse_count
+
+	@property
+	def reconnect_count( self ):
+		"""
+		Number of times an idle keep-alive connection was found dropped by the server and transparently reopened.
+
+		:rtype: int
+		"""
+		return self._reconnect_count
+
+	@property
+	def pool_size( self ):
+		"""
+		Maximum number of requests that can be sent to the server simultaneously from different threads.
+
+		:rtype: int
+		"""
+		return self._pool.size
+
+	@property
+	def retry_policy( self ):
+		"""
+		:rtype: utorrent.retry.RetryPolicy
+		"""
+		return self._retry_policy
+
+	@property
+	def circuit_breaker( self ):
+		"""
+		Returns circuit breaker shared by all connections to this host, check its state to back off while WebUI is unhealthy.
+
+		:rtype: utorrent.retry.CircuitBreaker
+		"""
+		return self._circuit_breaker
+
+	@property
+	def retry_budget( self ):
+		"""
+		:rtype: utorrent.retry.RetryBudget
+		"""
+		return self._retry_budget
+
+	@property
+	def bytes_received( self ):
+		"""
+		Number of response body bytes received from the server, before decompression.
+
+		:rtype: int
+		"""
+		return self._bytes_received
+
+	@property
+	def bytes_decoded( self ):
+		"""
+		Number of response body bytes after decompression.
+
+		:rtype: int
+		"""
+		return self._bytes_decoded
+
+	@property
+	def cache( self ):
+		"""
+		Returns on-disk cache of the session data or None if caching is disabled.
+
+		:rtype: utorrent.cache.HostCache
+		"""
+		return self._cache
+
+	@property
+	def instrumentation( self ):
+		"""
+		Returns per-action request timings and counters, add listener to it to receive every single request record.
+
+		:rtype: utorrent.instrument.Instrumentation
+		"""
+		return self._instrumentation
+
+	def __init__(self, host, login, password, ssl=False, ssl_verify=True, keep_alive=False, pool_size=1, cache_dir=None, compression=True, retry_policy=None,
+	             max_url_length=4096, post_actions=None, instrumentation=None, retry_registry=None):
+		"""
+		:param max_url_length: actions with longer URL are split into several requests where possible
+		:param post_actions: names of actions which arguments are sent in the form-encoded request body instead of the URL,
+		                     only for WebUI versions that accept it
+		:type instrumentation: utorrent.instrument.Instrumentation
+		:param retry_registry: circuit breakers and retry budgets to share with other connections, utorrent.retry.registry by default;
+		                       the state of this connection is kept under "http://<host>/" ("https://" with ssl)
+		:type retry_registry: utorrent.retry.RetryRegistry
+		"""
 		if ssl:
 			self._url = "https://{}/".format( host )
+			self._ssl_context = None if ssl_verify else ssl_module._create_unverified_context()
 		else:
 			self._url = "http://{}/".format( host )
+		self._host = host
+		# shared by all threads, never modified after construction
 		self._request = urllib.request.Request( self._url )
-		if ssl:
-			ssl_context = None if ssl_verify else ssl_module._create_unverified_context()
-			self._connection = http.client.HTTPSConnection(host, context=ssl_context)
-		else:
-			self._connection = http.client.HTTPConnection( host )
-		self._connection.timeout = 10
+		self._cookies = http.cookiejar.CookieJar( )
+		self._stats_lock = threading.Lock( )
+		self._token_lock = threading.Lock( )
+		self._pool = ConnectionPool( self._create_connection, pool_size )
+		self._keep_alive = keep_alive
+		self._instrumentation = instrumentation if instrumentation is not None else utorrent.instrument.Instrumentation( )
+		self._compression = compression
+		self._max_url_length = max_url_length
+		if post_actions is not None:
+			self._post_actions = frozenset( post_actions )
+		self._retry_policy = retry_policy if retry_policy is not None else utorrent.retry.RetryPolicy( )
+		registry = retry_registry if retry_registry is not None else utorrent.retry.registry
+		self._circuit_breaker, self._retry_budget = registry.for_host( self._url )
 		self._request.add_header( "Authorization", "Basic " + b64encode( "{}:{}".format( login, password ).encode( "latin1" ) ).decode( "ascii" ) )
-		self._fetch_token( )
+		if cache_dir is not None:
+			self._cache = utorrent.cache.HostCache( cache_dir, self._url.split( ":", 1 )[0] + "_" + host, login )
+		if not self._load_session( ):
+			self._fetch_token( )
+
+	def _create_connection( self ):
+		if self._url.startswith( "https" ):
+			return http.client.HTTPSConnection( self._host, timeout = self._retry_policy.timeout, context = self._ssl_context )
+		else:
+			return http.client.HTTPConnection( self._host, timeout = self._retry_policy.timeout )
 
-	def _make_request( self, loc, headers, data = None, retry = True ):
+	def close( self ):
+		"""
+		Closes all idle connections in the pool.
+		"""
+		self._pool.close( )
+
+	def _connect( self, conn, record ):
+		# connecting explicitly instead of letting request( ) do it separates handshake time from the server think time
+		start = time.monotonic( )
+		try:
+			conn.connect( )
+			# http.client does it too, but the pooled connections must not depend on it
+			set_nodelay( conn.sock )
+		finally:
+			record.connect += time.monotonic( ) - start
+
+	def _request_size( self, method, loc, headers, data ):
+		# approximate, http.client adds a few headers of its own
+		size = len( method ) + len( self._request.selector ) + len( loc ) + len( self._host ) + 23
+		size += sum( len( k ) + len( v ) + 4 for k, v in headers.items( ) )
+		if data is not None:
+			size += len( data )
+		return size
+
+	def _send_request( self, conn, loc, headers, data, record ):
+		method = "GET" if data is None else "POST"
+		# http.client drops the socket once the connection is closed, so it tells whether this request opens a new one
+		reused = conn.sock is not None
+		try:
+			if not reused:
+				self._connect( conn, record )
+			start = time.monotonic( )
+			try:
+				conn.request( method, self._request.selector + loc, data, headers )
+				resp = conn.getresponse( )
+			finally:
+				record.wait += time.monotonic( ) - start
+		except ( http.client.RemoteDisconnected, ConnectionResetError, ConnectionAbortedError, BrokenPipeError ):
+			if not reused:
+				raise
+			# server has closed idle keep-alive connection, this is not an error, just open a new one
+			conn.close( )
+			with self._stats_lock:
+				self._reconnect_count += 1
+			record.reconnects += 1
+			reused = False
+			self._connect( conn, record )
+			start = time.monotonic( )
+			try:
+				conn.request( method, self._request.selector + loc, data, headers )
+				resp = conn.getresponse( )
+			finally:
+				record.wait += time.monotonic( ) - start
+		record.bytes_sent += self._request_size( method, loc, headers, data )
+		with self._stats_lock:
+			if reused:
+				self._reuse_count += 1
+			else:
+				self._connect_count += 1
+		return resp
+
+	def _release_connection( self, conn, resp, keep_open = False ):
+		if not ( self._keep_alive or keep_open ) or resp.will_close:
+			conn.close( )
+		self._pool.release( conn )
+
+	def _cookie_header( self ):
+		# iterating the jar takes its internal lock, so this is safe while other threads extract cookies
+		cookies = ["{}={}".format( utorrent._url_quote( c.name ), utorrent._url_quote( c.value ) ) for c in self._cookies]
+		if len( cookies ) > 0:
+			return "; ".join( cookies )
+		return None
+
+	@staticmethod
+	def _remaining( deadline ):
+		if deadline is None:
+			return None
+		return deadline - time.monotonic( )
+
+	def _set_timeout( self, conn, deadline ):
+		timeout = self._retry_policy.timeout
+		remaining = self._remaining( deadline )
+		if remaining is not None:
+			if remaining <= 0:
+				raise utorrent.uTorrentError( "Deadline exceeded" )
+			timeout = min( timeout, remaining )
+		conn.timeout = timeout
+		if conn.sock is not None:
+			conn.sock.settimeout( timeout )
+
+	def _make_request( self, loc, headers, data, retry, deadline, record ):
 		last_e = None
 		utserver_retry = False
-		retries = 0
-		max_retries = self._retry_max if retry else 1
+		attempt = 0
+		max_retries = self._retry_policy.max_retries if retry else 1
+		self._circuit_breaker.check( )
+		remaining = self._remaining( deadline )
+		conn = self._pool.acquire( None if remaining is None else max( 0, remaining ) )
 		try:
-			while retries < max_retries or utserver_retry:
+			while True:
 				try:
-					self._request.data = data
-					self._connection.request( self._request.get_method( ), self._request.selector + loc, self._request.data, headers )
-					resp = self._connection.getresponse( )
-					if resp.status == 400:
-						last_e = utorrent.uTorrentError( resp.read( ).decode( "utf8" ).strip( ) )
-						# if uTorrent server alpha is bound to the same port as WebUI then it will respond with "invalid request" to the first request in the connection
-						# apparently this is no longer the case, TODO: remove this hack
-						if ( not self._utorrent or type( self._utorrent ) == utorrent.uTorrent.LinuxServer ) and not utserver_retry:
-							utserver_retry = True
-							continue
-						raise last_e
-					elif resp.status == 404 or resp.status == 401:
-						raise utorrent.uTorrentError( "Request {}: {}".format( loc, resp.reason ) )
-					elif resp.status != 200 and resp.status != 206:
-						raise utorrent.uTorrentError( "{}: {}".format( resp.reason, resp.status ) )
-					self._cookies.extract_cookies( resp, self._request )
-					if len( self._cookies ) > 0:
-						self._request.add_header( "Cookie", "; ".join(
-							["{}={}".format( utorrent._url_quote( c.name ), utorrent._url_quote( c.value ) ) for c in self._cookies] ) )
-					return resp
+					self._set_timeout( conn, deadline )
+					cookie = self._cookie_header( )
+					if cookie is not None:
+						headers["Cookie"] = cookie
+					resp = self._send_request( conn, loc, headers, data, record )
+					if resp.status >= 500:
+						# server is overloaded or broken, worth retrying later
+						last_e = utorrent.uTorrentError( "{}: {}".format( resp.reason, resp.status ) )
+						conn.close( )
+					else:
+						# any response, even an error one, means that WebUI is alive
+						self._circuit_breaker.record_success( )
+						self._retry_budget.deposit( )
+						if resp.status == 400:
+							last_e = utorrent.uTorrentError( resp.read( ).decode( "utf8" ).strip( ) )
+							# if uTorrent server alpha is bound to the same port as WebUI then it will respond with "invalid request" to the first request in the connection
+							# apparently this is no longer the case, TODO: remove this hack
+							if ( not self._utorrent or type( self._utorrent ) == utorrent.uTorrent.LinuxServer ) and not utserver_retry:
+								utserver_retry = True
+								continue
+							raise last_e
+						elif resp.status == 404 or resp.status == 401:
+							raise utorrent.uTorrentError( "Request {}: {}".format( loc, resp.reason ) )
+						elif resp.status != 200 and resp.status != 206:
+							raise utorrent.uTorrentError( "{}: {}".format( resp.reason, resp.status ) )
+						self._cookies.extract_cookies( resp, self._request )
+						return conn, resp
 				# retry when utorrent returns bad data
 				except ( http.client.CannotSendRequest, http.client.BadStatusLine ) as e:
 					last_e = e
-					self._connection.close( )
+					conn.close( )
 				# name resolution failed
 				except socket.gaierror as e:
 					raise utorrent.uTorrentError( e.strerror )
+				# retry on timeout
+				except socket.timeout:
+					last_e = utorrent.uTorrentError( "Timeout after {} tries".format( attempt + 1 ) )
+					conn.close( )
 				# socket errors
 				except socket.error as e:
-					# retry on timeout
-					if str( e ) == "timed out": # some peculiar handling for timeout error
-						last_e = utorrent.uTorrentError( "Timeout after {} tries".format( max_retries ) )
-						self._connection.close( )
-					# retry after pause on specific windows errors
-					elif e.errno == 10053 or e.errno == 10054:
+					# retry on specific windows errors
+					if e.errno == 10053 or e.errno == 10054:
 						# Windows specific socket errors:
 						# 10053 - An established connection was aborted by the software in your host machine
 						# 10054 - An existing connection was forcibly closed by the remote host
 						last_e = e
-						self._connection.close( )
-						time.sleep( 2 )
-					elif e.errno == errno.ECONNREFUSED or e.errno == errno.ECONNRESET or errno == errno.EHOSTUNREACH:
+						conn.close( )
+					elif e.errno == errno.ECONNREFUSED or e.errno == errno.ECONNRESET or e.errno == errno.EHOSTUNREACH:
+						self._circuit_breaker.record_failure( )
 						raise utorrent.uTorrentError( e.strerror )
 					else:
 						raise e
-				retries += 1
-			if last_e:
-				raise last_e
+				self._circuit_breaker.record_failure( )
+				attempt += 1
+				if attempt >= max_retries:
+					break
+				if not self._retry_budget.withdraw( ):
+					last_e = utorrent.uTorrentError( "Retry budget exhausted, last error: {}".format( last_e ) )
+					break
+				delay = self._retry_policy.delay( attempt )
+				remaining = self._remaining( deadline )
+				if remaining is not None and remaining <= delay:
+					last_e = utorrent.uTorrentError( "Deadline exceeded, last error: {}".format( last_e ) )
+					break
+				time.sleep( delay )
+				record.retries += 1
+				self._circuit_breaker.check( )
+			raise last_e
 		except Exception as e:
-			self._connection.close( )
+			conn.close( )
+			self._pool.release( conn )
 			raise e
-		return None
 
-	def _get_data( self, loc, data = None, retry = True, range_start = None, range_len = None, save_buffer = None, progress_cb = None ):
+	def _request_headers( self, data = None, range_start = None, range_len = None, save_buffer = None, form = None ):
+		"""
+		Builds headers for a single request, returns headers and request body.
+		"""
 		headers = { k: v for k, v in self._request.header_items( ) }
-		if data:
-			bnd = email.generator._make_boundary( data )
-			headers["Content-Type"] = "multipart/form-data; boundary={}".format( bnd )
-			data = data.replace( "{{BOUNDARY}}", bnd )
+		# file downloads are stored as is, so they must not be compressed
+		if self._compression and save_buffer is None:
+			headers["Accept-Encoding"] = "gzip, deflate"
+		if form is not None:
+			headers["Content-Type"] = "application/x-www-form-urlencoded"
+			data = form.encode( "ascii" )
+		elif data is not None:
+			headers["Content-Type"] = data.content_type
+			# body is sent in parts, so its length must be known beforehand to avoid chunked encoding which uTorrent doesn't understand
+			headers["Content-Length"] = str( len( data ) )
 		if range_start is not None:
 			if range_len is None or range_len == 0:
 				range_end = ""
 			else:
 				range_end = range_start + range_len - 1
 			headers["Range"] = "bytes={}-{}".format( range_start, range_end )
-		resp = self._make_request( loc, headers, data, retry )
-		if save_buffer:
-			read = 0
-			resp_len = resp.length
-			content_range = resp.getheader( "Content-Range" )
-			if content_range is not None:
-				m = re.match( "^bytes (\\d+)-\\d+/(\\d+)$", content_range )
-				if m is not None:
-					resp_len = int( m.group( 2 ) )
-			while True:
-				buf = resp.read( 10240 )
-				read += len( buf )
-				if progress_cb:
-					progress_cb( range_start, read, resp_len )
-				if len( buf ) == 0:
-					break
-				save_buffer.write( buf )
-			self._connection.close( )
-			return None
-		out = resp.read( ).decode( "utf8" )
-		self._connection.close( )
-		return out
+		return headers, data
 
-	def _fetch_token( self ):
-		data = self._get_data( "gui/token.html" )
+	@staticmethod
+	def _parse_content_range( resp_len, content_range ):
+		if content_range is not None:
+			m = re.match( "^bytes (\\d+)-\\d+/(\\d+)$", content_range )
+			if m is not None:
+				return int( m.group( 2 ) )
+		return resp_len
+
+	@staticmethod
+	def _parse_token( data ):
 		match = re.search( "<div .*?id='token'.*?>(.+?)</div>", data )
 		if match is None:
 			raise utorrent.uTorrentError( "Can't fetch security token" )
-		self._token = match.group( 1 )
+		return match.group( 1 )
+
+	@staticmethod
+	def _decode_response( res ):
+		if res:
+			return decode_json( res )
+		else:
+			return ""
+
+	def _get_data( self, loc, data = None, retry = True, range_start = None, range_len = None, save_buffer = None, progress_cb = None,
+	               deadline = None, form = None, keep_open = False, record = None ):
+		"""
+		:param record: instrumentation record filled by this request, if not given the request is recorded under its location
+		:type record: utorrent.instrument.RequestRecord
+		"""
+		if record is not None:
+			return self._get_response_body( loc, data, retry, range_start, range_len, save_buffer, progress_cb, deadline, form, keep_open, record )
+		record = utorrent.instrument.RequestRecord( loc.split( "?", 1 )[0] )
+		try:
+			return self._get_response_body( loc, data, retry, range_start, range_len, save_buffer, progress_cb, deadline, form, keep_open, record )
+		except Exception as e:
+			record.error = str( e )
+			raise
+		finally:
+			self._instrumentation.record( record )
+
+	def _get_response_body( self, loc, data, retry, range_start, range_len, save_buffer, progress_cb, deadline, form, keep_open, record ):
+		headers, data = self._request_headers( data, range_start, range_len, save_buffer, form )
+		conn, resp = self._make_request( loc, headers, data, retry, deadline, record )
+		start = time.monotonic( )
+		try:
+			if save_buffer:
+				read = 0
+				resp_len = self._parse_content_range( resp.length, resp.getheader( "Content-Range" ) )
+				while True:
+					buf = resp.read( 10240 )
+					read += len( buf )
+					record.bytes_received += len( buf )
+					if progress_cb:
+						progress_cb( range_start, read, resp_len )
+					if len( buf ) == 0:
+						break
+					save_buffer.write( buf )
+				out = None
+			else:
+				decoder = ContentDecoder( resp.getheader( "Content-Encoding" ) )
+				received = 0
+				out = []
+				while True:
+					buf = resp.read( 65536 )
+					if len( buf ) == 0:
+						break
+					received += len( buf )
+					out.append( decoder.decompress( buf ) )
+				out.append( decoder.flush( ) )
+				out = b"".join( out )
+				self._count_bytes( received, len( out ) )
+				record.bytes_received += received
+				out = out.decode( "utf8" )
+		except Exception:
+			# response is not fully read, connection can't be reused
+			conn.close( )
+			self._pool.release( conn )
+			raise
+		finally:
+			record.transfer += time.monotonic( ) - start
+		self._release_connection( conn, resp, keep_open )
+		return out
+
+	def _count_bytes( self, received, decoded ):
+		with self._stats_lock:
+			self._bytes_received += received
+			self._bytes_decoded += decoded
+
+	def _load_session( self ):
+		if self._cache is None:
+			return False
+		session = self._cache.load( "session" )
+		if session is None or not session.get( "token" ):
+			return False
+		self._token = session["token"]
+		utorrent.cache.cookies_from_list( self._cookies, session.get( "cookies", [] ) )
+		if session.get( "api" ) in self._api_classes:
+			self._cached_api = session["api"]
+			if session.get( "version" ) is not None:
+				self._cached_version = utorrent.uTorrent.Version.from_dict( session["version"] )
+		return True
+
+	def _save_session( self ):
+		if self._cache is None:
+			return
+		self._cache.save( "session", {
+			"token": self._token,
+			"cookies": utorrent.cache.cookies_to_list( self._cookies ),
+			"api": self._cached_api,
+			"version": self._cached_version.as_dict( ) if self._cached_version is not None else None,
+		} )
+
+	def _fetch_token( self ):
+		self._token = self._parse_token( self._get_data( "gui/token.html" ) )
+		self._save_session( )
+
+	def _refresh_token( self, rejected_token ):
+		with self._token_lock:
+			# other thread could have already refreshed it
+			if self._token == rejected_token:
+				self._cookies.clear( )
+				self._fetch_token( )
 
 	def _action_val( self, val ):
 		if isinstance( val, bool ):
 			val = int( val )
 		return str( val )
 
-	def _action( self, action, params = None, params_str = None ):
+	def _action_args( self, params = None, params_str = None ):
 		args = []
 		if params:
 			for k, v in params.items( ):
@@ -167,61 +786,256 @@ class Connection:
 				else:
 					args.append( "{}={}".format( utorrent._url_quote( str( k ) ), utorrent._url_quote( self._action_val( v ) ) ) )
 		if params_str:
-			params_str = "&" + params_str
-		else:
-			params_str = ""
+			# params_str can be given as list of preformatted argument groups, e.g. [ "hash=...&s=label&v=...", ... ]
+			if utorrent.is_list_type( params_str ):
+				args.extend( params_str )
+			else:
+				args.append( params_str )
+		return "&".join( args )
+
+	def _action( self, action, params = None, params_str = None ):
+		args = self._action_args( params, params_str )
 		if action == "list":
-			args.insert( 0, "token=" + self._token )
-			args.insert( 1, "list=1" )
+			prefix = ["token=" + self._token, "list=1"]
 			section = "gui/"
 		elif action == "proxy":
+			prefix = []
 			section = "proxy"
 		else:
-			args.insert( 0, "token=" + self._token )
-			args.insert( 1, "action=" + utorrent._url_quote( str( action ) ) )
+			prefix = ["token=" + self._token, "action=" + utorrent._url_quote( str( action ) )]
 			section = "gui/"
-		return section + "?" + "&".join( args ) + params_str
+		return section + "?" + "&".join( prefix + ( [args] if args else [] ) )
 
-	def do_action( self, action, params = None, params_str = None, data = None, retry = True, range_start = None, range_len = None, save_buffer = None,
-	               progress_cb = None ):
-		# uTorrent can send incorrect overlapping array objects, this will fix them, converting them to list
-		def obj_hook( obj ):
-			out = { }
-			for k, v in obj:
-				if k in out:
+	def _action_batches( self, action, params = None, params_str = None ):
+		"""
+		Splits action arguments into several ( params, params_str ) pairs so that none of the request URLs exceeds the length limit. Only
+		list argument can be split: the single list valued parameter (e.g. hash) or the groups of params_str list.
+
+		:rtype: list
+		"""
+		if action in ( "list", "proxy" ) or action in self._post_actions:
+			return [( params, params_str )]
+		if len( self._action( action, params, params_str ) ) + len( self._request.selector ) <= self._max_url_length:
+			return [( params, params_str )]
+		list_keys = [k for k, v in params.items( ) if utorrent.is_list_type( v )] if params else []
+		if len( list_keys ) > 1 or ( len( list_keys ) == 1 and params_str ):
+			# values of several lists are related to each other, they can't be split independently
+			return [( params, params_str )]
+		if len( list_keys ) == 1:
+			base_params = { k: v for k, v in params.items( ) if k != list_keys[0] }
+			quoted_key = utorrent._url_quote( str( list_keys[0] ) )
+			groups = ["{}={}".format( quoted_key, utorrent._url_quote( self._action_val( i ) ) ) for i in params[list_keys[0]]]
+		elif utorrent.is_list_type( params_str ):
+			base_params = params
+			groups = list( params_str )
+		else:
+			return [( params, params_str )]
+		base_len = len( self._action( action, base_params ) ) + len( self._request.selector )
+		out = []
+		chunk = []
+		chunk_len = base_len
+		for group in groups:
+			if len( chunk ) > 0 and chunk_len + 1 + len( group ) > self._max_url_length:
+				out.append( ( base_params, chunk ) )
+				chunk = []
+				chunk_len = base_len
+			chunk.append( group )
+			chunk_len += 1 + len( group )
+		if len( chunk ) > 0:
+			out.append( ( base_params, chunk ) )
+		return out
+
+	@staticmethod
+	def _merge_responses( responses ):
+		"""
+		Combines decoded responses of the split action: lists are concatenated, other values are taken from the last response.
+		"""
+		out = responses[0]
+		for res in responses[1:]:
+			if not isinstance( res, dict ) or not isinstance( out, dict ):
+				out = res
+				continue
+			for k, v in res.items( ):
+				if k in out and isinstance( out[k], list ) and isinstance( v, list ):
 					out[k].extend( v )
 				else:
 					out[k] = v
-			return out
+		return out
 
-		res = self._get_data( self._action( action, params, params_str ), data = data, retry = retry, range_start = range_start, range_len = range_len,
-		                      save_buffer = save_buffer, progress_cb = progress_cb )
-		if res:
-			return json.loads( res, object_pairs_hook = obj_hook )
+	def _single_action( self, action, params = None, params_str = None, data = None, retry = True, range_start = None, range_len = None,
+	                    save_buffer = None, progress_cb = None, deadline = None, keep_open = False, refresh_token = True ):
+		record = utorrent.instrument.RequestRecord( action )
+		try:
+			res = self._request_action( action, params, params_str, data, retry, range_start, range_len, save_buffer, progress_cb, deadline,
+			                            keep_open, record, refresh_token )
+			start = time.monotonic( )
+			res = self._decode_response( res )
+			record.decode = time.monotonic( ) - start
+			return res
+		except Exception as e:
+			record.error = str( e )
+			raise
+		finally:
+			self._instrumentation.record( record )
+
+	@staticmethod
+	def _token_rejected( e ):
+		"""
+		Returns True if the error may mean that the token was rejected.
+
+		:type e: utorrent.uTorrentError
+		"""
+		# uTorrent responds with "invalid request" when the token or session cookie is no longer valid: the cached one can be stale and
+		# the session of the long running client can expire
+		return len( e.args ) > 0 and e.args[0] == "invalid request"
+
+	def _with_token( self, send, refresh = True ):
+		"""
+		Calls send( ) that makes the request using the current token, repeats it once with the new token if the old one was rejected.
+
+		:param refresh: False if "invalid request" is the expected answer to the request, then it's not taken for the rejected token
+		"""
+		token = self._token
+		try:
+			return send( )
+		except utorrent.uTorrentError as e:
+			if not refresh or not self._token_rejected( e ):
+				raise e
+			self._refresh_token( token )
+			return send( )
+
+	def _request_action( self, action, params, params_str, data, retry, range_start, range_len, save_buffer, progress_cb, deadline, keep_open,
+	                     record, refresh_token = True ):
+		def send( ):
+			form = None
+			if action in self._post_actions:
+				loc = self._action( action )
+				form = self._action_args( params, params_str )
+			else:
+				loc = self._action( action, params, params_str )
+			return self._get_data( loc, data = data, retry = retry, range_start = range_start, range_len = range_len, save_buffer = save_buffer,
+			                       progress_cb = progress_cb, deadline = deadline, form = form, keep_open = keep_open, record = record )
+
+		return self._with_token( send, refresh_token )
+
+	def do_action( self, action, params = None, params_str = None, data = None, retry = True, range_start = None, range_len = None, save_buffer = None,
+	               progress_cb = None, timeout = None ):
+		"""
+		:param params_str: preformatted arguments, either a string or a list of argument groups that can be sent in separate requests
+		:param timeout: deadline in seconds for the whole call including all retries, None to only limit single attempts by retry policy
+		"""
+		deadline = time.monotonic( ) + timeout if timeout is not None else None
+		if data is not None or save_buffer is not None:
+			batches = [( params, params_str )]
 		else:
-			return ""
+			batches = self._action_batches( action, params, params_str )
+		responses = []
+		for i, ( batch_params, batch_params_str ) in enumerate( batches ):
+			# keep the connection open between the parts of the split action
+			responses.append( self._single_action( action, batch_params, batch_params_str, data = data, retry = retry, range_start = range_start,
+			                                       range_len = range_len, save_buffer = save_buffer, progress_cb = progress_cb, deadline = deadline,
+			                                       keep_open = i < len( batches ) - 1 ) )
+		return self._merge_responses( responses )
+
+	def stream_action( self, action, params = None, params_str = None, timeout = None ):
+		"""
+		Sends the action and yields its response body as str chunks while it's being received, the body is not decoded as JSON. Connection
+		is released when the generator is exhausted, closing it early drops the connection.
+
+		:param timeout: deadline in seconds for sending the request including all retries
+		"""
+		deadline = time.monotonic( ) + timeout if timeout is not None else None
+		record = utorrent.instrument.RequestRecord( action )
+		try:
+			headers, data = self._request_headers( )
+			conn, resp = self._with_token( lambda: self._make_request( self._action( action, params, params_str ), dict( headers ), None, True,
+			                                                           deadline, record ) )
+			yield from self._iter_response_body( conn, resp, record )
+		except Exception as e:
+			record.error = str( e )
+			raise
+		finally:
+			self._instrumentation.record( record )
+
+	def _iter_response_body( self, conn, resp, record ):
+		decoder = ContentDecoder( resp.getheader( "Content-Encoding" ) )
+		text_decoder = codecs.getincrementaldecoder( "utf8" )( )
+		received = 0
+		decoded = 0
+		complete = False
+		try:
+			while True:
+				start = time.monotonic( )
+				buf = resp.read( 65536 )
+				received += len( buf )
+				final = len( buf ) == 0
+				buf = decoder.flush( ) if final else decoder.decompress( buf )
+				decoded += len( buf )
+				text = text_decoder.decode( buf, final )
+				record.transfer += time.monotonic( ) - start
+				if text:
+					yield text
+				if final:
+					break
+			complete = True
+		finally:
+			self._count_bytes( received, decoded )
+			record.bytes_received += received
+			if complete:
+				self._release_connection( conn, resp )
+			else:
+				# response is not fully read, connection can't be reused
+				conn.close( )
+				self._pool.release( conn )
+
+	@staticmethod
+	def _api_for_version( ver ):
+		"""
+		:type ver: utorrent.uTorrent.Version
+		:rtype: str
+		"""
+		if ver.product == "server":
+			return "linux"
+		elif ver.product == "desktop" or ver.product == "PRODUCT_CODE":
+			if ver.major == 3:
+				return "falcon"
+			else:
+				return "desktop"
+		else:
+			raise utorrent.uTorrentError( "Unsupported WebUI API" )
+
+	_api_classes = {
+		"linux": utorrent.uTorrent.LinuxServer,
+		"desktop": utorrent.uTorrent.Desktop,
+		"falcon": utorrent.uTorrent.Falcon,
+	}
 
 	def utorrent( self, api = None ):
-		if api == "linux":
-			return utorrent.uTorrent.LinuxServer( self )
-		elif api == "desktop":
-			return utorrent.uTorrent.Desktop( self )
-		elif api == "falcon":
-			return utorrent.uTorrent.Falcon( self )
+		if api in self._api_classes:
+			return self._api_classes[api]( self )
+		elif self._cached_api is not None:
+			return self._api_classes[self._cached_api]( self, self._cached_version )
 		else: # auto-detect
+			# windows desktop uTorrent client rejects getversion, so the rejection doesn't make the cached token refreshed
 			try:
-				ver = utorrent.uTorrent.Version( self.do_action( "getversion", retry = False ) )
+				ver = utorrent.uTorrent.Version( self._single_action( "getversion", retry = False, refresh_token = False ) )
 			except utorrent.uTorrentError as e:
-				if e.args[0] == "invalid request": # windows desktop uTorrent client
-					ver = utorrent.uTorrent.Version.detect_from_settings( self.do_action( "getsettings" ) )
-				else:
+				if e.args[0] != "invalid request":
 					raise e
-			if ver.product == "server":
-				return utorrent.uTorrent.LinuxServer( self, ver )
-			elif ver.product == "desktop" or ver.product == "PRODUCT_CODE":
-				if ver.major == 3:
-					return utorrent.uTorrent.Falcon( self, ver )
-				else:
-					return utorrent.uTorrent.Desktop( self, ver )
-			else:
-				raise utorrent.uTorrentError( "Unsupported WebUI API" )
+				token = self._token
+				settings = self.do_action( "getsettings" )
+				ver = None
+				if self._token != token:
+					# the token was stale, so getversion could have been rejected because of it
+					try:
+						ver = utorrent.uTorrent.Version( self.do_action( "getversion", retry = False ) )
+					except utorrent.uTorrentError as e:
+						if e.args[0] != "invalid request":
+							raise e
+				if ver is None:
+					ver = utorrent.uTorrent.Version.detect_from_settings( settings )
+			api = self._api_for_version( ver )
+			self._cached_api = api
+			self._cached_version = ver
+			self._save_session( )
+			return self._api_classes[api]( self, ver )
@@ -6,49 +6,73 @@ import utorrent.priority
 import utorrent.uTorrent
 
 class File:
-	_utorrent = None
-
-	hash_code = ""
-	index = 0
-	file_hash = ""
-	name = ""
-	size = 0
-	size_h = ""
-	downloaded = 0
-	downloaded_h = ""
-	priority = None
-	progress = 0.
+	"""
+	File row of the getfiles response, derived and human-readable fields are computed when they are accessed.
+	"""
+	# __dict__ keeps the attributes set by the users of the class, it's created only when there are any
+	__slots__ = ( "_utorrent", "_row", "hash_code", "index", "__dict__" )
+
+	# row of the file created without data
+	_empty_row = ( "", 0, 0, 2 )
+
+	name = utorrent._item_property( 0 )
+	size = utorrent._item_property( 1 )
+	downloaded = utorrent._item_property( 2 )
 
 	def __init__( self, utorrent, parent_hash, index, file = None ):
+		"""
+		:param parent_hash: hash of the torrent, it's checked by the caller once for all its files
+		:param file: row of the getfiles response, it's kept as is
+		"""
 		self._utorrent = utorrent
-		self._utorrent.check_hash( parent_hash )
 		self.hash_code = parent_hash
 		self.index = index
-		self.file_hash = "{}.{}".format( self.hash_code, self.index )
-		if file:
-			self.fill( file )
+		self.fill( file if file else self._empty_row )
 
 	def __str__( self ):
 		return "{} {}".format( self.file_hash, self.name )
 
+	@property
+	def file_hash( self ):
+		return "{}.{}".format( self.hash_code, self.index )
+
+	@property
+	def priority( self ):
+		"""
+		:rtype: utorrent.priority.Priority
+		"""
+		return utorrent.priority.Priority( self._row[3] )
+
+	@property
+	def progress( self ):
+		if self.size == 0:
+			return 100
+		return round( float( self.downloaded ) / self.size * 100, 1 )
+
+	@property
+	def size_h( self ):
+		return utorrent.human_size( self.size )
+
+	@property
+	def downloaded_h( self ):
+		return utorrent.human_size( self.downloaded )
+
 	def verbose_str( self ):
 		return "{: <44} [{: <15}] {: >5}% ({: >9} / {: >9}) {}".format(self.file_hash, str(self.priority), self.progress,
 		                                                               self.downloaded_h, self.size_h, self.name)
 
 	def fill( self, file ):
-		self.name, self.size, self.downloaded, priority = file[:4]
-		self.priority = utorrent.priority.Priority( priority )
-		if self.size == 0:
-			self.progress = 100
-		else:
-			self.progress = round( float( self.downloaded ) / self.size * 100, 1 )
-		self.size_h = utorrent.human_size( self.size )
-		self.downloaded_h = utorrent.human_size( self.downloaded )
+		"""
+		Replaces the row the file reads its fields from.
+
+		:type file: list
+		"""
+		self._row = file
 
 	def set_priority( self, priority ):
 		self._utorrent.file_set_priority( { self.file_hash: priority } )
 
 
 class File_API2( File ):
-	def fill( self, file ):
-		File.fill( self, file[:4] )
+	# Falcon rows have more fields, only the first 4 are used
+	__slots__ = ( )
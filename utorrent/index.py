@@ -0,0 +1,259 @@
+"""
+Index
+
+Secondary indexes of the cached torrent rows, kept up to date with the list deltas so that selective lookups don't scan every torrent.
+"""
+
+import bisect
+
+from utorrent.table import STATUS_BITS
+
+
+def _label_keys( row ):
+	return ( row[11], )
+
+
+def _status_keys( row ):
+	return tuple( name for name, bit in STATUS_BITS.items( ) if row[1] & bit )
+
+
+def _download_dir_keys( row ):
+	# only utorrent.torrent.Torrent_API2 rows have the download directory
+	return ( row[26], ) if len( row ) > 26 else ( )
+
+
+def _trigrams( text ):
+	text = text.lower( )
+	return { text[i:i + 3] for i in range( len( text ) - 2 ) }
+
+
+def _name_keys( row ):
+	return _trigrams( row[2] )
+
+
+class _KeyIndex:
+	"""
+	Mapping of the keys derived from the row to the hashes of the torrents having them.
+	"""
+	_keys = None
+	""" callable returning keys of the row """
+	_hashes = None
+	""" :type: dict[object, set[str]] """
+
+	def __init__( self, keys, rows ):
+		"""
+		:param keys: callable returning keys of the row
+		:type rows: collections.abc.Iterable[list]
+		"""
+		self._keys = keys
+		self._hashes = { }
+		for row in rows:
+			self.add( row )
+
+	def get( self, key ):
+		"""
+		Returns copy of the hashes having the key.
+
+		:rtype: set[str]
+		"""
+		return set( self._hashes.get( key, ( ) ) )
+
+	def members( self, key ):
+		"""
+		Returns the hashes having the key without copying them.
+
+		:rtype: set[str]
+		"""
+		return self._hashes.get( key, frozenset( ) )
+
+	def keys( self ):
+		return self._hashes.keys( )
+
+	def add( self, row ):
+		for key in self._keys( row ):
+			self._hashes.setdefault( key, set( ) ).add( row[0] )
+
+	def remove( self, row ):
+		self._discard( row[0], self._keys( row ) )
+
+	def update( self, old, new ):
+		old_keys = set( self._keys( old ) )
+		new_keys = set( self._keys( new ) )
+		self._discard( new[0], old_keys - new_keys )
+		for key in new_keys - old_keys:
+			self._hashes.setdefault( key, set( ) ).add( new[0] )
+
+	def _discard( self, hsh, keys ):
+		for key in keys:
+			hashes = self._hashes.get( key )
+			if hashes is not None:
+				hashes.discard( hsh )
+				if len( hashes ) == 0:
+					del self._hashes[key]
+
+
+class TorrentIndex:
+	"""
+	Indexes of the torrents by label, status flag, download directory, name substring and hash prefix. Every index is built on its
+	first use and from then on is updated with the changed rows only.
+	"""
+	_rows = None
+	""" :type: dict[str, list] cached rows keyed by hash, shared with the client """
+	_indexes = None
+	""" :type: dict[str, _KeyIndex] """
+	_sorted_hashes = None
+	""" :type: list[str] """
+	_requests = None
+	""" :type: dict[str, int] number of times the index that isn't built yet was considered """
+
+	_key_functions = {
+		"label": _label_keys,
+		"status": _status_keys,
+		"download_dir": _download_dir_keys,
+		"name": _name_keys,
+	}
+
+	def __init__( self, rows ):
+		"""
+		:param rows: cached rows keyed by hash, the index doesn't copy them, so it must be updated along with every change to them
+		:type rows: dict[str, list]
+		"""
+		self._rows = rows
+		self._indexes = { }
+		self._requests = { }
+
+	def __len__( self ):
+		return len( self._rows )
+
+	def __contains__( self, hsh ):
+		return hsh in self._rows
+
+	def _index( self, name ):
+		"""
+		:rtype: _KeyIndex
+		"""
+		index = self._indexes.get( name )
+		if index is None:
+			index = self._indexes[name] = _KeyIndex( self._key_functions[name], self._rows.values( ) )
+		return index
+
+	def worth_using( self, name ):
+		"""
+		Returns True if the lookup in the index is cheaper than the scan of the rows. Building the name index costs as much as a few
+		scans, so it's built only when it's asked for the second time, others are cheap to build.
+
+		:param name: label, status, download_dir or name
+		:rtype: bool
+		"""
+		if name != "name" or name in self._indexes:
+			return True
+		self._requests[name] = self._requests.get( name, 0 ) + 1
+		return self._requests[name] > 1
+
+	def add( self, row ):
+		"""
+		Adds the row of the new torrent.
+
+		:type row: list
+		"""
+		for index in self._indexes.values( ):
+			index.add( row )
+		if self._sorted_hashes is not None:
+			bisect.insort( self._sorted_hashes, row[0] )
+
+	def remove( self, row ):
+		"""
+		Removes the row of the torrent that is not there anymore.
+
+		:type row: list
+		"""
+		for index in self._indexes.values( ):
+			index.remove( row )
+		if self._sorted_hashes is not None:
+			i = bisect.bisect_left( self._sorted_hashes, row[0] )
+			if i < len( self._sorted_hashes ) and self._sorted_hashes[i] == row[0]:
+				del self._sorted_hashes[i]
+
+	def update( self, old, new ):
+		"""
+		Replaces the row of the torrent, old is None if the torrent is new.
+
+		:type old: list
+		:type new: list
+		"""
+		if old is None:
+			self.add( new )
+		else:
+			for index in self._indexes.values( ):
+				index.update( old, new )
+
+	def label( self, label ):
+		"""
+		:type label: str
+		:rtype: set[str]
+		"""
+		return self._index( "label" ).get( label )
+
+	def labels( self ):
+		"""
+		Returns labels of the cached torrents.
+
+		:rtype: list[str]
+		"""
+		return sorted( self._index( "label" ).keys( ) )
+
+	def status( self, flag ):
+		"""
+		Returns hashes of the torrents which status has the flag set.
+
+		:param flag: name of the status flag, see utorrent.table.STATUS_BITS
+		:type flag: str
+		:rtype: set[str]
+		"""
+		if flag not in STATUS_BITS:
+			raise KeyError( flag )
+		return self._index( "status" ).get( flag )
+
+	def download_dir( self, path ):
+		"""
+		:type path: str
+		:rtype: set[str]
+		"""
+		return self._index( "download_dir" ).get( path )
+
+	def name_contains( self, text ):
+		"""
+		Returns hashes of the torrents which name contains the text, case insensitive.
+
+		:type text: str
+		:rtype: set[str]
+		"""
+		text = text.lower( )
+		if len( text ) < 3:
+			return { h for h, row in self._rows.items( ) if text in row[2].lower( ) }
+		index = self._index( "name" )
+		candidates = None
+		# intersection starts with the rarest trigram, so it's never larger than the number of its torrents
+		for trigram in sorted( _trigrams( text ), key = lambda t: len( index.members( t ) ) ):
+			hashes = index.members( trigram )
+			candidates = set( hashes ) if candidates is None else candidates & hashes
+			if len( candidates ) == 0:
+				return candidates
+		return { h for h in candidates if text in self._rows[h][2].lower( ) }
+
+	def hash_prefix( self, prefix ):
+		"""
+		Returns hashes starting with the prefix, case insensitive.
+
+		:type prefix: str
+		:rtype: list[str]
+		"""
+		if self._sorted_hashes is None:
+			self._sorted_hashes = sorted( self._rows )
+		prefix = prefix.upper( )
+		out = []
+		i = bisect.bisect_left( self._sorted_hashes, prefix )
+		while i < len( self._sorted_hashes ) and self._sorted_hashes[i].startswith( prefix ):
+			out.append( self._sorted_hashes[i] )
+			i += 1
+		return out
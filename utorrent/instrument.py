@@ -0,0 +1,189 @@
+"""
+Instrument
+
+Per-action request timings and counters.
+"""
+
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+
+import utorrent
+
+
+class RequestRecord:
+	"""
+	Timings (in seconds) and sizes of a single WebUI request, passed to the listeners once the request is complete.
+	"""
+	action = ""
+	""" WebUI action, e.g. list, getfiles, proxy """
+	connect = 0.
+	""" name resolution, TCP and SSL handshakes of the new connections """
+	wait = 0.
+	""" sending the request and waiting for the response headers, mostly server think time """
+	transfer = 0.
+	""" reading and decompressing the response body """
+	decode = 0.
+	""" JSON decoding """
+	build = 0.
+	""" construction of the result objects (torrents, files, ...) """
+	bytes_sent = 0
+	bytes_received = 0
+	""" response body bytes as they were received, before decompression """
+	retries = 0
+	reconnects = 0
+	error = None
+	""" :type: str """
+	request = True
+	""" False for the records made by Instrumentation.build( ) """
+
+	def __init__( self, action ):
+		self.action = action
+
+	@property
+	def total( self ):
+		return self.connect + self.wait + self.transfer + self.decode + self.build
+
+
+class ActionStats:
+	"""
+	Totals of all requests of the single action.
+	"""
+	_fields = ( "connect", "wait", "transfer", "decode", "build", "bytes_sent", "bytes_received", "retries", "reconnects" )
+
+	action = ""
+	requests = 0
+	errors = 0
+	connect = 0.
+	wait = 0.
+	transfer = 0.
+	decode = 0.
+	build = 0.
+	bytes_sent = 0
+	bytes_received = 0
+	retries = 0
+	reconnects = 0
+
+	def __init__( self, action ):
+		self.action = action
+
+	@property
+	def total( self ):
+		return self.connect + self.wait + self.transfer + self.decode + self.build
+
+	def add( self, record ):
+		"""
+		:type record: RequestRecord
+		"""
+		if record.request:
+			self.requests += 1
+		if record.error is not None:
+			self.errors += 1
+		for name in self._fields:
+			setattr( self, name, getattr( self, name ) + getattr( record, name ) )
+
+
+class Instrumentation:
+	"""
+	Collects RequestRecord of every request made by the connection, keeps per-action totals and passes the records to the listeners.
+	"""
+	_lock = None
+	""" :type: threading.Lock """
+	_actions = None
+	""" :type: OrderedDict """
+	_listeners = None
+	""" :type: list """
+
+	def __init__( self ):
+		self._lock = threading.Lock( )
+		self._actions = OrderedDict( )
+		self._listeners = []
+
+	@property
+	def actions( self ):
+		"""
+		Returns totals keyed by action name in the order of the first request.
+
+		:rtype: OrderedDict[str, ActionStats]
+		"""
+		with self._lock:
+			return OrderedDict( self._actions )
+
+	def add_listener( self, listener ):
+		"""
+		:param listener: callable receiving RequestRecord, called from the thread that made the request
+		"""
+		with self._lock:
+			self._listeners = self._listeners + [listener]
+
+	def remove_listener( self, listener ):
+		with self._lock:
+			self._listeners = [l for l in self._listeners if l != listener]
+
+	def record( self, record ):
+		"""
+		:type record: RequestRecord
+		"""
+		with self._lock:
+			if record.action not in self._actions:
+				self._actions[record.action] = ActionStats( record.action )
+			self._actions[record.action].add( record )
+			listeners = self._listeners
+		for listener in listeners:
+			listener( record )
+
+	@contextlib.contextmanager
+	def build( self, action ):
+		"""
+		Measures construction of the result objects from the response of the action:
+
+			with instrumentation.build( "list" ):
+				...
+		"""
+		record = RequestRecord( action )
+		record.request = False
+		start = time.monotonic( )
+		try:
+			yield record
+		except Exception as e:
+			record.error = str( e )
+			raise
+		finally:
+			record.build = time.monotonic( ) - start
+			self.record( record )
+
+	def reset( self ):
+		with self._lock:
+			self._actions = OrderedDict( )
+
+	def summary( self ):
+		"""
+		Returns table with per-action totals, times are in milliseconds.
+
+		:rtype: str
+		"""
+		head = ( "action", "reqs", "errors", "retries", "reconn", "connect", "wait", "transfer", "decode", "build", "total", "sent", "received" )
+		rows = []
+		totals = ActionStats( "total" )
+		for stats in self.actions.values( ):
+			rows.append( self._summary_row( stats ) )
+			totals.requests += stats.requests
+			totals.errors += stats.errors
+			for name in ActionStats._fields:
+				setattr( totals, name, getattr( totals, name ) + getattr( stats, name ) )
+		rows.append( self._summary_row( totals ) )
+		widths = [max( len( head[i] ), max( len( r[i] ) for r in rows ) ) for i in range( len( head ) )]
+		out = ["  ".join( h.ljust( w ) if i == 0 else h.rjust( w ) for i, ( h, w ) in enumerate( zip( head, widths ) ) )]
+		for r in rows:
+			out.append( "  ".join( c.ljust( w ) if i == 0 else c.rjust( w ) for i, ( c, w ) in enumerate( zip( r, widths ) ) ) )
+		return "\n".join( out )
+
+	@staticmethod
+	def _summary_row( stats ):
+		ms = lambda v: "{:.1f}".format( v * 1000 )
+		return (
+			stats.action, str( stats.requests ), str( stats.errors ), str( stats.retries ), str( stats.reconnects ), ms( stats.connect ),
+			ms( stats.wait ), ms( stats.transfer ), ms( stats.decode ), ms( stats.build ), ms( stats.total ),
+			utorrent.human_size( stats.bytes_sent ), utorrent.human_size( stats.bytes_received ),
+		)
@@ -5,31 +5,60 @@ JobInfo
 import utorrent
 
 class JobInfo:
+	"""
+	Torrent properties of the getprops response, derived and human-readable fields are computed when they are accessed.
+	"""
+	# __dict__ keeps the attributes set by the users of the class, it's created only when there are any
+	__slots__ = ( "_utorrent", "_row", "hash_code", "__dict__" )
 
-	_utorrent = None
-
-	hash_code = ""
-	trackers = []
-	ulrate = 0
-	ulrate_h = ""
-	dlrate = 0
-	dlrate_h = ""
-	superseed = 0
-	dht = 0
-	pex = 0
-	seed_override = 0
-	seed_ratio = 0
-	seed_time = 0
+	# properties of the job info created without data
+	_empty_row = { "trackers": "", "ulrate": 0, "dlrate": 0, "superseed": 0, "dht": 0, "pex": 0, "seed_override": 0, "seed_ratio": 0,
+	               "seed_time": 0 }
+
+	ulrate = utorrent._item_property( "ulrate" )
+	dlrate = utorrent._item_property( "dlrate" )
+	superseed = utorrent._item_property( "superseed" )
+	dht = utorrent._item_property( "dht" )
+	pex = utorrent._item_property( "pex" )
+	seed_override = utorrent._item_property( "seed_override" )
+	seed_ratio = utorrent._item_property( "seed_ratio" )
+	seed_time = utorrent._item_property( "seed_time" )
 
 	def __init__( self, utorrent, torrent_hash = None, jobinfo = None ):
+		"""
+		:param jobinfo: element of the getprops response, it's kept as is
+		:type jobinfo: dict
+		"""
 		self._utorrent = utorrent
 		self.hash_code = torrent_hash
+		self._row = self._empty_row
 		if jobinfo:
 			self.fill( jobinfo )
 
 	def __str__( self ):
 		return "Limits D:{} U:{}".format( self.dlrate, self.ulrate )
 
+	@property
+	def trackers( self ):
+		"""
+		:rtype: list[str]
+		"""
+		if not self._row["trackers"]:
+			return []
+		return self._row["trackers"].strip().split( "\r\n\r\n" )
+
+	@trackers.setter
+	def trackers( self, trackers ):
+		self._row = dict( self._row, trackers = "\r\n\r\n".join( trackers ) )
+
+	@property
+	def ulrate_h( self ):
+		return utorrent.human_size( self.ulrate ) + "/s"
+
+	@property
+	def dlrate_h( self ):
+		return utorrent.human_size( self.dlrate ) + "/s"
+
 	def verbose_str( self ):
 		return str( self ) + "  Superseed:{}  DHT:{}  PEX:{}  Queuing override:{}  Seed ratio:{}  Seed time:{}".format(
 			self._tribool_status_str( self.superseed ), self._tribool_status_str( self.dht ),
@@ -38,18 +67,13 @@ class JobInfo:
 		)
 
 	def fill( self, jobinfo ):
+		"""
+		Replaces the properties the job info reads its fields from.
+
+		:type jobinfo: dict
+		"""
 		self.hash_code = jobinfo["hash"]
-		self.trackers = jobinfo["trackers"].strip().split( "\r\n\r\n" )
-		self.ulrate = jobinfo["ulrate"]
-		self.ulrate_h = utorrent.human_size( self.ulrate ) + "/s"
-		self.dlrate = jobinfo["dlrate"]
-		self.dlrate_h = utorrent.human_size( self.dlrate ) + "/s"
-		self.superseed = jobinfo["superseed"]
-		self.dht = jobinfo["dht"]
-		self.pex = jobinfo["pex"]
-		self.seed_override = jobinfo["seed_override"]
-		self.seed_ratio = jobinfo["seed_ratio"]
-		self.seed_time = jobinfo["seed_time"]
+		self._row = jobinfo
 
 	@classmethod
 	def get_public_attrs( cls ):
@@ -0,0 +1,296 @@
+"""
+JSON stream
+
+Incremental decoding of WebUI responses that are too large to be held in memory in full.
+"""
+
+import json
+import re
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+_decoder = json.JSONDecoder( )
+_whitespace = re.compile( "[ \\t\\n\\r]*" )
+# characters changing the nesting depth or the string state, and the element delimiter
+_structure = re.compile( '[\\[\\]{}",]' )
+_string_end = re.compile( '["\\\\]' )
+
+
+def loads( text ):
+	"""
+	Decodes JSON text, orjson is used if it's installed.
+
+	:type text: str
+	"""
+	if orjson is not None:
+		return orjson.loads( text )
+	return json.loads( text )
+
+
+class ObjectStreamParser:
+	"""
+	Incremental parser of the JSON object. Elements of the list values of the selected keys are returned as soon as they are received,
+	all other values are collected in the result:
+
+		parser = ObjectStreamParser( ( "torrents", ) )
+		for chunk in chunks:
+			for key, element in parser.feed( chunk ):
+				...
+		for key, element in parser.close( ):
+			...
+		parser.result
+
+	Elements of the duplicate keys are returned just like the ones of the first key, so they are effectively merged.
+	"""
+	# states
+	_START = 0
+	_KEY = 1
+	_COLON = 2
+	_VALUE = 3
+	_FIRST_ELEMENT = 4
+	_ELEMENT = 5
+	_ELEMENT_DELIMITER = 6
+	_DELIMITER = 7
+	_END = 8
+
+	_streamed_keys = frozenset( )
+	_buf = ""
+	_pos = 0
+	_state = _START
+	# position the element scan continues from with its depth and string state, see _scan_elements( )
+	_scan = 0
+	_depth = 0
+	_in_string = False
+	# False once the quick search for the end of the elements failed in the current list
+	_quick = True
+	# position the quick search continues from
+	_searched = 0
+	_key = None
+	_result = None
+	""" :type: dict """
+
+	@property
+	def result( self ):
+		"""
+		Values of the keys that are not streamed.
+
+		:rtype: dict
+		"""
+		return self._result
+
+	def __init__( self, streamed_keys ):
+		"""
+		:param streamed_keys: keys which list values are returned element by element
+		"""
+		self._streamed_keys = frozenset( streamed_keys )
+		self._result = { }
+
+	def feed( self, text ):
+		"""
+		Adds next chunk of the document, returns list of ( key, element ) decoded so far.
+
+		:type text: str
+		:rtype: list
+		"""
+		if self._pos > 0:
+			self._buf = self._buf[self._pos:]
+			self._scan = max( self._scan - self._pos, 0 )
+			self._searched = max( self._searched - self._pos, 0 )
+			self._pos = 0
+		self._buf += text
+		return self._parse( False )
+
+	def close( self ):
+		"""
+		Finishes parsing, raises ValueError if the document is incomplete.
+
+		:rtype: list
+		"""
+		out = self._parse( True )
+		if self._state != self._END:
+			raise json.JSONDecodeError( "Unexpected end of data", self._buf, len( self._buf ) )
+		return out
+
+	def _skip( self ):
+		self._pos = _whitespace.match( self._buf, self._pos ).end( )
+		return self._buf[self._pos:self._pos + 1]
+
+	def _decode_value( self, final ):
+		"""
+		Returns decoded value at the current position or raises IndexError if it's not received yet.
+		"""
+		try:
+			value, end = _decoder.raw_decode( self._buf, self._pos )
+		except json.JSONDecodeError:
+			if final:
+				raise
+			raise IndexError( )
+		# number at the end of the buffer can continue in the next chunk
+		if end == len( self._buf ) and not final:
+			raise IndexError( )
+		self._pos = end
+		return value
+
+	def _scan_elements( self ):
+		"""
+		Scans the buffer for the ends of the elements, returns position of the delimiter after the last complete one or -1 if there is
+		none. The scan stops at the end of the buffer and continues from there with the next chunk, so every character is scanned once.
+		"""
+		buf = self._buf
+		pos = max( self._scan, self._pos )
+		depth = self._depth
+		in_string = self._in_string
+		end = -1
+		while True:
+			if in_string:
+				m = _string_end.search( buf, pos )
+				if m is None:
+					pos = len( buf )
+					break
+				pos = m.start( )
+				if buf[pos] == "\\":
+					if pos + 1 == len( buf ):
+						# escaped character is in the next chunk
+						break
+					pos += 2
+					continue
+				in_string = False
+			else:
+				m = _structure.search( buf, pos )
+				if m is None:
+					pos = len( buf )
+					break
+				pos = m.start( )
+				c = buf[pos]
+				if c == '"':
+					in_string = True
+				elif c == "[" or c == "{":
+					depth += 1
+				elif c == "]" or c == "}":
+					if depth == 0:
+						# end of the list
+						end = pos
+						break
+					depth -= 1
+				elif depth == 0:
+					end = pos
+			pos += 1
+		self._scan = pos
+		self._depth = depth
+		self._in_string = in_string
+		return end
+
+	def _decode_elements( self, out ):
+		"""
+		Decodes all complete list elements in the buffer at once, raises IndexError if there are none yet.
+		"""
+		if self._quick:
+			# elements are usually lists (torrent rows), the last '],[' in the buffer is likely the end of one of them; the text that was
+			# searched or scanned before has none, so only the new text is searched
+			start = max( self._pos, self._scan - 2, self._searched - 2 )
+			cut = self._buf.rfind( "],[", start )
+			if cut < 0 and self._buf.find( "]", start ) < 0:
+				# no element ended yet, the partial one is not scanned with every chunk
+				self._searched = len( self._buf )
+				raise IndexError( )
+			if cut >= 0:
+				try:
+					elements = loads( "[" + self._buf[self._pos:cut + 1] + "]" )
+				except ValueError:
+					# '],[' is inside a string or a nested list (e.g. rss feed rows), the ends of the elements are found by the scan
+					self._quick = False
+				else:
+					out.extend( ( self._key, e ) for e in elements )
+					self._pos = self._scan = cut + 1
+					self._depth = 0
+					self._in_string = False
+					self._state = self._ELEMENT_DELIMITER
+					return
+		end = self._scan_elements( )
+		if end < 0:
+			raise IndexError( )
+		elements = loads( "[" + self._buf[self._pos:end] + "]" )
+		if len( elements ) == 0:
+			raise json.JSONDecodeError( "Expecting value", self._buf, self._pos )
+		out.extend( ( self._key, e ) for e in elements )
+		self._pos = end
+		self._state = self._ELEMENT_DELIMITER
+
+	def _parse( self, final ):
+		out = []
+		try:
+			while True:
+				c = self._skip( )
+				if c == "":
+					break
+				if self._state == self._START:
+					if c != "{":
+						raise json.JSONDecodeError( "Expecting object", self._buf, self._pos )
+					self._pos += 1
+					self._state = self._KEY
+				elif self._state == self._KEY:
+					if c == "}" and len( self._result ) == 0 and self._key is None:
+						self._pos += 1
+						self._state = self._END
+						continue
+					if c != '"':
+						raise json.JSONDecodeError( "Expecting property name enclosed in double quotes", self._buf, self._pos )
+					self._key = self._decode_value( final )
+					self._state = self._COLON
+				elif self._state == self._COLON:
+					if c != ":":
+						raise json.JSONDecodeError( "Expecting ':' delimiter", self._buf, self._pos )
+					self._pos += 1
+					self._state = self._VALUE
+				elif self._state == self._VALUE:
+					if c == "[" and self._key in self._streamed_keys:
+						self._pos += 1
+						self._state = self._FIRST_ELEMENT
+						self._scan = self._searched = self._pos
+						self._depth = 0
+						self._in_string = False
+						self._quick = True
+						# empty list still has to show up in the result
+						self._result.setdefault( self._key, [] )
+					else:
+						value = self._decode_value( final )
+						if isinstance( value, list ) and isinstance( self._result.get( self._key ), list ):
+							self._result[self._key].extend( value )
+						else:
+							self._result[self._key] = value
+						self._state = self._DELIMITER
+				elif self._state == self._FIRST_ELEMENT:
+					if c == "]":
+						self._pos += 1
+						self._state = self._DELIMITER
+					else:
+						self._decode_elements( out )
+				elif self._state == self._ELEMENT:
+					self._decode_elements( out )
+				elif self._state == self._ELEMENT_DELIMITER:
+					if c == ",":
+						self._pos += 1
+						self._state = self._ELEMENT
+					elif c == "]":
+						self._pos += 1
+						self._state = self._DELIMITER
+					else:
+						raise json.JSONDecodeError( "Expecting ',' delimiter", self._buf, self._pos )
+				elif self._state == self._DELIMITER:
+					if c == ",":
+						self._pos += 1
+						self._state = self._KEY
+					elif c == "}":
+						self._pos += 1
+						self._state = self._END
+					else:
+						raise json.JSONDecodeError( "Expecting ',' delimiter", self._buf, self._pos )
+				else:
+					raise json.JSONDecodeError( "Extra data", self._buf, self._pos )
+		except IndexError:
+			# rest of the value is in the next chunk
+			pass
+		return out
@@ -0,0 +1,261 @@
+"""
+Metainfo
+
+Lazy reader of .torrent files, values are decoded only when they are asked for and the pieces are never copied.
+"""
+
+import hashlib
+import mmap
+
+import utorrent
+
+
+def _text( value ):
+	"""
+	Returns string value as str, bdecode returns the ones that aren't valid utf8 as bytearray (bytes for dictionary keys).
+	"""
+	if isinstance( value, ( bytes, bytearray ) ):
+		return value.decode( "utf8", errors = "replace" )
+	return str( value )
+
+
+class TorrentMetainfo:
+	"""
+	Contents of the .torrent file. Only the offsets of the top level and info dictionary values are found when it's created, large
+	values are skipped by their length prefix.
+	"""
+	data = None
+	""" :type: bytes, bytearray, mmap.mmap contents of the file """
+	_spans = None
+	""" :type: dict key -> ( start, end ) of the top level values """
+	_info_spans = None
+	""" :type: dict key -> ( start, end ) of the info dictionary values """
+	_values = None
+	""" :type: dict decoded values keyed by ( is info value, key ) """
+	_info_hash = None
+	""" :type: str """
+	_info_hash_v2 = None
+	""" :type: str """
+	_mmap = None
+	""" :type: mmap.mmap """
+
+	def __init__( self, data ):
+		"""
+		Raises ValueError if the data is not a torrent file.
+
+		:type data: bytes, bytearray, memoryview, mmap.mmap
+		"""
+		self.data = utorrent._bencoded_buffer( data )
+		self._spans = utorrent.bencoded_dict_spans( self.data )
+		if "info" not in self._spans:
+			raise ValueError( "Torrent file has no info dictionary" )
+		self._info_spans = utorrent.bencoded_dict_spans( self.data, self._spans["info"][0] )
+		self._values = { }
+
+	@classmethod
+	def open( cls, filename ):
+		"""
+		Maps the file into memory instead of reading it, use as context manager or call close to unmap it.
+
+		:type filename: str
+		:rtype: TorrentMetainfo
+		"""
+		with open( filename, "rb" ) as f:
+			try:
+				data = mmap.mmap( f.fileno( ), 0, access = mmap.ACCESS_READ )
+			except ValueError: # empty file can't be mapped
+				data = f.read( )
+		out = None
+		try:
+			out = cls( data )
+		finally:
+			if isinstance( data, mmap.mmap ):
+				if out is None:
+					data.close( )
+				else:
+					out._mmap = data
+		return out
+
+	def close( self ):
+		if self._mmap is not None:
+			self._mmap.close( )
+			self._mmap = None
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, exc_type, exc_val, exc_tb ):
+		self.close( )
+
+	def __contains__( self, key ):
+		return key in self._spans
+
+	def keys( self ):
+		"""
+		Returns top level keys of the file.
+
+		:rtype: list
+		"""
+		return list( self._spans )
+
+	def info_keys( self ):
+		"""
+		Returns keys of the info dictionary.
+
+		:rtype: list
+		"""
+		return list( self._info_spans )
+
+	def _get( self, spans, is_info, key, default ):
+		if key not in spans:
+			return default
+		cache_key = ( is_info, key )
+		if cache_key not in self._values:
+			start, end = spans[key]
+			self._values[cache_key] = utorrent.bdecode( self.data[start:end] )
+		return self._values[cache_key]
+
+	def get( self, key, default = None ):
+		"""
+		Returns decoded top level value, e.g. announce or comment.
+		"""
+		return self._get( self._spans, False, key, default )
+
+	def info_get( self, key, default = None ):
+		"""
+		Returns decoded value of the info dictionary, e.g. name or piece length.
+		"""
+		return self._get( self._info_spans, True, key, default )
+
+	def raw( self, key ):
+		"""
+		Returns bencoded top level value without copying it, the view must be released before the file is closed.
+
+		:rtype: memoryview
+		"""
+		start, end = self._spans[key]
+		return memoryview( self.data )[start:end]
+
+	def _hash_info( self, algorithm ):
+		start, end = self._spans["info"]
+		with memoryview( self.data ) as view:
+			return algorithm( view[start:end] ).hexdigest( ).upper( )
+
+	@property
+	def info_hash( self ):
+		"""
+		Version 1 info-hash (SHA-1), it's computed for BitTorrent v2 torrents too, see info_hash_v2.
+
+		:rtype: str
+		"""
+		if self._info_hash is None:
+			self._info_hash = self._hash_info( hashlib.sha1 )
+		return self._info_hash
+
+	@property
+	def is_v2( self ):
+		"""
+		True for BitTorrent v2 and hybrid torrents.
+
+		:rtype: bool
+		"""
+		return self.info_get( "meta version" ) == 2
+
+	@property
+	def info_hash_v2( self ):
+		"""
+		Version 2 info-hash (SHA-256) of BitTorrent v2 and hybrid torrents, None for version 1 torrents.
+
+		:rtype: str
+		"""
+		if self._info_hash_v2 is None and self.is_v2:
+			self._info_hash_v2 = self._hash_info( hashlib.sha256 )
+		return self._info_hash_v2
+
+	@property
+	def name( self ):
+		"""
+		:rtype: str
+		"""
+		name = self.info_get( "name" )
+		return name if name is None else _text( name )
+
+	@property
+	def piece_length( self ):
+		"""
+		:rtype: int
+		"""
+		return self.info_get( "piece length" )
+
+	@property
+	def piece_count( self ):
+		"""
+		Number of the pieces, counted from the length of the pieces string without reading it.
+
+		:rtype: int
+		"""
+		if "pieces" not in self._info_spans:
+			return 0
+		start, end = self._info_spans["pieces"]
+		return ( end - self.data.find( b":", start ) - 1 ) // 20
+
+	@property
+	def files( self ):
+		"""
+		Returns files of the torrent as ( path, size ), path components are joined with "/". Single-file torrent has only its name.
+
+		:rtype: list[(str, int)]
+		"""
+		if "files" in self._info_spans:
+			return [( "/".join( map( _text, f["path"] ) ), f["length"] ) for f in self.info_get( "files" )]
+		if "length" in self._info_spans:
+			return [( self.name, self.info_get( "length" ) )]
+		out = []
+		# BitTorrent v2 only torrent, file is the dictionary with empty key
+		stack = [( "", self.info_get( "file tree", { } ) )]
+		while len( stack ) > 0:
+			path, tree = stack.pop( )
+			# names that aren't valid utf8 are bytes, they are sorted along with the others by their text
+			for name, node in sorted( tree.items( ), key = lambda item: _text( item[0] ), reverse = True ):
+				if name == "":
+					out.append( ( path, node["length"] ) )
+				else:
+					stack.append( ( path + "/" + _text( name ) if path else _text( name ), node ) )
+		return out
+
+	@property
+	def size( self ):
+		"""
+		Total size of the files.
+
+		:rtype: int
+		"""
+		return sum( size for path, size in self.files )
+
+	@property
+	def trackers( self ):
+		"""
+		Returns tracker urls, announce-list if there is one, otherwise announce.
+
+		:rtype: list[str]
+		"""
+		announce_list = self.get( "announce-list" )
+		if announce_list:
+			return [_text( url ) for tier in announce_list for url in tier]
+		announce = self.get( "announce" )
+		return [_text( announce )] if announce else []
+
+	@property
+	def private( self ):
+		"""
+		:rtype: bool
+		"""
+		return self.info_get( "private" ) == 1
+
+	def __str__( self ):
+		return "{} {}".format( self.info_hash, self.name )
+
+	def verbose_str( self ):
+		return "{} {} {} ({} files, {} pieces of {})".format( self.info_hash, self.name, utorrent.human_size( self.size ),
+		                                                     len( self.files ), self.piece_count,
+		                                                     utorrent.human_size( self.piece_length or 0 ) )
@@ -0,0 +1,918 @@
+"""
+MockServer
+
+Stand-in for uTorrent WebUI serving a synthetic torrent population, meant for benchmarks and tests without a real uTorrent instance:
+
+	server = MockServer( Population( torrents = 100000, files = 10 ), latency = 0.02 )
+	server.start( )
+	ut = Connection( server.host, server.login, server.password ).utorrent( )
+	...
+	server.stop( )
+
+It can also be run standalone: python -m utorrent.mock_server --torrents 100000 --files 10 --port 8080
+"""
+
+import base64
+import gzip
+import hashlib
+import http.server
+import json
+import optparse
+import random
+import re
+import socket
+import threading
+import time
+import urllib.parse
+import zlib
+
+import utorrent
+import utorrent.uTorrent
+
+
+class _Table:
+	"""
+	Rows keyed by id that remember the list cache id (cid) they were last changed in, so that list deltas can be built.
+	"""
+	_rows = None
+	""" :type: dict """
+	_modified = None
+	""" :type: dict """
+	_removed = None
+	""" :type: dict """
+
+	def __init__( self ):
+		self._rows = { }
+		self._modified = { }
+		self._removed = { }
+
+	def __len__( self ):
+		return len( self._rows )
+
+	def __contains__( self, key ):
+		return key in self._rows
+
+	def get( self, key ):
+		return self._rows.get( key )
+
+	def rows( self ):
+		return list( self._rows.values( ) )
+
+	def keys( self ):
+		return list( self._rows.keys( ) )
+
+	def put( self, key, row, seq ):
+		self._rows[key] = row
+		self._modified[key] = seq
+		self._removed.pop( key, None )
+
+	def remove( self, key, seq ):
+		if self._rows.pop( key, None ) is not None:
+			del self._modified[key]
+			self._removed[key] = seq
+
+	def changed_since( self, seq ):
+		return [self._rows[k] for k, s in self._modified.items( ) if s > seq]
+
+	def removed_since( self, seq ):
+		return [k for k, s in self._removed.items( ) if s > seq]
+
+
+class Population:
+	"""
+	Synthetic torrents, files, RSS feeds and filters of a uTorrent instance. Torrent rows are generated on the first list request, file lists
+	are generated on every request from the torrent number, so even millions of files take no memory.
+
+	All methods must be called with the lock held.
+	"""
+	LABELS = ( "", "tv", "movies", "music", "linux", "books" )
+
+	api = "falcon"
+	build = 30235
+	lock = None
+	""" :type: threading.RLock """
+
+	_torrent_count = 0
+	_files_per_torrent = 1
+	_feed_count = 0
+	_filter_count = 0
+	_seed = 0
+	_generated = False
+	_seq = 1
+	_min_seq = 0
+	_next_feed_id = 1
+	_next_filter_id = 1
+
+	_torrents = None
+	""" :type: _Table """
+	_feeds = None
+	""" :type: _Table """
+	_filters = None
+	""" :type: _Table """
+	_file_counts = None
+	""" :type: dict """
+	_file_prio = None
+	""" :type: dict """
+	_props = None
+	""" :type: dict """
+	_settings = None
+	""" :type: dict """
+
+	@property
+	def torrent_count( self ):
+		return len( self._torrents ) if self._generated else self._torrent_count
+
+	@property
+	def cid( self ):
+		"""
+		Current list cache id.
+
+		:rtype: int
+		"""
+		return self._seq
+
+	def __init__( self, torrents = 1000, files = 10, feeds = 2, filters = 2, api = "falcon", seed = 0 ):
+		"""
+		:param files: number of files in every torrent
+		:param api: "desktop" (2.x), "falcon" (3.x) or "linux" (uTorrent Server), determines row format and version detection
+		"""
+		if api not in ( "desktop", "falcon", "linux" ):
+			raise utorrent.uTorrentError( "Unknown api: {}".format( api ) )
+		self.api = api
+		self.lock = threading.RLock( )
+		self._torrent_count = torrents
+		self._files_per_torrent = files
+		self._feed_count = feeds
+		self._filter_count = filters
+		self._seed = seed
+		self._torrents = _Table( )
+		self._feeds = _Table( )
+		self._filters = _Table( )
+		self._file_counts = { }
+		self._file_prio = { }
+		self._props = { }
+		self._settings = self._default_settings( )
+
+	def _sep( self ):
+		return "/" if self.api == "linux" else "\\"
+
+	def _download_dir( self ):
+		return "/data/downloads" if self.api == "linux" else "C:\\Downloads"
+
+	def _default_settings( self ):
+		out = {
+			"dir_active_download": [2, self._download_dir( )],
+			"bind_port": [0, "6881"],
+			"max_ul_rate": [0, "0"],
+			"max_dl_rate": [0, "0"],
+			"net.limit_excludeslocal": [1, "false"],
+			"gui.default_del_action": [0, "0"],
+		}
+		if self.api != "desktop":
+			out["webui.uconnect_enable"] = [1, "false"]
+		return out
+
+	def _random( self, *parts ):
+		# string seeds are hashed with sha512, crc32 is good enough and much faster for hundreds of thousands of rows
+		return random.Random( zlib.crc32( ":".join( str( p ) for p in parts ).encode( "utf8" ) ) << 32 | self._seed )
+
+	def torrent_hash( self, index ):
+		return hashlib.sha1( "{}:{}".format( self._seed, index ).encode( "ascii" ) ).hexdigest( ).upper( )
+
+	def _file_sizes( self, index, count ):
+		rnd = self._random( "files", index )
+		return [rnd.randint( 1, 1 << 30 ) for i in range( count )]
+
+	def _make_row( self, hsh, name, size, progress, added_on, label, index ):
+		rnd = self._random( "row", hsh )
+		downloaded = size * progress // 1000
+		uploaded = int( downloaded * rnd.uniform( 0, 4 ) )
+		active = rnd.random( ) < 0.1
+		ul_speed = rnd.randint( 1, 1 << 20 ) if active else 0
+		dl_speed = rnd.randint( 1, 1 << 22 ) if active and progress < 1000 else 0
+		dl_remain = size - downloaded
+		if progress == 1000:
+			status, message = ( 201, "Seeding" ) if active else ( 136, "Finished" )
+			eta = 0
+		else:
+			status, message = ( 201, "Downloading" ) if rnd.random( ) < 0.8 else ( 233, "Paused" )
+			eta = dl_remain // dl_speed if dl_speed > 0 else -1
+		row = [
+			hsh, status, name, size, progress, downloaded, uploaded, uploaded * 1000 // max( downloaded, 1 ), ul_speed, dl_speed, eta, label,
+			rnd.randint( 0, 50 ), rnd.randint( 0, 500 ), rnd.randint( 0, 50 ), rnd.randint( 0, 500 ), rnd.randint( 0, 10 * 65536 ),
+			index + 1 if progress < 1000 else -1, dl_remain,
+		]
+		if self.api != "desktop":
+			row.extend( ( "", "", message, "", added_on, added_on + rnd.randint( 60, 86400 ) if progress == 1000 else 0, "",
+			              self._download_dir( ) + ( self._sep( ) + label if label else "" ) ) )
+		return row
+
+	def _generate( self ):
+		if self._generated:
+			return
+		self._generated = True
+		now = int( time.time( ) )
+		for i in range( self._torrent_count ):
+			rnd = self._random( "torrent", i )
+			hsh = self.torrent_hash( i )
+			progress = 1000 if rnd.random( ) < 0.7 else rnd.randint( 0, 999 )
+			name = "Synthetic.Torrent.{:06d}.{}".format( i, rnd.choice( ( "1080p", "720p", "FLAC", "x64", "EPUB" ) ) )
+			size = sum( self._file_sizes( i, self._files_per_torrent ) )
+			self._file_counts[hsh] = ( i, self._files_per_torrent )
+			row = self._make_row( hsh, name, size, progress, now - rnd.randint( 0, 365 * 86400 ), rnd.choice( self.LABELS ), i )
+			self._torrents.put( hsh, row, self._seq )
+		for i in range( self._feed_count ):
+			self.feed_update( -1, { "url": "http://feeds.example.com/{}.rss".format( i ) } )
+		for i in range( self._filter_count ):
+			self.filter_update( -1, { "name": "filter {}".format( i ), "filter": "*{}*".format( i ) } )
+
+	def _bump( self ):
+		self._seq += 1
+		return self._seq
+
+	def forget_cids( self ):
+		"""
+		Makes all previously issued cids unknown, like restart of uTorrent does.
+		"""
+		self._min_seq = self._seq
+
+	def churn( self, count, rnd = random ):
+		"""
+		Changes transfer stats of `count` random torrents, like it happens between two list requests of a busy client.
+		"""
+		self._generate( )
+		keys = self._torrents.keys( )
+		if not keys:
+			return
+		seq = self._bump( )
+		for hsh in rnd.sample( keys, min( count, len( keys ) ) ):
+			row = list( self._torrents.get( hsh ) )
+			row[8] = rnd.randint( 0, 1 << 20 )
+			row[6] += row[8]
+			row[7] = row[6] * 1000 // max( row[5], 1 )
+			self._torrents.put( hsh, row, seq )
+
+	def list( self, cid = None ):
+		"""
+		Returns list response, delta against `cid` if it is known.
+
+		:type cid: int
+		:rtype: dict
+		"""
+		self._generate( )
+		labels = { }
+		for row in self._torrents.rows( ):
+			if row[11]:
+				labels[row[11]] = labels.get( row[11], 0 ) + 1
+		out = { "build": self.build, "label": [[k, v] for k, v in sorted( labels.items( ) )] }
+		if cid is not None and self._min_seq < cid <= self._seq:
+			out["torrentp"] = self._torrents.changed_since( cid )
+			out["torrentm"] = self._torrents.removed_since( cid )
+			out["rssfeedp"] = self._feeds.changed_since( cid )
+			out["rssfeedm"] = self._feeds.removed_since( cid )
+			out["rssfilterp"] = self._filters.changed_since( cid )
+			out["rssfilterm"] = self._filters.removed_since( cid )
+		else:
+			out["torrents"] = self._torrents.rows( )
+			out["rssfeeds"] = self._feeds.rows( )
+			out["rssfilters"] = self._filters.rows( )
+		# every list request gets a new cache id, changes made after it are reported by the next delta
+		out["torrentc"] = str( self._bump( ) )
+		return out
+
+	def has_torrent( self, hsh ):
+		self._generate( )
+		return hsh in self._torrents
+
+	def files( self, hsh ):
+		"""
+		:rtype: list
+		"""
+		self._generate( )
+		row = self._torrents.get( hsh )
+		if row is None:
+			return None
+		index, count = self._file_counts[hsh]
+		sizes = self._file_sizes( index, count )
+		sep = self._sep( )
+		out = []
+		for i, size in enumerate( sizes ):
+			name = "{}{}{}file{:04d}.bin".format( "CD{}".format( i % 3 + 1 ) if count > 3 else "", sep if count > 3 else "", row[2], i )
+			prio = self._file_prio.get( ( hsh, i ), 2 )
+			downloaded = size * row[4] // 1000
+			if self.api == "desktop":
+				out.append( [name, size, downloaded, prio] )
+			else:
+				out.append( [name, size, downloaded, prio, 0, size // 262144 + 1, False, -1, -1, -1, -1, 0, 0] )
+		return out
+
+	def file_size( self, hsh, index ):
+		files = self.files( hsh )
+		if files is None or not 0 <= index < len( files ):
+			return None
+		return files[index][1]
+
+	def props( self, hsh ):
+		self._generate( )
+		if hsh not in self._torrents:
+			return None
+		out = {
+			"hash": hsh, "trackers": "http://tracker.example.com/announce\r\n\r\nudp://tracker.example.org:6969/announce\r\n", "ulrate": 0,
+			"dlrate": 0, "superseed": 0, "dht": 1, "pex": 1, "seed_override": 0, "seed_ratio": 1500, "seed_time": 0, "ulslots": 0,
+		}
+		out.update( self._props.get( hsh, { } ) )
+		return out
+
+	def set_prop( self, hsh, name, value ):
+		self._generate( )
+		row = self._torrents.get( hsh )
+		if row is None:
+			return
+		if name == "label":
+			row = list( row )
+			row[11] = value
+			self._torrents.put( hsh, row, self._bump( ) )
+		else:
+			if value.lstrip( "-" ).isdigit( ):
+				value = int( value )
+			self._props.setdefault( hsh, { } )[name] = value
+
+	def set_priority( self, hsh, index, prio ):
+		self._generate( )
+		if hsh in self._file_counts:
+			self._file_prio[( hsh, index )] = prio
+
+	def set_status( self, hsh, action ):
+		self._generate( )
+		row = self._torrents.get( hsh )
+		if row is None:
+			return
+		row = list( row )
+		if action == "start":
+			row[1] = ( row[1] | 1 | 64 ) & ~32
+		elif action == "forcestart":
+			row[1] = ( row[1] | 1 ) & ~( 32 | 64 )
+		elif action == "stop":
+			row[1] &= ~( 1 | 32 | 64 )
+		elif action == "pause":
+			row[1] |= 32
+		elif action == "unpause":
+			row[1] &= ~32
+		elif action == "recheck":
+			row[1] |= 2
+		self._torrents.put( hsh, row, self._bump( ) )
+
+	def remove( self, hsh ):
+		self._generate( )
+		self._torrents.remove( hsh, self._bump( ) )
+		self._file_counts.pop( hsh, None )
+
+	def add( self, hsh, name, file_sizes ):
+		"""
+		Adds torrent with the given file sizes, returns False if it already exists.
+		"""
+		self._generate( )
+		if hsh in self._torrents:
+			return False
+		index = len( self._file_counts ) + self._torrent_count
+		row = self._make_row( hsh, name, sum( file_sizes ), 0, int( time.time( ) ), "", index )
+		self._file_counts[hsh] = ( index, len( file_sizes ) )
+		self._torrents.put( hsh, row, self._bump( ) )
+		return True
+
+	def feed_update( self, feed_id, params ):
+		"""
+		Creates feed if feed_id is -1, returns its id or None if it doesn't exist.
+		"""
+		if feed_id == -1:
+			feed_id = self._next_feed_id
+			self._next_feed_id += 1
+			row = [feed_id, True, True, False, False, 0, "", int( time.time( ) ) + 900, []]
+		else:
+			row = self._feeds.get( feed_id )
+			if row is None:
+				return None
+			row = list( row )
+		if "url" in params:
+			row[6] = params["url"]
+		if "enabled" in params:
+			row[1] = params["enabled"] in ( "1", "true" )
+		self._feeds.put( feed_id, row, self._bump( ) )
+		return feed_id
+
+	def feed_remove( self, feed_id ):
+		self._feeds.remove( feed_id, self._bump( ) )
+
+	def filter_update( self, filter_id, params ):
+		"""
+		Creates filter if filter_id is -1, returns its id or None if it doesn't exist.
+		"""
+		if filter_id == -1:
+			filter_id = self._next_filter_id
+			self._next_filter_id += 1
+			row = [filter_id, 1, "", "", "", "", -1, 0, "", 0, 0, 0, 0, "", False, False]
+		else:
+			row = self._filters.get( filter_id )
+			if row is None:
+				return None
+			row = list( row )
+		for i, name in ( ( 2, "name" ), ( 3, "filter" ), ( 4, "not-filter" ), ( 5, "save-in" ), ( 8, "label" ), ( 13, "episode" ) ):
+			if name in params:
+				row[i] = params[name]
+		if "feed-id" in params:
+			row[6] = int( params["feed-id"] )
+		self._filters.put( filter_id, row, self._bump( ) )
+		return filter_id
+
+	def filter_remove( self, filter_id ):
+		self._filters.remove( filter_id, self._bump( ) )
+
+	def settings( self ):
+		out = []
+		for name, ( value_type, value ) in sorted( self._settings.items( ) ):
+			if self.api == "desktop":
+				out.append( [name, value_type, value] )
+			else:
+				out.append( [name, value_type, value, { "access": "Y" }] )
+		return out
+
+	def set_setting( self, name, value ):
+		value_type = self._settings[name][0] if name in self._settings else 2
+		self._settings[name] = [value_type, value]
+
+	def version( self ):
+		return {
+			"product_code": "server", "major_version": 3, "minor_version": 0, "engine_version": self.build, "ui_version": self.build,
+			"version_date": "2013-02-06 13:12:11", "user_agent": "BTWebClient/3000({})".format( self.build ), "peer_id": "UT3000",
+			"device_id": "mock",
+		}
+
+	def xfer_history( self ):
+		rnd = self._random( "xfer" )
+		return { name: [rnd.randint( 1, 1 << 34 ) for i in range( 31 )] for name in (
+			"daily_download", "daily_upload", "daily_local_download", "daily_local_upload" ) }
+
+
+class _Handler( http.server.BaseHTTPRequestHandler ):
+	protocol_version = "HTTP/1.1"
+	server_version = "MockWebUI/1.0"
+	# headers and body are separate writes, with Nagle the body of every keep-alive response waits for the delayed ACK (~40 ms)
+	disable_nagle_algorithm = True
+
+	def setup( self ):
+		http.server.BaseHTTPRequestHandler.setup( self )
+		self.server.mock.count_connection( )
+
+	def log_message( self, format, *args ):
+		if self.server.mock.verbose:
+			http.server.BaseHTTPRequestHandler.log_message( self, format, *args )
+
+	def do_GET( self ):
+		self._handle( None )
+
+	def do_POST( self ):
+		length = int( self.headers.get( "Content-Length", 0 ) )
+		self._handle( self.rfile.read( length ) )
+
+	def _send( self, code, body, content_type = "text/plain", headers = None ):
+		mock = self.server.mock
+		encoding = "gzip" if mock.compression is True else mock.compression
+		if len( body ) > 256 and encoding and encoding in self.headers.get( "Accept-Encoding", "" ):
+			body = gzip.compress( body, 1 ) if encoding == "gzip" else zlib.compress( body, 1 )
+			headers = dict( headers or { }, **{ "Content-Encoding": encoding } )
+		self.send_response( code )
+		self.send_header( "Content-Type", content_type )
+		self.send_header( "Content-Length", str( len( body ) ) )
+		for k, v in ( headers or { } ).items( ):
+			self.send_header( k, v )
+		self.end_headers( )
+		self.wfile.write( body )
+
+	def _send_json( self, obj ):
+		self._send( 200, self.server.mock.encode_json( obj ), "text/plain; charset=utf-8" )
+
+	def _error( self, code, message ):
+		self._send( code, message.encode( "utf8" ) )
+
+	def _authorized( self ):
+		mock = self.server.mock
+		expected = "Basic " + base64.b64encode( "{}:{}".format( mock.login, mock.password ).encode( "latin1" ) ).decode( "ascii" )
+		return self.headers.get( "Authorization" ) == expected
+
+	def _handle( self, body ):
+		mock = self.server.mock
+		mock.count_request( )
+		if mock.should_drop( ):
+			# close without response, client sees dropped connection
+			self.close_connection = True
+			try:
+				self.connection.shutdown( socket.SHUT_RDWR )
+			except OSError:
+				pass
+			return
+		mock.delay( )
+		if not self._authorized( ):
+			return self._send( 401, b"invalid request", headers = { "WWW-Authenticate": 'Basic realm="uTorrent"' } )
+		url = urllib.parse.urlsplit( self.path )
+		query = urllib.parse.parse_qs( url.query, keep_blank_values = True )
+		if body is not None and not self.headers.get( "Content-Type", "" ).startswith( "multipart/" ):
+			# form-encoded POST arguments are treated as query arguments
+			for k, v in urllib.parse.parse_qs( body.decode( "utf8" ), keep_blank_values = True ).items( ):
+				query.setdefault( k, [] ).extend( v )
+			body = None
+		if url.path == "/gui/token.html":
+			return self._send( 200, "<html><div id='token' style='display:none;'>{}</div></html>".format( mock.token ).encode( "ascii" ),
+			                   "text/html", { "Set-Cookie": "GUID={}; path=/".format( mock.guid ) } )
+		if url.path == "/proxy":
+			return self._proxy( query )
+		if url.path.rstrip( "/" ) != "/gui":
+			return self._error( 404, "not found" )
+		if query.get( "token", [None] )[0] != mock.token or "GUID={}".format( mock.guid ) not in self.headers.get( "Cookie", "" ):
+			return self._error( 400, "invalid request" )
+		if "list" in query:
+			cid = query.get( "cid", [None] )[0]
+			return self._send_json( mock.list( int( cid ) if cid and cid.isdigit( ) else None ) )
+		action = query.get( "action", [None] )[0]
+		handler = getattr( self, "_action_" + ( action or "" ).replace( "-", "_" ), None )
+		if handler is None:
+			return self._error( 400, "invalid request" )
+		with mock.population.lock:
+			out = handler( query, body )
+		if out is not None:
+			self._send_json( out )
+
+	def _build( self, **kwargs ):
+		return dict( { "build": self.server.mock.population.build }, **kwargs )
+
+	def _action_getversion( self, query, body ):
+		population = self.server.mock.population
+		if population.api != "linux":
+			return self._error( 400, "invalid request" )
+		return self._build( version = population.version( ) )
+
+	def _action_getsettings( self, query, body ):
+		return self._build( settings = self.server.mock.population.settings( ) )
+
+	def _action_setsetting( self, query, body ):
+		for name, value in zip( query.get( "s", [] ), query.get( "v", [] ) ):
+			self.server.mock.population.set_setting( name, value )
+		return self._build( )
+
+	def _action_getfiles( self, query, body ):
+		population = self.server.mock.population
+		parts = []
+		for hsh in query.get( "hash", [] ):
+			files = population.files( hsh.upper( ) )
+			if files is not None:
+				parts.append( [hsh.upper( ), files] )
+		if len( parts ) < 2:
+			return self._build( files = parts[0] if parts else [] )
+		# like the real WebUI, files of several torrents come as duplicate keys of the same object
+		return _DuplicateKeys( [( "build", population.build )] + [( "files", p ) for p in parts] )
+
+	def _action_getprops( self, query, body ):
+		population = self.server.mock.population
+		props = [population.props( hsh.upper( ) ) for hsh in query.get( "hash", [] )]
+		return self._build( props = [p for p in props if p is not None] )
+
+	def _action_setprops( self, query, body ):
+		population = self.server.mock.population
+		for hsh, name, value in zip( query.get( "hash", [] ), query.get( "s", [] ), query.get( "v", [] ) ):
+			population.set_prop( hsh.upper( ), name, value )
+		return self._build( )
+
+	def _action_setprio( self, query, body ):
+		population = self.server.mock.population
+		hashes = query.get( "hash", [] )
+		prios = query.get( "p", [] )
+		indices = query.get( "f", [] )
+		# single hash and priority can be used for several files
+		for i, index in enumerate( indices ):
+			hsh = hashes[min( i, len( hashes ) - 1 )]
+			prio = prios[min( i, len( prios ) - 1 )]
+			population.set_priority( hsh.upper( ), int( index ), int( prio ) )
+		return self._build( )
+
+	def _status_action( self, action, query ):
+		population = self.server.mock.population
+		for hsh in query.get( "hash", [] ):
+			population.set_status( hsh.upper( ), action )
+		return self._build( )
+
+	def _action_start( self, query, body ):
+		return self._status_action( "start", query )
+
+	def _action_forcestart( self, query, body ):
+		return self._status_action( "forcestart", query )
+
+	def _action_stop( self, query, body ):
+		return self._status_action( "stop", query )
+
+	def _action_pause( self, query, body ):
+		return self._status_action( "pause", query )
+
+	def _action_unpause( self, query, body ):
+		return self._status_action( "unpause", query )
+
+	def _action_recheck( self, query, body ):
+		return self._status_action( "recheck", query )
+
+	def _action_remove( self, query, body ):
+		population = self.server.mock.population
+		for hsh in query.get( "hash", [] ):
+			population.remove( hsh.upper( ) )
+		return self._build( )
+
+	_action_removedata = _action_remove
+	_action_removetorrent = _action_remove
+	_action_removedatatorrent = _action_remove
+
+	def _action_add_file( self, query, body ):
+		if body is None:
+			return self._build( error = "Can't add torrent: no file uploaded" )
+		m = re.match( b"--([^\r\n]+)\r\n.*?\r\n\r\n", body, re.DOTALL )
+		if m is None:
+			return self._build( error = "Can't add torrent: malformed upload" )
+		data = body[m.end( ):body.rindex( b"\r\n--" + m.group( 1 ) )]
+		try:
+			meta = utorrent.bdecode( data )
+			hsh = utorrent.uTorrent.Desktop.get_info_hash( data )
+		except ( StopIteration, ValueError, KeyError, TypeError ):
+			return self._build( error = "Can't add torrent: torrent is not valid bencoding!" )
+		info = meta["info"]
+		if "files" in info:
+			sizes = [f["length"] for f in info["files"]]
+		else:
+			sizes = [info.get( "length", 0 )]
+		name = info.get( "name", hsh )
+		if isinstance( name, bytearray ):
+			name = name.decode( "latin1" )
+		self.server.mock.population.add( hsh, name, sizes )
+		return self._build( )
+
+	def _action_add_url( self, query, body ):
+		url = query.get( "s", [""] )[0]
+		m = re.search( "urn:btih:([0-9A-F]{40})", url, re.IGNORECASE )
+		if m is not None:
+			hsh = m.group( 1 ).upper( )
+		else:
+			hsh = hashlib.sha1( url.encode( "utf8" ) ).hexdigest( ).upper( )
+		m = re.search( "[?&]dn=([^&]+)", url )
+		name = urllib.parse.unquote_plus( m.group( 1 ) ) if m is not None else hsh
+		self.server.mock.population.add( hsh, name, [1 << 20] )
+		return self._build( )
+
+	def _action_rss_update( self, query, body ):
+		params = { k: v[0] for k, v in query.items( ) }
+		feed_id = self.server.mock.population.feed_update( int( params.pop( "feed-id", -1 ) ), params )
+		if feed_id is None:
+			return self._error( 400, "invalid request" )
+		return self._build( rss_ident = feed_id )
+
+	def _action_rss_remove( self, query, body ):
+		self.server.mock.population.feed_remove( int( query.get( "feed-id", [-1] )[0] ) )
+		return self._build( )
+
+	def _action_filter_update( self, query, body ):
+		params = { k: v[0] for k, v in query.items( ) }
+		filter_id = self.server.mock.population.filter_update( int( params.pop( "filter-id", -1 ) ), params )
+		if filter_id is None:
+			return self._error( 400, "invalid request" )
+		return self._build( filter_ident = filter_id )
+
+	def _action_filter_remove( self, query, body ):
+		self.server.mock.population.filter_remove( int( query.get( "filter-id", [-1] )[0] ) )
+		return self._build( )
+
+	def _action_getxferhist( self, query, body ):
+		return self._build( transfer_history = self.server.mock.population.xfer_history( ) )
+
+	def _action_resetxferhist( self, query, body ):
+		return self._build( )
+
+	def _proxy( self, query ):
+		population = self.server.mock.population
+		try:
+			hsh = query["id"][0].upper( )
+			index = int( query["file"][0] )
+		except ( KeyError, ValueError ):
+			return self._error( 400, "invalid request" )
+		with population.lock:
+			size = population.file_size( hsh, index )
+		if size is None:
+			return self._error( 404, "not found" )
+		start, end = 0, size - 1
+		code = 200
+		m = re.match( r"bytes=(\d+)-(\d*)$", self.headers.get( "Range", "" ) )
+		if m is not None:
+			start = int( m.group( 1 ) )
+			if m.group( 2 ):
+				end = min( end, int( m.group( 2 ) ) )
+			if start > end:
+				self.send_response( 416 )
+				self.send_header( "Content-Range", "bytes */{}".format( size ) )
+				self.send_header( "Content-Length", "0" )
+				self.end_headers( )
+				return
+			code = 206
+		self.send_response( code )
+		self.send_header( "Content-Type", "application/octet-stream" )
+		self.send_header( "Content-Length", str( end - start + 1 ) )
+		self.send_header( "Accept-Ranges", "bytes" )
+		if code == 206:
+			self.send_header( "Content-Range", "bytes {}-{}/{}".format( start, end, size ) )
+		self.end_headers( )
+		# contents are a repeating pattern, so any range can be produced without storing the file
+		block = self.server.mock.file_block
+		pos = start
+		while pos <= end:
+			offset = pos % len( block )
+			chunk = block[offset:offset + min( len( block ) - offset, end - pos + 1 )]
+			self.wfile.write( chunk )
+			pos += len( chunk )
+
+
+class _DuplicateKeys:
+	"""
+	JSON object that keeps repeated keys, encoded by MockServer.encode_json.
+	"""
+	items = None
+
+	def __init__( self, items ):
+		self.items = items
+
+
+class MockServer:
+	"""
+	Threaded HTTP/1.1 server emulating uTorrent WebUI over the given Population.
+	"""
+	population = None
+	""" :type: Population """
+	login = "admin"
+	password = "admin"
+	token = ""
+	guid = ""
+	latency = 0.
+	""" seconds added to every response """
+	jitter = 0.
+	""" random extra latency up to this number of seconds """
+	drop_rate = 0.
+	""" probability of closing the connection instead of responding """
+	churn = 0
+	""" number of torrents changed before every list request """
+	compression = True
+	""" Content-Encoding of the larger responses if the client accepts it: "gzip" (same as True), "deflate" or False for none """
+	verbose = False
+	file_block = b""
+
+	_server = None
+	""" :type: http.server.ThreadingHTTPServer """
+	_thread = None
+	""" :type: threading.Thread """
+	_random = None
+	""" :type: random.Random """
+	_lock = None
+	""" :type: threading.Lock """
+	_request_count = 0
+	_connection_count = 0
+	_dropped_count = 0
+
+	@property
+	def host( self ):
+		"""
+		Address in the form expected by Connection.
+
+		:rtype: str
+		"""
+		return "{}:{}".format( *self._server.server_address[:2] )
+
+	@property
+	def request_count( self ):
+		return self._request_count
+
+	@property
+	def connection_count( self ):
+		return self._connection_count
+
+	@property
+	def dropped_count( self ):
+		return self._dropped_count
+
+	def __init__( self, population = None, address = "127.0.0.1", port = 0, login = "admin", password = "admin", latency = 0., jitter = 0.,
+	              drop_rate = 0., churn = 0, compression = True, keep_alive_timeout = 30., seed = 0, verbose = False ):
+		"""
+		:param port: 0 picks a free port, see host property
+		:param keep_alive_timeout: idle keep-alive connections are closed by the server after this number of seconds
+		:param compression: see compression attribute
+		:type population: Population
+		"""
+		self.population = population if population is not None else Population( seed = seed )
+		self.login = login
+		self.password = password
+		self.latency = latency
+		self.jitter = jitter
+		self.drop_rate = drop_rate
+		self.churn = churn
+		self.compression = compression
+		self.verbose = verbose
+		self._random = random.Random( seed )
+		self._lock = threading.Lock( )
+		self.token = hashlib.sha1( "token:{}".format( seed ).encode( "ascii" ) ).hexdigest( )
+		self.guid = hashlib.sha1( "guid:{}".format( seed ).encode( "ascii" ) ).hexdigest( )[:20]
+		self.file_block = bytes( range( 256 ) ) * 256
+		handler = type( "Handler", ( _Handler, ), { "timeout": keep_alive_timeout } )
+		self._server = http.server.ThreadingHTTPServer( ( address, port ), handler )
+		self._server.daemon_threads = True
+		self._server.mock = self
+
+	def start( self ):
+		"""
+		Serves requests in a background thread.
+		"""
+		self._thread = threading.Thread( target = self._server.serve_forever, name = "MockServer", daemon = True )
+		self._thread.start( )
+		return self
+
+	def serve_forever( self ):
+		self._server.serve_forever( )
+
+	def stop( self ):
+		self._server.shutdown( )
+		self._server.server_close( )
+		if self._thread is not None:
+			self._thread.join( )
+			self._thread = None
+
+	def __enter__( self ):
+		return self.start( )
+
+	def __exit__( self, exc_type, exc, tb ):
+		self.stop( )
+
+	def count_request( self ):
+		with self._lock:
+			self._request_count += 1
+
+	def count_connection( self ):
+		with self._lock:
+			self._connection_count += 1
+
+	def should_drop( self ):
+		with self._lock:
+			if self.drop_rate > 0 and self._random.random( ) < self.drop_rate:
+				self._dropped_count += 1
+				return True
+			return False
+
+	def delay( self ):
+		with self._lock:
+			delay = self.latency + ( self._random.uniform( 0, self.jitter ) if self.jitter > 0 else 0 )
+		if delay > 0:
+			time.sleep( delay )
+
+	def list( self, cid ):
+		with self.population.lock:
+			if self.churn > 0:
+				with self._lock:
+					self.population.churn( self.churn, self._random )
+			return self.population.list( cid )
+
+	@staticmethod
+	def encode_json( obj ):
+		if isinstance( obj, _DuplicateKeys ):
+			return ( "{" + ",".join( "{}:{}".format( json.dumps( k ), json.dumps( v, separators = ( ",", ":" ) ) ) for k, v in obj.items ) +
+			         "}" ).encode( "utf8" )
+		return json.dumps( obj, separators = ( ",", ":" ) ).encode( "utf8" )
+
+
+def main( ):
+	parser = optparse.OptionParser( description = "Emulates uTorrent WebUI serving synthetic torrents" )
+	parser.add_option( "--address", default = "127.0.0.1", help = "address to listen on, default is 127.0.0.1" )
+	parser.add_option( "--port", type = "int", default = 8080, help = "port to listen on, default is 8080" )
+	parser.add_option( "--login", default = "admin" )
+	parser.add_option( "--password", default = "admin" )
+	parser.add_option( "--api", default = "falcon", help = "desktop, falcon or linux, default is falcon" )
+	parser.add_option( "--torrents", type = "int", default = 1000, help = "number of torrents, default is 1000" )
+	parser.add_option( "--files", type = "int", default = 10, help = "number of files in every torrent, default is 10" )
+	parser.add_option( "--feeds", type = "int", default = 2, help = "number of rss feeds, default is 2" )
+	parser.add_option( "--filters", type = "int", default = 2, help = "number of rss filters, default is 2" )
+	parser.add_option( "--latency", type = "float", default = 0., help = "seconds added to every response" )
+	parser.add_option( "--jitter", type = "float", default = 0., help = "random extra latency up to this number of seconds" )
+	parser.add_option( "--drop-rate", type = "float", default = 0., help = "probability of dropping the connection instead of responding" )
+	parser.add_option( "--churn", type = "int", default = 0, help = "number of torrents changed before every list request" )
+	parser.add_option( "--no-compression", action = "store_false", dest = "compression", default = True, help = "never gzip responses" )
+	parser.add_option( "--seed", type = "int", default = 0, help = "seed of the synthetic data" )
+	parser.add_option( "-v", "--verbose", action = "store_true", default = False, help = "log every request" )
+	opts, args = parser.parse_args( )
+	population = Population( opts.torrents, opts.files, opts.feeds, opts.filters, opts.api, opts.seed )
+	server = MockServer( population, opts.address, opts.port, opts.login, opts.password, opts.latency, opts.jitter, opts.drop_rate, opts.churn,
+	                     opts.compression, seed = opts.seed, verbose = opts.verbose )
+	print( "Serving {} torrents with {} files each on {}".format( opts.torrents, opts.files, server.host ) )
+	try:
+		server.serve_forever( )
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main( )
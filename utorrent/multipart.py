@@ -0,0 +1,75 @@
+"""
+Multipart
+
+Streaming multipart/form-data request body.
+"""
+
+import binascii
+import os
+
+import utorrent
+
+
+class MultipartUpload:
+	"""
+	Single file multipart/form-data body that is sent as header, file contents and trailer without joining them together.
+
+	Iterating the object yields the parts of the body from the start, so the same object can be sent again when request is retried. The
+	payload is yielded in slices of chunk_size bytes, they're views of it, so a mapped file is read page by page as it's being sent.
+	Use it as context manager or call release, the payload can't be closed (e.g. mmap) while the body holds the view of it.
+	"""
+	chunk_size = 1 << 16
+	""" :type: int """
+	_boundary = b""
+	_head = b""
+	_payload = None
+	""" :type: memoryview """
+	_tail = b""
+
+	@property
+	def boundary( self ):
+		"""
+		:rtype: str
+		"""
+		return self._boundary.decode( "ascii" )
+
+	@property
+	def content_type( self ):
+		return "multipart/form-data; boundary={}".format( self.boundary )
+
+	def __init__( self, field_name, filename, payload, payload_type = "application/octet-stream" ):
+		"""
+		:param payload: file contents, anything supporting buffer protocol (bytes, bytearray, mmap), it's not copied
+		:type field_name: str
+		:type filename: str
+		:type payload_type: str
+		"""
+		# 32 random hex digits can't realistically appear in the payload, so there is no need to scan it
+		self._boundary = b"----utorrentctl" + binascii.hexlify( os.urandom( 16 ) )
+		self._head = "\r\n".join( (
+		"--" + self.boundary, 'Content-Disposition: form-data; name="{}"; filename="{}"'.format( field_name, utorrent._url_quote( filename ) ),
+		"Content-Type: {}".format( payload_type ), "", "",
+		) ).encode( "utf8" )
+		self._payload = memoryview( payload ).cast( "B" )
+		self._tail = b"\r\n--" + self._boundary + b"\r\n"
+
+	def __len__( self ):
+		return len( self._head ) + len( self._payload ) + len( self._tail )
+
+	def __iter__( self ):
+		yield self._head
+		for i in range( 0, len( self._payload ), self.chunk_size ):
+			yield self._payload[i:i + self.chunk_size]
+		yield self._tail
+
+	def release( self ):
+		"""
+		Releases the view of the payload, the body can't be sent after that.
+		"""
+		self._payload.release( )
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, exc_type, exc_val, exc_tb ):
+		self.release( )
@@ -0,0 +1,364 @@
+"""
+Query
+
+Conditions selecting torrents from the cached list, e.g.:
+
+	ratio > 2 and label = tv and status = seeding
+	name ~ ubuntu or (size >= 4GiB and not status = error)
+	flag = started and eta = -1
+
+Fields are the TorrentTable columns, see utorrent.table. Operators are =, ==, !=, <, <=, >, >=, ~ (contains) and ^= (starts with);
+~ and ^= are case insensitive. Values are numbers (sizes can have k, M, G, T suffixes), ISO dates for added_on and completed_on,
+words or quoted strings. Status is compared with the state shown by uTorrent: seeding, downloading, finished, queued, stopped, paused,
+checking, error or "not loaded". Flag is compared with the name of the status bit: started, checking, start_after_check, checked, error,
+paused, queued or loaded.
+
+Conditions that can use indexes of the client (label, status, flag, download_dir, name ~, hash_code = or ^=) narrow down the rows first,
+then the whole condition is evaluated over the columns of the remaining rows, no Torrent objects are built. The name index is used
+only from the second lookup on, a single scan is faster than building it.
+"""
+
+import functools
+import operator
+import re
+from datetime import datetime
+
+import utorrent
+import utorrent.table
+import utorrent.torrent
+
+_token = re.compile( r"""\s*(?:(?P<op><=|>=|!=|==|\^=|[=<>~])|(?P<paren>[()])|(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|"""
+                     r"""(?P<word>[^\s()=<>!~^"']+))""" )
+_size = re.compile( "^(-?[0-9]*\\.?[0-9]+)\\s*([kmgt]?)(?:i?b)?$", re.IGNORECASE )
+_size_multipliers = { "": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40 }
+_text_ops = ( "~", "^=" )
+_date_fields = ( "added_on", "completed_on" )
+
+# states returned by torrent_state( ) and the flag that is set for all the torrents in the state, it narrows down the state comparison
+# with the index
+STATES = {
+	"seeding": "started",
+	"downloading": "started",
+	"finished": None,
+	"queued": "queued",
+	"stopped": None,
+	"paused": "paused",
+	"checking": "checking",
+	"error": "error",
+	"not loaded": None,
+}
+
+
+def torrent_state( status, progress ):
+	"""
+	Returns state of the torrent, it's the status description shown by uTorrent, lowercase and without the force mark.
+
+	:param status: status bits
+	:type status: int
+	:param progress: progress in percent
+	:type progress: float
+	:rtype: str
+	"""
+	state = str( utorrent.torrent.TorrentStatus( status, progress ) ).lower( )
+	if state.startswith( "[f] " ):
+		state = state[4:]
+	if state.startswith( "checked" ):
+		return "checking"
+	if state == "queued seed":
+		return "queued"
+	return state
+
+
+def _tokenize( text ):
+	out = []
+	pos = 0
+	text = text.rstrip( )
+	while pos < len( text ):
+		m = _token.match( text, pos )
+		if m is None or m.end( ) == pos:
+			raise utorrent.uTorrentError( "Invalid condition at '{}'".format( text[pos:].strip( ) ) )
+		kind = m.lastgroup
+		value = m.group( kind )
+		if kind == "string":
+			value = re.sub( r"\\(.)", r"\1", value[1:-1] )
+		elif kind == "word" and value.lower( ) in ( "and", "or", "not" ):
+			kind = value.lower( )
+		out.append( ( kind, value ) )
+		pos = m.end( )
+	return out
+
+
+class _Parser:
+	"""
+	Recursive descent parser of the condition, nodes are tuples:
+	( "and", node, node, ... ), ( "or", node, node, ... ), ( "not", node ) and ( "compare", field, op, value ).
+	"""
+
+	def __init__( self, text ):
+		self._tokens = _tokenize( text )
+		self._pos = 0
+
+	def _peek( self ):
+		return self._tokens[self._pos][0] if self._pos < len( self._tokens ) else None
+
+	def _next( self, *kinds ):
+		if self._peek( ) not in kinds:
+			found = self._tokens[self._pos][1] if self._pos < len( self._tokens ) else "end of condition"
+			raise utorrent.uTorrentError( "Invalid condition, expected {} instead of '{}'".format( " or ".join( kinds ), found ) )
+		self._pos += 1
+		return self._tokens[self._pos - 1][1]
+
+	def parse( self ):
+		node = self._or( )
+		if self._peek( ) is not None:
+			raise utorrent.uTorrentError( "Invalid condition at '{}'".format( self._tokens[self._pos][1] ) )
+		return node
+
+	def _or( self ):
+		nodes = [self._and( )]
+		while self._peek( ) == "or":
+			self._pos += 1
+			nodes.append( self._and( ) )
+		return nodes[0] if len( nodes ) == 1 else ( "or", ) + tuple( nodes )
+
+	def _and( self ):
+		nodes = [self._not( )]
+		while self._peek( ) == "and":
+			self._pos += 1
+			nodes.append( self._not( ) )
+		return nodes[0] if len( nodes ) == 1 else ( "and", ) + tuple( nodes )
+
+	def _not( self ):
+		if self._peek( ) == "not":
+			self._pos += 1
+			return ( "not", self._not( ) )
+		if self._peek( ) == "paren" and self._tokens[self._pos][1] == "(":
+			self._pos += 1
+			node = self._or( )
+			if self._next( "paren" ) != ")":
+				raise utorrent.uTorrentError( "Invalid condition, expected ')'" )
+			return node
+		field = self._next( "word" ).lower( )
+		op = self._next( "op" )
+		value = self._next( "word", "string" )
+		return ( "compare", field, op, value )
+
+
+class Query:
+	"""
+	Parsed condition selecting torrents, see the module description for the syntax.
+	"""
+	_node = None
+	""" :type: tuple """
+
+	def __init__( self, text = None, node = None ):
+		"""
+		:type text: str
+		"""
+		self._node = node if node is not None else _Parser( text ).parse( )
+
+	def __and__( self, other ):
+		return Query( node = ( "and", self._node, other._node ) )
+
+	@classmethod
+	def compare( cls, field, op, value ):
+		"""
+		Returns the query of the single comparison, the value is not parsed.
+
+		:rtype: Query
+		"""
+		return cls( node = ( "compare", field, op, value ) )
+
+	def select( self, utorrent_obj, rows, index ):
+		"""
+		Returns rows matching the condition.
+
+		:param utorrent_obj: client the rows belong to, its TorrentClass defines the row layout
+		:type utorrent_obj: utorrent.uTorrent.Desktop
+		:param rows: cached rows keyed by hash
+		:type rows: dict[str, list]
+		:type index: utorrent.index.TorrentIndex
+		:rtype: list[list]
+		"""
+		table = utorrent.table.TorrentTable( utorrent_obj, self._candidate_rows( rows, index ) )
+		return table.rows( self._mask( self._node, table ).indices( ) )
+
+	def iter_rows( self, utorrent_obj, rows, index ):
+		"""
+		Returns iterator of the rows matching the condition, they're checked one by one without building the table, so it's cheaper
+		when the rows are only passed through, e.g. to pick top few of them.
+
+		:type utorrent_obj: utorrent.uTorrent.Desktop
+		:type rows: dict[str, list]
+		:type index: utorrent.index.TorrentIndex
+		:rtype: collections.abc.Iterator[list]
+		"""
+		match = self._row_predicate( self._node, utorrent.table.row_getters( utorrent_obj ) )
+		return filter( match, self._candidate_rows( rows, index ) )
+
+	def _candidate_rows( self, rows, index ):
+		"""
+		Returns the rows that may match the condition in the order of the list.
+
+		:type rows: dict[str, list]
+		:type index: utorrent.index.TorrentIndex
+		:rtype: collections.abc.Iterable[list]
+		"""
+		hashes = self._candidates( self._node, rows, index )
+		if hashes is None:
+			return rows.values( )
+		# the candidates are a set, the order is taken from the list by a membership test of every hash, it's cheap compared to the
+		# evaluation of the condition
+		return map( rows.__getitem__, filter( hashes.__contains__, rows ) )
+
+	@classmethod
+	def _candidates( cls, node, rows, index ):
+		"""
+		Returns hashes of the torrents that may match the node using the indexes only, None if the node can't use them.
+
+		:rtype: set[str]
+		"""
+		kind = node[0]
+		if kind == "and":
+			sets = [s for s in ( cls._candidates( n, rows, index ) for n in node[1:] ) if s is not None]
+			if len( sets ) == 0:
+				return None
+			sets.sort( key = len )
+			return functools.reduce( operator.and_, sets[1:], sets[0] )
+		if kind == "or":
+			sets = [cls._candidates( n, rows, index ) for n in node[1:]]
+			if any( s is None for s in sets ):
+				return None
+			return functools.reduce( operator.or_, sets )
+		if kind != "compare":
+			return None
+		field, op, value = node[1:]
+		if field in ( "status", "flag" ):
+			value = value.lower( )
+		if op in ( "=", "==" ):
+			if field == "label":
+				return index.label( value )
+			if field == "download_dir":
+				return index.download_dir( value )
+			if field == "hash_code":
+				return { value.upper( ) } & rows.keys( )
+			if field == "flag" and value in utorrent.table.STATUS_BITS:
+				return index.status( value )
+			if field == "status" and STATES.get( value ) is not None:
+				return index.status( STATES[value] )
+		elif op == "~" and field == "name" and index.worth_using( "name" ):
+			return index.name_contains( value )
+		elif op == "^=" and field == "hash_code":
+			return set( index.hash_prefix( value ) )
+		return None
+
+	@classmethod
+	def _mask( cls, node, table ):
+		"""
+		:type table: utorrent.table.TorrentTable
+		:rtype: utorrent.table.Mask
+		"""
+		kind = node[0]
+		if kind == "and":
+			return functools.reduce( operator.and_, ( cls._mask( n, table ) for n in node[1:] ) )
+		if kind == "or":
+			return functools.reduce( operator.or_, ( cls._mask( n, table ) for n in node[1:] ) )
+		if kind == "not":
+			return ~cls._mask( node[1], table )
+		field, op, value = node[1:]
+		if field == "flag":
+			mask = table.status_mask( cls._status_value( field, op, value, utorrent.table.STATUS_BITS ) )
+			return ~mask if op == "!=" else mask
+		if field not in table.columns:
+			raise utorrent.uTorrentError( "Unknown field '{}', use one of: {}".format( field, ", ".join( sorted( table.columns ) + ["flag"] ) ) )
+		if field == "status":
+			value = cls._status_value( field, op, value, STATES )
+			states = map( torrent_state, table.column( "status" ), table.column( "progress" ) )
+			mask = utorrent.table.Mask( bytes( state == value for state in states ) )
+			return ~mask if op == "!=" else mask
+		if op in _text_ops:
+			value = value.lower( )
+			if op == "~":
+				match = lambda v: value in str( v ).lower( )
+			else:
+				match = lambda v: str( v ).lower( ).startswith( value )
+			return utorrent.table.Mask( bytes( map( match, table.column( field ) ) ) )
+		if table.is_numeric( field ):
+			value = cls._numeric_value( field, value )
+		elif field == "hash_code":
+			value = value.upper( )
+		return table.mask( field, op, value )
+
+	@classmethod
+	def _row_predicate( cls, node, getters ):
+		"""
+		Returns function checking the row against the node.
+
+		:param getters: see utorrent.table.row_getters
+		:rtype: callable
+		"""
+		kind = node[0]
+		if kind in ( "and", "or" ):
+			predicates = [cls._row_predicate( n, getters ) for n in node[1:]]
+			combine = all if kind == "and" else any
+			return lambda row: combine( p( row ) for p in predicates )
+		if kind == "not":
+			predicate = cls._row_predicate( node[1], getters )
+			return lambda row: not predicate( row )
+		field, op, value = node[1:]
+		negate = op == "!="
+		if field == "flag":
+			bit = utorrent.table.STATUS_BITS[cls._status_value( field, op, value, utorrent.table.STATUS_BITS )]
+			status = getters["status"]
+			return lambda row: bool( status( row ) & bit ) != negate
+		if field not in getters:
+			raise utorrent.uTorrentError( "Unknown field '{}', use one of: {}".format( field, ", ".join( sorted( getters ) + ["flag"] ) ) )
+		get = getters[field]
+		if field == "status":
+			value = cls._status_value( field, op, value, STATES )
+			progress = getters["progress"]
+			return lambda row: ( torrent_state( get( row ), progress( row ) ) == value ) != negate
+		if op in _text_ops:
+			value = value.lower( )
+			if op == "~":
+				return lambda row: value in str( get( row ) ).lower( )
+			return lambda row: str( get( row ) ).lower( ).startswith( value )
+		if utorrent.table.is_numeric_column( field ):
+			value = cls._numeric_value( field, value )
+			if isinstance( value, datetime ):
+				value = value.timestamp( )
+		elif field == "hash_code":
+			value = value.upper( )
+		compare = utorrent.table.OPERATORS[op]
+		return lambda row: compare( get( row ), value )
+
+	@staticmethod
+	def _status_value( field, op, value, names ):
+		"""
+		Checks the comparison of status or flag and returns the lowercase name.
+
+		:param names: known names
+		:type names: dict
+		:rtype: str
+		"""
+		if op not in ( "=", "==", "!=" ):
+			raise utorrent.uTorrentError( "{} can only be compared with =, == or !=".format( field.capitalize( ) ) )
+		value = value.lower( )
+		if value not in names:
+			raise utorrent.uTorrentError( "Invalid {} '{}', use one of: {}".format( field, value, ", ".join( names ) ) )
+		return value
+
+	@staticmethod
+	def _numeric_value( field, value ):
+		if not isinstance( value, str ):
+			return value
+		if field in _date_fields:
+			try:
+				return datetime.fromisoformat( value )
+			except ValueError:
+				pass
+		m = _size.match( value )
+		if m is None:
+			raise utorrent.uTorrentError( "Invalid value of {}: '{}'".format( field, value ) )
+		number = float( m.group( 1 ) ) * _size_multipliers[m.group( 2 ).lower( )]
+		return int( number ) if number.is_integer( ) else number
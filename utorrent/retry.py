@@ -0,0 +1,263 @@
+"""
+Retry
+
+Retry policy, retry budget and circuit breaker shared by the connections to the same uTorrent instance.
+"""
+
+import random
+import threading
+import time
+
+import utorrent
+
+
+class CircuitOpenError( utorrent.uTorrentError ):
+	"""
+	Raised without contacting the server while its circuit breaker is open.
+	"""
+	retry_after = 0.
+	""" :type: float """
+
+	def __init__( self, message, retry_after = 0. ):
+		utorrent.uTorrentError.__init__( self, message )
+		self.retry_after = retry_after
+
+
+class RetryPolicy:
+	"""
+	Exponential backoff with full jitter between the attempts of a single request.
+	"""
+	max_retries = 3
+	base_delay = 0.5
+	max_delay = 10.
+	timeout = 10.
+	""" socket timeout of a single attempt """
+
+	def __init__( self, max_retries = 3, base_delay = 0.5, max_delay = 10., timeout = 10. ):
+		self.max_retries = max_retries
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.timeout = timeout
+
+	def delay( self, attempt ):
+		"""
+		Returns pause before retrying after the given number of failed attempts.
+
+		:type attempt: int
+		:rtype: float
+		"""
+		return random.uniform( 0, min( self.max_delay, self.base_delay * 2 ** ( attempt - 1 ) ) )
+
+
+class RetryBudget:
+	"""
+	Token bucket that allows retries only for a fraction of successful requests, so that a slow server doesn't get even more load
+	from all the retrying clients.
+	"""
+	_ratio = 0.2
+	_max_tokens = 10.
+	_tokens = 10.
+	_lock = None
+	""" :type: threading.Lock """
+
+	@property
+	def tokens( self ):
+		return self._tokens
+
+	def __init__( self, ratio = 0.2, max_tokens = 10. ):
+		"""
+		:param ratio: number of retries earned by every successful request
+		:param max_tokens: maximum number of retries that can be saved up
+		"""
+		self._ratio = ratio
+		self._max_tokens = self._tokens = float( max_tokens )
+		self._lock = threading.Lock( )
+
+	def deposit( self ):
+		with self._lock:
+			self._tokens = min( self._max_tokens, self._tokens + self._ratio )
+
+	def withdraw( self ):
+		"""
+		Returns True if retry is allowed.
+
+		:rtype: bool
+		"""
+		with self._lock:
+			if self._tokens >= 1:
+				self._tokens -= 1
+				return True
+			return False
+
+
+class CircuitBreaker:
+	"""
+	Stops sending requests to a server after `failure_threshold` consecutive failures. After `reset_timeout` seconds (doubled after every
+	failed probe up to `max_reset_timeout`) a single probe request is let through, its success closes the circuit again.
+	"""
+	CLOSED = "closed"
+	OPEN = "open"
+	HALF_OPEN = "half-open"
+
+	_failure_threshold = 5
+	_reset_timeout = 5.
+	_max_reset_timeout = 300.
+	_state = CLOSED
+	_failures = 0
+	_trips = 0
+	_opened_at = 0.
+	_probe_started = 0.
+	_lock = None
+	""" :type: threading.Lock """
+
+	def __init__( self, failure_threshold = 5, reset_timeout = 5., max_reset_timeout = 300. ):
+		self._failure_threshold = failure_threshold
+		self._reset_timeout = reset_timeout
+		self._max_reset_timeout = max_reset_timeout
+		self._lock = threading.Lock( )
+
+	@property
+	def state( self ):
+		"""
+		One of CLOSED, OPEN, HALF_OPEN.
+
+		:rtype: str
+		"""
+		return self._state
+
+	@property
+	def consecutive_failures( self ):
+		return self._failures
+
+	def _open_timeout( self ):
+		return min( self._max_reset_timeout, self._reset_timeout * 2 ** max( 0, self._trips - 1 ) )
+
+	@property
+	def retry_after( self ):
+		"""
+		Seconds until the next probe request is allowed, 0 if requests are allowed right now.
+
+		:rtype: float
+		"""
+		with self._lock:
+			if self._state == self.CLOSED:
+				return 0.
+			if self._state == self.HALF_OPEN:
+				return max( 0., self._probe_started + self._open_timeout( ) - time.monotonic( ) )
+			return max( 0., self._opened_at + self._open_timeout( ) - time.monotonic( ) )
+
+	def allow( self ):
+		"""
+		Returns True if request can be sent now, when circuit is open the first caller after the timeout becomes the probe.
+
+		:rtype: bool
+		"""
+		with self._lock:
+			now = time.monotonic( )
+			if self._state == self.CLOSED:
+				return True
+			if self._state == self.OPEN and now >= self._opened_at + self._open_timeout( ):
+				self._state = self.HALF_OPEN
+				self._probe_started = now
+				return True
+			# probe that never reported back doesn't block the circuit forever
+			if self._state == self.HALF_OPEN and now >= self._probe_started + self._open_timeout( ):
+				self._probe_started = now
+				return True
+			return False
+
+	def check( self ):
+		"""
+		Raises CircuitOpenError if request is not allowed.
+		"""
+		if not self.allow( ):
+			retry_after = self.retry_after
+			raise CircuitOpenError( "uTorrent WebUI is unavailable, next try in {:.1f}s".format( retry_after ), retry_after )
+
+	def record_success( self ):
+		with self._lock:
+			self._state = self.CLOSED
+			self._failures = 0
+			self._trips = 0
+
+	def record_failure( self ):
+		with self._lock:
+			self._failures += 1
+			if self._state == self.HALF_OPEN or ( self._state == self.CLOSED and self._failures >= self._failure_threshold ):
+				self._state = self.OPEN
+				self._opened_at = time.monotonic( )
+				self._trips += 1
+
+
+class RetryRegistry:
+	"""
+	Circuit breakers and retry budgets keyed by the base URL of the WebUI (scheme, host and port, e.g. "http://127.0.0.1:8080/"), so that
+	all connections to the same uTorrent instance share them. Connections use the module-level registry unless they are given their own one.
+	"""
+	_entries = None
+	""" :type: dict url -> ( CircuitBreaker, RetryBudget ) """
+	_lock = None
+	""" :type: threading.Lock """
+
+	def __init__( self ):
+		self._entries = { }
+		self._lock = threading.Lock( )
+
+	def __contains__( self, url ):
+		return url in self._entries
+
+	def __len__( self ):
+		return len( self._entries )
+
+	def for_host( self, url ):
+		"""
+		Returns circuit breaker and retry budget of the url, they are created for its first connection.
+
+		:type url: str
+		:rtype: (CircuitBreaker, RetryBudget)
+		"""
+		with self._lock:
+			if url not in self._entries:
+				self._entries[url] = ( CircuitBreaker( ), RetryBudget( ) )
+			return self._entries[url]
+
+	def set( self, url, breaker, budget ):
+		"""
+		Makes the connections to the url created from now on use the breaker and the budget.
+
+		:type url: str
+		:type breaker: CircuitBreaker
+		:type budget: RetryBudget
+		"""
+		with self._lock:
+			self._entries[url] = ( breaker, budget )
+
+	def drop( self, url ):
+		"""
+		Forgets the state of the url, existing connections keep using it, new ones start with a closed circuit and a full budget.
+
+		:type url: str
+		"""
+		with self._lock:
+			self._entries.pop( url, None )
+
+	def clear( self ):
+		"""
+		Forgets the state of all urls.
+		"""
+		with self._lock:
+			self._entries.clear( )
+
+
+registry = RetryRegistry( )
+
+
+def for_host( url ):
+	"""
+	Returns circuit breaker and retry budget shared by all connections to the WebUI url that use the module-level registry.
+
+	:param url: base url of the WebUI as the connections build it, e.g. "http://127.0.0.1:8080/"
+	:type url: str
+	:rtype: (CircuitBreaker, RetryBudget)
+	"""
+	return registry.for_host( url )
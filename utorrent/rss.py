@@ -7,6 +7,9 @@ from utorrent import _get_external_attrs
 
 
 class Feed:
+	# attributes filled from the row fields, in the order of the fields
+	_fields = ( "feed_id", "enabled", "use_feed_title", "user_selected", "programmed", "download_state", "url", "next_update", "entries" )
+
 	feed_id = 0
 	enabled = False
 	use_feed_title = False
@@ -82,6 +85,10 @@ class FeedEntry:
 
 
 class Filter:
+	# attributes filled from the row fields, in the order of the fields
+	_fields = ( "filter_id", "flags", "name", "filter", "not_filter", "save_in", "feed_id", "quality", "label", "postpone_mode", "last_match",
+	            "smart_ep_filter", "repack_ep_filter", "episode", "episode_filter", "resolving_candidate" )
+
 	filter_id = 0
 	flags = 0
 	name = ""
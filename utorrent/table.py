@@ -0,0 +1,468 @@
+"""
+Table
+
+Columnar view of the torrent list for filtering, sorting and aggregation without building Torrent objects.
+"""
+
+import array
+import heapq
+import operator
+from datetime import datetime
+from itertools import compress, repeat
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# columns stored as codes into the list of distinct values
+CODES = "codes"
+
+# name, array typecode (None for list of values, CODES), index in the row, conversion of the row value
+_columns = (
+	( "hash_code", None, 0, None ),
+	( "status", "q", 1, None ),
+	( "name", None, 2, None ),
+	( "size", "q", 3, None ),
+	( "progress", "d", 4, lambda col: map( operator.truediv, col, repeat( 10. ) ) ),
+	( "downloaded", "q", 5, None ),
+	( "uploaded", "q", 6, None ),
+	( "ratio", "d", 7, lambda col: map( operator.truediv, col, repeat( 1000. ) ) ),
+	( "ul_speed", "q", 8, None ),
+	( "dl_speed", "q", 9, None ),
+	( "eta", "q", 10, None ),
+	( "label", CODES, 11, None ),
+	( "peers_connected", "q", 12, None ),
+	( "peers_total", "q", 13, None ),
+	( "seeds_connected", "q", 14, None ),
+	( "seeds_total", "q", 15, None ),
+	( "availability", "q", 16, None ),
+	( "queue_order", "q", 17, None ),
+	( "dl_remain", "q", 18, None ),
+)
+
+# additional columns of utorrent.torrent.Torrent_API2, dates are stored as timestamps
+_api2_columns = (
+	( "url", None, 19, None ),
+	( "rss_url", None, 20, None ),
+	( "status_message", CODES, 21, None ),
+	( "added_on", "q", 23, None ),
+	( "completed_on", "q", 24, lambda col: map( int, col ) ),
+	( "download_dir", CODES, 26, None ),
+)
+
+# bits of the status column, see utorrent.torrent.TorrentStatus
+STATUS_BITS = {
+	"started": 1,
+	"checking": 2,
+	"start_after_check": 4,
+	"checked": 8,
+	"error": 16,
+	"paused": 32,
+	"queued": 64,
+	"loaded": 128,
+}
+
+# comparison operators of TorrentTable.mask
+OPERATORS = {
+	"=": operator.eq,
+	"==": operator.eq,
+	"!=": operator.ne,
+	"<": operator.lt,
+	"<=": operator.le,
+	">": operator.gt,
+	">=": operator.ge,
+}
+
+_invert = bytes( ( 1, 0 ) ) + bytes( 254 )
+
+
+def is_numeric_column( name ):
+	"""
+	Returns True if the column holds numbers, dates included.
+
+	:rtype: bool
+	"""
+	return any( n == name and typecode not in ( None, CODES ) for n, typecode, index, convert in _columns + _api2_columns )
+
+
+def row_getters( utorrent_obj ):
+	"""
+	Returns functions getting the column values, as they're stored in the table, from the row of the list response, keyed by the
+	column name. They let rows be filtered and ranked one by one without building the table.
+
+	:type utorrent_obj: utorrent.uTorrent.Desktop
+	:rtype: dict
+	"""
+	specs = _columns
+	if hasattr( utorrent_obj.TorrentClass, "download_dir" ):
+		specs += _api2_columns
+	out = { }
+	for name, typecode, index, convert in specs:
+		if convert is None:
+			out[name] = operator.itemgetter( index )
+		else:
+			# column conversions work on the whole column, single value is converted as a column of one
+			out[name] = lambda row, index = index, convert = convert: next( iter( convert( ( row[index], ) ) ) )
+	return out
+
+
+class Mask:
+	"""
+	Selection of the table rows, combined with &, | and ~. Backed by bytes of 0/1 or by the boolean array when NumPy is installed.
+	"""
+	__slots__ = ( "_values", )
+
+	def __init__( self, values ):
+		"""
+		:param values: bytes (or bytes-like) of 0/1 per row or numpy.ndarray of bool
+		"""
+		if numpy is not None and not isinstance( values, numpy.ndarray ):
+			values = numpy.frombuffer( bytes( values ), dtype = bool )
+		self._values = values
+
+	def __len__( self ):
+		return len( self._values )
+
+	def __and__( self, other ):
+		if numpy is not None:
+			return Mask( self._values & other._values )
+		return Mask( bytes( map( operator.and_, self._values, other._values ) ) )
+
+	def __or__( self, other ):
+		if numpy is not None:
+			return Mask( self._values | other._values )
+		return Mask( bytes( map( operator.or_, self._values, other._values ) ) )
+
+	def __invert__( self ):
+		if numpy is not None:
+			return Mask( ~self._values )
+		return Mask( self._values.translate( _invert ) )
+
+	def count( self ):
+		"""
+		Returns number of the selected rows.
+
+		:rtype: int
+		"""
+		if numpy is not None:
+			return int( numpy.count_nonzero( self._values ) )
+		return self._values.count( 1 )
+
+	def indices( self ):
+		"""
+		Returns indices of the selected rows in ascending order.
+
+		:rtype: list[int]
+		"""
+		if numpy is not None:
+			return numpy.flatnonzero( self._values ).tolist( )
+		return list( compress( range( len( self._values ) ), self._values ) )
+
+
+class TorrentTable:
+	"""
+	Torrent list stored by columns: one array.array per numeric field, label-like fields as codes into the list of distinct values and
+	the rest as plain lists. Column names and values match Torrent attributes, except that the status column holds status bits and the
+	dates are timestamps.
+
+	Row sets are passed around as lists of row indices, e.g. top 10 seeding torrents with label "tv" by ratio:
+
+		table = utorrent.torrent_table( )
+		mask = table.mask( "label", "=", "tv" ) & table.status_mask( "started" ) & table.mask( "progress", "=", 100 )
+		for torrent in table.torrents( table.top( [( "ratio", True )], 10, mask.indices( ) ) ):
+			...
+
+	NumPy is used for comparison, sorting and sums of the numeric columns if it's installed, results are the same without it.
+	"""
+	_utorrent = None
+	""" :type: utorrent.uTorrent.Desktop """
+	_rows = None
+	""" :type: list """
+	_columns = None
+	""" :type: dict """
+	_values = None
+	""" :type: dict """
+	_numpy_columns = None
+	""" :type: dict """
+
+	def __init__( self, utorrent_obj, rows ):
+		"""
+		:param utorrent_obj: client the torrents belong to, its TorrentClass defines the row layout
+		:type utorrent_obj: utorrent.uTorrent.Desktop
+		:param rows: rows of the list response
+		"""
+		self._utorrent = utorrent_obj
+		self._rows = list( rows )
+		self._columns = { }
+		self._values = { }
+		self._numpy_columns = { }
+		specs = _columns
+		if hasattr( utorrent_obj.TorrentClass, "download_dir" ):
+			specs += _api2_columns
+		# transposing all rows at once is much faster than picking every field separately
+		fields = list( zip( *self._rows ) ) if len( self._rows ) > 0 else [()] * ( specs[-1][2] + 1 )
+		for name, typecode, index, convert in specs:
+			col = fields[index] if convert is None else convert( fields[index] )
+			if typecode is None:
+				self._columns[name] = list( col )
+			elif typecode == CODES:
+				codes = { }
+				self._columns[name] = array.array( "I", [codes.setdefault( v, len( codes ) ) for v in col] )
+				self._values[name] = list( codes )
+			else:
+				self._columns[name] = array.array( typecode, col )
+
+	def __len__( self ):
+		return len( self._rows )
+
+	@property
+	def columns( self ):
+		"""
+		:rtype: list[str]
+		"""
+		return list( self._columns )
+
+	def column( self, name ):
+		"""
+		Returns values of the column, coded columns are decoded.
+
+		:rtype: array.array, list
+		"""
+		col = self._columns[name]
+		if name in self._values:
+			return list( map( self._values[name].__getitem__, col ) )
+		return col
+
+	def values( self, name ):
+		"""
+		Returns distinct values of the coded column (e.g. label), their positions are the codes stored in the column.
+
+		:rtype: list
+		"""
+		return list( self._values[name] )
+
+	def is_numeric( self, name ):
+		"""
+		Returns True if the column holds numbers, dates included.
+
+		:rtype: bool
+		"""
+		return self._is_array( name ) and name not in self._values
+
+	def _numpy( self, name ):
+		if name not in self._numpy_columns:
+			col = self._columns[name]
+			self._numpy_columns[name] = numpy.frombuffer( col, dtype = col.typecode ) if len( col ) > 0 else numpy.zeros( 0, col.typecode )
+		return self._numpy_columns[name]
+
+	def _is_array( self, name ):
+		return isinstance( self._columns[name], array.array )
+
+	@staticmethod
+	def _column_value( name, value ):
+		if isinstance( value, datetime ) and name in ( "added_on", "completed_on" ):
+			return value.timestamp( )
+		return value
+
+	def mask( self, name, op, value ):
+		"""
+		Selects rows by comparing the column with the value.
+
+		:param op: one of =, ==, !=, <, <=, >, >=, in (value is a collection)
+		:rtype: Mask
+		"""
+		col = self._columns[name]
+		if op == "in":
+			value = set( self._column_value( name, v ) for v in value )
+			if name in self._values:
+				value = set( i for i, v in enumerate( self._values[name] ) if v in value )
+			if numpy is not None and self._is_array( name ):
+				return Mask( numpy.isin( self._numpy( name ), list( value ) ) )
+			return Mask( bytes( map( value.__contains__, col ) ) )
+		compare = OPERATORS[op]
+		value = self._column_value( name, value )
+		if name in self._values:
+			if op not in ( "=", "==", "!=" ):
+				# ordering of the coded values is the ordering of the values themselves
+				return Mask( bytes( map( compare, self.column( name ), repeat( value ) ) ) )
+			try:
+				value = self._values[name].index( value )
+			except ValueError:
+				# value is not present, nothing is equal to it
+				return Mask( bytes( len( col ) ) ) if op != "!=" else ~Mask( bytes( len( col ) ) )
+		if numpy is not None and self._is_array( name ):
+			return Mask( compare( self._numpy( name ), value ) )
+		return Mask( bytes( map( compare, col, repeat( value ) ) ) )
+
+	def status_mask( self, flag ):
+		"""
+		Selects rows which status has the flag set.
+
+		:param flag: name of the status flag, see STATUS_BITS
+		:rtype: Mask
+		"""
+		bit = STATUS_BITS[flag]
+		if numpy is not None:
+			return Mask( ( self._numpy( "status" ) & bit ) != 0 )
+		return Mask( bytes( map( bool, map( operator.and_, self._columns["status"], repeat( bit ) ) ) ) )
+
+	def all( self ):
+		"""
+		:rtype: Mask
+		"""
+		return ~Mask( bytes( len( self ) ) )
+
+	def _sort_column( self, name ):
+		"""
+		Returns column which ordering is the ordering of the values, codes are replaced by their ranks.
+		"""
+		col = self._columns[name]
+		if name not in self._values:
+			return col
+		values = self._values[name]
+		ranks = [0] * len( values )
+		for rank, code in enumerate( sorted( range( len( values ) ), key = values.__getitem__ ) ):
+			ranks[code] = rank
+		return array.array( "I", map( ranks.__getitem__, col ) )
+
+	@staticmethod
+	def _sort_keys( keys ):
+		# key is either a column name (ascending) or ( name, descending )
+		return [( k, False ) if isinstance( k, str ) else tuple( k ) for k in keys]
+
+	def sort( self, keys, indices = None ):
+		"""
+		Returns row indices ordered by the keys, the sort is stable.
+
+		:param keys: list of column names or ( name, descending ), the first one is the primary key
+		:param indices: rows to sort, all by default
+		:rtype: list[int]
+		"""
+		keys = [( self._sort_column( name ), desc ) for name, desc in self._sort_keys( keys )]
+		if indices is None:
+			indices = range( len( self ) )
+		if len( indices ) == 0:
+			return []
+		if numpy is not None and all( isinstance( col, array.array ) for col, desc in keys ):
+			idx = numpy.asarray( indices, dtype = numpy.intp )
+			sort_keys = []
+			# lexsort takes the primary key last
+			for col, desc in reversed( keys ):
+				col = numpy.frombuffer( col, dtype = col.typecode )[idx]
+				sort_keys.append( -col.astype( numpy.float64 if col.dtype.kind == "f" else numpy.int64 ) if desc else col )
+			return idx[numpy.lexsort( sort_keys )].tolist( )
+		out = list( indices )
+		# sorting by the keys from the least significant is the same as sorting by all of them at once, because the sort is stable
+		for col, desc in reversed( keys ):
+			out.sort( key = col.__getitem__, reverse = desc )
+		return out
+
+	def top( self, keys, count, indices = None ):
+		"""
+		Returns first count row indices ordered by the keys, same as sort( keys, indices )[:count].
+
+		:rtype: list[int]
+		"""
+		keys = self._sort_keys( keys )
+		if indices is None:
+			indices = range( len( self ) )
+		if numpy is not None and self._is_array( keys[0][0] ):
+			if 0 < count < len( indices ):
+				# only the rows up to the count-th value of the primary key can make it, all of its ties are kept for the other keys
+				name, desc = keys[0]
+				idx = numpy.asarray( indices, dtype = numpy.intp )
+				col = self._sort_column( name )
+				col = numpy.frombuffer( col, dtype = col.typecode )[idx]
+				if desc:
+					col = -col.astype( numpy.float64 if col.dtype.kind == "f" else numpy.int64 )
+				kth = col[numpy.argpartition( col, count - 1 )[count - 1]]
+				indices = idx[col <= kth].tolist( )
+		elif len( keys ) == 1:
+			name, desc = keys[0]
+			select = heapq.nlargest if desc else heapq.nsmallest
+			return select( count, indices, key = self._sort_column( name ).__getitem__ )
+		return self.sort( keys, indices )[:count]
+
+	def sum( self, name, indices = None, weight = None ):
+		"""
+		Returns sum of the column, optionally multiplied by the weight column.
+
+		:type weight: str
+		"""
+		if numpy is not None and self._is_array( name ) and ( weight is None or self._is_array( weight ) ):
+			col = self._numpy( name )
+			if weight is not None:
+				col = col * self._numpy( weight )
+			if indices is not None:
+				col = col[numpy.asarray( indices, dtype = numpy.intp )]
+			out = col.sum( )
+			return float( out ) if col.dtype.kind == "f" else int( out )
+		col = self._columns[name]
+		if weight is not None:
+			col = list( map( operator.mul, col, self._columns[weight] ) )
+		if indices is None:
+			return sum( col )
+		return sum( map( col.__getitem__, indices ) )
+
+	def group_sum( self, by, names, indices = None ):
+		"""
+		Returns sums of the columns per value of the group column, e.g. group_sum( "label", ( "size", "ul_speed" ) ).
+
+		:type names: list[str]
+		:rtype: dict[object, dict[str, int|float]]
+		"""
+		if by in self._values:
+			codes, values = self._columns[by], self._values[by]
+		else:
+			distinct = { }
+			codes = array.array( "I", [distinct.setdefault( v, len( distinct ) ) for v in self._columns[by]] )
+			values = list( distinct )
+		if indices is None:
+			indices = range( len( self ) )
+		out = { }
+		if numpy is not None and all( self._is_array( n ) for n in names ):
+			idx = numpy.asarray( indices, dtype = numpy.intp )
+			group_codes = numpy.frombuffer( codes, dtype = codes.typecode )[idx] if len( codes ) > 0 else numpy.zeros( 0, numpy.intp )
+			counts = numpy.bincount( group_codes, minlength = len( values ) )
+			sums = { }
+			for n in names:
+				if self._columns[n].typecode == "q":
+					# bincount sums in float64, which isn't exact above 2 ** 53
+					sums[n] = numpy.zeros( len( values ), numpy.int64 )
+					numpy.add.at( sums[n], group_codes, self._numpy( n )[idx] )
+				else:
+					sums[n] = numpy.bincount( group_codes, self._numpy( n )[idx], len( values ) )
+			for code, value in enumerate( values ):
+				if counts[code] > 0:
+					out[value] = { n: int( sums[n][code] ) if self._columns[n].typecode == "q" else float( sums[n][code] ) for n in names }
+			return out
+		sums = [None] * len( values )
+		cols = [self._columns[n] for n in names]
+		for i in indices:
+			group = sums[codes[i]]
+			if group is None:
+				group = sums[codes[i]] = [0] * len( names )
+			for j, col in enumerate( cols ):
+				group[j] += col[i]
+		for code, value in enumerate( values ):
+			if sums[code] is not None:
+				out[value] = dict( zip( names, sums[code] ) )
+		return out
+
+	def rows( self, indices ):
+		"""
+		Returns raw rows of the list response.
+
+		:rtype: list
+		"""
+		return list( map( self._rows.__getitem__, indices ) )
+
+	def torrents( self, indices = None ):
+		"""
+		Returns torrent objects of the rows, only they are built.
+
+		:rtype: list[utorrent.torrent.Torrent]
+		"""
+		rows = self._rows if indices is None else self.rows( indices )
+		return [self._utorrent.TorrentClass( self._utorrent, r ) for r in rows]
@@ -6,42 +6,44 @@ from datetime import datetime
 import string
 import utorrent
 
+_formatter = string.Formatter( )
+# ( class, format string ) -> fields, see Torrent._parse_format( )
+_parsed_formats = { }
 
-class Torrent:
-	_utorrent = None
-	""" :type: utorrent.uTorrent.Desktop """
 
-	hash_code = ""
-	status = None
-	name = ""
-	size = 0
-	size_h = ""
-	progress = 0. # in percent
-	downloaded = 0
-	downloaded_h = ""
-	uploaded = 0
-	uploaded_h = ""
-	ratio = 0.
-	ul_speed = 0
-	ul_speed_h = ""
-	dl_speed = 0
-	dl_speed_h = ""
-	eta = 0
-	eta_h = ""
-	label = ""
-	peers_connected = 0
-	peers_total = 0
-	seeds_connected = 0
-	seeds_total = 0
-	availability = 0
-	availability_h = ""
-	queue_order = 0
-	dl_remain = 0
-	dl_remain_h = ""
-
-	_default_format = "{hash} {status} {progress}% {size} {dl_speed} {ul_speed} {ratio} {peer_info} eta: {eta} {name} {label}"
+class Torrent:
+	"""
+	Torrent row of the list response, derived and human-readable fields are computed when they are accessed.
+	"""
+	# __dict__ keeps the attributes set by the users of the class, it's created only when there are any
+	__slots__ = ( "_utorrent", "_row", "_status", "__dict__" )
+
+	# row of the torrent created without data
+	_empty_row = ( "", 0, "", 0, 0, 0, 0, 0, 0, 0, 0, "", 0, 0, 0, 0, 0, 0, 0 )
+	# attributes backed by the row fields, in the order of the fields
+	_fields = ( "hash_code", "status", "name", "size", "progress", "downloaded", "uploaded", "ratio", "ul_speed", "dl_speed", "eta", "label",
+	            "peers_connected", "peers_total", "seeds_connected", "seeds_total", "availability", "queue_order", "dl_remain" )
+
+	hash_code = utorrent._item_property( 0 )
+	name = utorrent._item_property( 2 )
+	size = utorrent._item_property( 3 )
+	downloaded = utorrent._item_property( 5 )
+	uploaded = utorrent._item_property( 6 )
+	ul_speed = utorrent._item_property( 8 )
+	dl_speed = utorrent._item_property( 9 )
+	eta = utorrent._item_property( 10 )
+	label = utorrent._item_property( 11 )
+	peers_connected = utorrent._item_property( 12 )
+	peers_total = utorrent._item_property( 13 )
+	seeds_connected = utorrent._item_property( 14 )
+	seeds_total = utorrent._item_property( 15 )
+	availability = utorrent._item_property( 16 )
+	queue_order = utorrent._item_property( 17 )
+	dl_remain = utorrent._item_property( 18 )
+
+	_default_format = "{hash_code} {status} {progress}% {size} {dl_speed} {ul_speed} {ratio} {peer_info} eta: {eta} {name} {label}"
 	_default_format_specs = {
-	"status": "{status: <15}",
+	"status": "{status!s: <15}",
 	"name": "{name: <60}",
 	"size": "{size_h: >9}",
 	"progress": "{progress: >5.1f}",
@@ -64,36 +66,115 @@ class Torrent:
 	def __init__( self, utorrent_obj, torrent = None ):
 		"""
 		:type utorrent_obj: utorrent.uTorrent.Desktop
-		:type torrent: dict
+		:param torrent: row of the list response, it's kept as is
+		:type torrent: list
 		"""
 		self._utorrent = utorrent_obj
-		if torrent:
-			self.fill( torrent )
+		self.fill( torrent if torrent else self._empty_row )
 
 	def __str__( self ):
 		return "{} {}".format( self.hash_code, self.name )
 
+	@property
+	def status( self ):
+		"""
+		:rtype: TorrentStatus
+		"""
+		if self._status is None:
+			self._status = TorrentStatus( self._row[1], self.progress )
+		return self._status
+
+	@property
+	def progress( self ):
+		""" in percent """
+		return self._row[4] / 10.
+
+	@property
+	def ratio( self ):
+		return self._row[7] / 1000.
+
+	@property
+	def size_h( self ):
+		return utorrent.human_size( self.size )
+
+	@property
+	def downloaded_h( self ):
+		return utorrent.human_size( self.downloaded )
+
+	@property
+	def uploaded_h( self ):
+		return utorrent.human_size( self.uploaded )
+
+	@property
+	def ul_speed_h( self ):
+		return utorrent.human_size( self.ul_speed ) + "/s"
+
+	@property
+	def dl_speed_h( self ):
+		return utorrent.human_size( self.dl_speed ) + "/s"
+
+	@property
+	def eta_h( self ):
+		return utorrent.human_time_delta( self.eta )
+
+	@property
+	def availability_h( self ):
+		return self.availability / 65535.
+
+	@property
+	def dl_remain_h( self ):
+		return utorrent.human_size( self.dl_remain )
+
+	def _format_arg( self, name ):
+		"""
+		Returns value of the format field, fields that are not attributes or look different in the format are handled here.
+		"""
+		if name == "peer_info":
+			if self.progress == 100:
+				return "{}/{}".format( self.peers_connected, self.peers_total )
+			return "{}/{}".format( self.seeds_connected, self.seeds_total )
+		if name == "label":
+			return "({})".format( self.label ) if self.label != "" else ""
+		if name == "dl_speed_h" and self.dl_speed < 1024 or name == "ul_speed_h" and self.ul_speed < 1024:
+			return ""
+		if name == "dl_remain_h" and self.dl_remain == 0:
+			return ""
+		try:
+			return getattr( self, name )
+		except AttributeError:
+			raise KeyError( name )
+
+	@classmethod
+	def _parse_format( cls, format_string ):
+		"""
+		Returns list of ( literal text, field name, format spec, conversion ) with the default specs applied, it's parsed once per class.
+		"""
+		key = ( cls, format_string )
+		if key not in _parsed_formats:
+			out = []
+			formatter = string.Formatter( )
+			for literal_text, field_name, format_spec, conversion in formatter.parse( format_string ):
+				if field_name is not None:
+					def_field_name, def_format_spec, def_conversion = None, " <20", None
+					if field_name in cls._default_format_specs:
+						def_field_name, def_format_spec, def_conversion = next( formatter.parse( cls._default_format_specs[field_name] ) )[1:4]
+					field_name = field_name if def_field_name is None else def_field_name
+					format_spec = format_spec if format_spec != "" else def_format_spec
+					conversion = conversion if conversion is not None else def_conversion
+				out.append( ( literal_text, field_name, format_spec, conversion ) )
+			_parsed_formats[key] = out
+		return _parsed_formats[key]
+
 	def _process_format( self, format_string ):
 		out = []
-		args = dict( self.__dict__ )
-		args["peer_info"] = ( "{peers_connected}/{peers_total}" if args["progress"] == 100 else "{seeds_connected}/{seeds_total}" ).format( **args )
-		args["label"] = "({label})".format( **args ) if args["label"] != "" else ""
-		if args["dl_speed"] < 1024:
-			args["dl_speed_h"] = ""
-		if args["ul_speed"] < 1024:
-			args["ul_speed_h"] = ""
-		if args["dl_remain"] == 0:
-			args["dl_remain_h"] = ""
-		formatter = string.Formatter( )
-		for literal_text, field_name, format_spec, conversion in formatter.parse( format_string ):
+		args = _FormatArgs( self )
+		formatter = _formatter
+		for literal_text, field_name, format_spec, conversion in self._parse_format( format_string ):
 			elem = { "before": literal_text, "value": "" }
 			if field_name is not None:
-				def_field_name, def_format_spec, def_conversion = None, " <20", None
-				if field_name in self._default_format_specs:
-					def_field_name, def_format_spec, def_conversion = next( formatter.parse( self._default_format_specs[field_name] ) )[1:4]
-				val = formatter.get_field( field_name if def_field_name is None else def_field_name, None, args )[0]
-				val = formatter.convert_field( val, conversion if conversion is not None else def_conversion )
-				val = formatter.format_field( val, format_spec if format_spec != "" else def_format_spec )
+				val = formatter.get_field( field_name, None, args )[0]
+				val = formatter.convert_field( val, conversion )
+				val = formatter.format_field( val, format_spec )
 				elem["value"] = val
 			out.append( elem )
 		return out
@@ -108,22 +189,13 @@ class Torrent:
 		return self._format_to_str( self._process_format( self._default_format if format_string is None else format_string ) )
 
 	def fill( self, torrent ):
-		self.hash_code, status, self.name, self.size, progress, self.downloaded, \
-		self.uploaded, ratio, self.ul_speed, self.dl_speed, self.eta, self.label, \
-		self.peers_connected, self.peers_total, self.seeds_connected, self.seeds_total, \
-		self.availability, self.queue_order, self.dl_remain = torrent
-		self._utorrent.check_hash( self.hash_code )
-		self.progress = progress / 10.
-		self.ratio = ratio / 1000.
-		self.status = TorrentStatus( status, self.progress )
-		self.size_h = utorrent.human_size( self.size )
-		self.uploaded_h = utorrent.human_size( self.uploaded )
-		self.downloaded_h = utorrent.human_size( self.downloaded )
-		self.ul_speed_h = utorrent.human_size( self.ul_speed ) + "/s"
-		self.dl_speed_h = utorrent.human_size( self.dl_speed ) + "/s"
-		self.eta_h = utorrent.human_time_delta( self.eta )
-		self.availability_h = self.availability / 65535.
-		self.dl_remain_h = utorrent.human_size( self.dl_remain )
+		"""
+		Replaces the row the torrent reads its fields from.
+
+		:type torrent: list
+		"""
+		self._row = torrent
+		self._status = None
 
 	@classmethod
 	def get_readonly_attrs( cls ):
@@ -159,34 +231,58 @@ class Torrent:
 
 
 class Torrent_API2( Torrent ):
-	_utorrent = None
-	""" :type: utorrent.uTorrent.Falcon """
-	url = ""
-	rss_url = ""
-	status_message = ""
-	_unk_hash = ""
-	added_on = 0
-	completed_on = 0
-	_unk_str = 0
-	download_dir = ""
-
-	def __init__( self, utorrent_obj, torrent = None ):
-		Torrent.__init__( self, utorrent_obj, torrent )
-		self._default_format_specs["status"] = "{status_message: <15}"
-		self._default_format_specs["completed_on"] = "{completed_on!s}"
-		self._default_format_specs["added_on"] = "{added_on!s}"
+	__slots__ = ( )
+
+	_empty_row = Torrent._empty_row + ( "", "", "", "", 0, 0, 0, "" )
+	_fields = Torrent._fields + ( "url", "rss_url", "status_message", "_unk_hash", "added_on", "completed_on", "_unk_str", "download_dir" )
+
+	url = utorrent._item_property( 19 )
+	rss_url = utorrent._item_property( 20 )
+	status_message = utorrent._item_property( 21 )
+	_unk_hash = utorrent._item_property( 22 )
+	_unk_str = utorrent._item_property( 25 )
+	download_dir = utorrent._item_property( 26 )
+
+	_default_format_specs = dict( Torrent._default_format_specs, **{
+	"status": "{status_message: <15}",
+	"completed_on": "{completed_on!s}",
+	"added_on": "{added_on!s}",
+	} )
+
+	@property
+	def added_on( self ):
+		"""
+		:rtype: datetime
+		"""
+		return datetime.fromtimestamp( self._row[23] )
 
-	def fill( self, torrent ):
-		Torrent.fill( self, torrent[0:19] )
-		self.url, self.rss_url, self.status_message, self._unk_hash, self.added_on, \
-		self.completed_on, self._unk_str, self.download_dir = torrent[19:27]
-		self.added_on = datetime.fromtimestamp( self.added_on )
-		self.completed_on = datetime.fromtimestamp( int( self.completed_on ) )
+	@property
+	def completed_on( self ):
+		"""
+		:rtype: datetime
+		"""
+		return datetime.fromtimestamp( int( self._row[24] ) )
 
 	def remove( self, with_data = False, with_torrent = False ):
 		return self._utorrent.torrent_remove( self, with_data, with_torrent )
 
 
+class _FormatArgs:
+	"""
+	Mapping of the format fields to the torrent values, only the fields used by the format are computed.
+	"""
+	__slots__ = ( "_torrent", )
+
+	def __init__( self, torrent ):
+		"""
+		:type torrent: Torrent
+		"""
+		self._torrent = torrent
+
+	def __getitem__( self, key ):
+		return self._torrent._format_arg( key )
+
+
 class Label:
 	name = ""
 	torrent_count = 0
@@ -3,10 +3,11 @@ uTorrent
 """
 
 import datetime
+import heapq
 import ntpath
 import os
 import re
-from hashlib import sha1
+import time
 from collections import OrderedDict
 import posixpath
 import utorrent.rss as rss
@@ -15,6 +16,62 @@ import utorrent.torrent
 import utorrent.job_info
 import utorrent.file
 import utorrent.priority
+import utorrent.multipart
+import utorrent.jsonstream
+import utorrent.table
+import utorrent.changes
+import utorrent.index
+import utorrent.query
+import utorrent.metainfo
+
+
+class _ListStream:
+	"""
+	Parses list response as it's being received, full list rows are collected keyed by their id, delta rows as they come.
+	"""
+	_full_keys = ( "torrents", "rssfeeds", "rssfilters" )
+	_delta_keys = ( "torrentp", "rssfeedp", "rssfilterp" )
+
+	_parser = None
+	""" :type: utorrent.jsonstream.ObjectStreamParser """
+	_rows = None
+	""" :type: dict """
+	yielded = 0
+	""" number of rows already passed to the caller """
+
+	def __init__( self ):
+		self._parser = utorrent.jsonstream.ObjectStreamParser( self._full_keys + self._delta_keys )
+		self._rows = { }
+
+	def _collect( self, rows ):
+		for key, row in rows:
+			if key in self._delta_keys:
+				self._rows.setdefault( key, [] ).append( row )
+			else:
+				self._rows.setdefault( key, { } )[row[0]] = row
+		return rows
+
+	def feed( self, text ):
+		"""
+		:rtype: list
+		"""
+		return self._collect( self._parser.feed( text ) )
+
+	def close( self ):
+		"""
+		:rtype: list
+		"""
+		return self._collect( self._parser.close( ) )
+
+	def result( self ):
+		"""
+		Returns the response in the form accepted by Desktop._update_list_cache( ).
+
+		:rtype: dict
+		"""
+		out = dict( self._parser.result )
+		out.update( self._rows )
+		return out
 
 
 class Desktop:
@@ -45,6 +102,16 @@ class Desktop:
 	""" :type: dict """
 	_rssfilter_cache = None
 	""" :type: dict """
+	_list_snapshot_loaded = False
+	_list_snapshot_dirty = False
+	_list_snapshot_saved = None
+	""" :type: float monotonic time of the last write of the list snapshot """
+	list_snapshot_interval = 300.
+	""" seconds between the writes of the changed list to the cache directory, see save_list_cache( ) """
+	_torrent_objects = None
+	""" :type: dict[str, utorrent.torrent.Torrent] live torrents, None unless live_torrents is enabled """
+	_torrent_index = None
+	""" :type: utorrent.index.TorrentIndex """
 
 	api_version = 1 # http://user.utorrent.com/community/developers/webapi
 
@@ -75,6 +142,38 @@ class Desktop:
 		"""
 		return self._pathmodule
 
+	@property
+	def live_torrents( self ):
+		"""
+		Returns True if torrent_list returns the same Torrent objects across the calls, updated in place with the changed rows.
+
+		:rtype: bool
+		"""
+		return self._torrent_objects is not None
+
+	@live_torrents.setter
+	def live_torrents( self, value ):
+		"""
+		Enables or disables reuse of the Torrent objects, with it enabled only the torrents that changed since the previous list
+		request are updated and only the new ones are created.
+
+		:type value: bool
+		"""
+		if not value:
+			self._torrent_objects = None
+		elif self._torrent_objects is None:
+			self._torrent_objects = { }
+			self._sync_torrent_objects( )
+
+	@property
+	def instrumentation( self ):
+		"""
+		Returns request timings and counters of the connection, they include construction of the result objects.
+
+		:rtype: utorrent.instrument.Instrumentation
+		"""
+		return self._connection.instrumentation
+
 	def __init__( self, connection, version = None ):
 		"""
 		:type connection: utorrent.connection.Connection
@@ -99,8 +198,15 @@ class Desktop:
 		return re.match( "[0-9A-F]{40}$", torrent_hash, re.IGNORECASE )
 
 	@staticmethod
-	def get_info_hash( torrent_data ):
-		return sha1( utorrent.bencode( utorrent.bdecode( torrent_data )["info"] ) ).hexdigest( ).upper( )
+	def get_info_hash( torrent_data, version = 1 ):
+		"""
+		Returns info-hash of the torrent, see utorrent.info_hash.
+
+		:type torrent_data: bytes, mmap.mmap, dict
+		:param version: 1 for SHA-1 info-hash, 2 for SHA-256 one of BitTorrent v2
+		:rtype: str
+		"""
+		return utorrent.info_hash( torrent_data, version )
 
 	@classmethod
 	def check_hash( cls, torrent_hash ):
@@ -120,14 +226,19 @@ class Desktop:
 		return parent_hash, prop
 
 	def resolve_torrent_hashes( self, hashes, torrent_list = None ):
-		out = []
 		if torrent_list is None:
-			torrent_list = self.torrent_list( )
+			self._fetch_torrent_list( )
+			return self._resolve_cached_hashes( hashes )
+		out = []
 		for h in hashes:
 			if h in torrent_list:
 				out.append( torrent_list[h].name )
 		return out
 
+	def _resolve_cached_hashes( self, hashes ):
+		# objects are built only for the requested torrents
+		return [self._TorrentClass( self, self._torrent_cache[h] ).name for h in hashes if h in self._torrent_cache]
+
 	def resolve_feed_ids( self, ids, rss_list = None ):
 		out = []
 		if rss_list is None:
@@ -162,12 +273,19 @@ class Desktop:
 					cur_out = cur_out[part]
 		return out
 
+	@staticmethod
+	def _encode_torrent_data( torrent_data ):
+		"""
+		Returns .torrent file contents, decoded metainfo dict is encoded into single buffer that is both uploaded and hashed.
+		"""
+		if isinstance( torrent_data, dict ):
+			out = bytearray( )
+			utorrent.bencode_to( torrent_data, out )
+			return out
+		return torrent_data
+
 	def _create_torrent_upload( self, torrent_data, torrent_filename ):
-		out = "\r\n".join( (
-		"--{{BOUNDARY}}", 'Content-Disposition: form-data; name="torrent_file"; filename="{}"'.format( utorrent._url_quote( torrent_filename ) ),
-		"Content-Type: application/x-bittorrent", "", torrent_data.decode( "latin1" ), "--{{BOUNDARY}}", "",
-		) )
-		return out
+		return utorrent.multipart.MultipartUpload( "torrent_file", torrent_filename, torrent_data, "application/x-bittorrent" )
 
 	def _get_hashes( self, torrents ):
 		if not utorrent.is_list_type( torrents ):
@@ -198,23 +316,147 @@ class Desktop:
 			self.settings_set( { "dir_active_download": prev_dir } )
 
 	def do_action( self, action, params = None, params_str = None, data = None, retry = True, range_start = None, range_len = None, save_buffer = None,
-	               progress_cb = None ):
+	               progress_cb = None, timeout = None ):
 		return self._connection.do_action( action = action, params = params, params_str = params_str, data = data, retry = retry,
-		                                   range_start = range_start, range_len = range_len, save_buffer = save_buffer, progress_cb = progress_cb )
+		                                   range_start = range_start, range_len = range_len, save_buffer = save_buffer, progress_cb = progress_cb,
+		                                   timeout = timeout )
 
 	def version( self ):
 		if not self._version:
 			self._version = Version( self.do_action( "start" ) )
 		return self._version
 
-	def _fetch_torrent_list( self ):
+	def _list_snapshot_cache( self ):
+		"""
+		:rtype: utorrent.cache.HostCache
+		"""
+		return getattr( self._connection, "cache", None )
+
+	def _load_list_snapshot( self ):
+		self._list_snapshot_loaded = True
+		cache = self._list_snapshot_cache( )
+		if cache is None or self._list_cache_id:
+			return
+		snapshot = cache.load_compressed( "list" )
+		# rows of different APIs are not compatible
+		if snapshot is None or snapshot.get( "api" ) != type( self ).__name__ or not snapshot.get( "cid" ):
+			return
+		self._torrent_cache = { t[0]: t for t in snapshot["torrents"] }
+		if snapshot["rssfeeds"] is not None:
+			self._rssfeed_cache = { r[0]: r for r in snapshot["rssfeeds"] }
+		if snapshot["rssfilters"] is not None:
+			self._rssfilter_cache = { f[0]: f for f in snapshot["rssfilters"] }
+		self._list_cache_id = snapshot["cid"]
+		self._torrent_index = None
+		self._sync_torrent_objects( )
+
+	def _save_list_snapshot( self ):
+		cache = self._list_snapshot_cache( )
+		if cache is None:
+			return
+		self._list_snapshot_dirty = False
+		self._list_snapshot_saved = time.monotonic( )
+		cache.save_compressed( "list", {
+			"api": type( self ).__name__,
+			"cid": self._list_cache_id,
+			"torrents": list( self._torrent_cache.values( ) ) if self._torrent_cache is not None else [],
+			"rssfeeds": list( self._rssfeed_cache.values( ) ) if self._rssfeed_cache is not None else None,
+			"rssfilters": list( self._rssfilter_cache.values( ) ) if self._rssfilter_cache is not None else None,
+		} )
+
+	def save_list_cache( self ):
+		"""
+		Writes the cached list to the cache directory of the connection if it changed since it was last written. While polling, the
+		changed list is written only every list_snapshot_interval seconds, as writing all the rows takes much longer than applying the
+		delta, so this should be called when the session ends.
+		"""
+		if self._list_snapshot_dirty:
+			self._save_list_snapshot( )
+
+	def _reset_list_cache( self ):
+		self._list_cache_id = 0
+		self._torrent_cache = None
+		self._torrent_index = None
+		self._rssfeed_cache = None
+		self._rssfilter_cache = None
+
+	def _list_params( self ):
+		if not self._list_snapshot_loaded:
+			self._load_list_snapshot( )
 		if self._list_cache_id:
-			out = self.do_action( "list", { "cid": self._list_cache_id } )
+			return { "cid": self._list_cache_id }
+		return None
+
+	@staticmethod
+	def _rows_by_id( rows ):
+		# streamed list (see _ListStream) is already keyed
+		if isinstance( rows, dict ):
+			return rows
+		return { row[0]: row for row in rows }
+
+	def _sync_torrent_objects( self ):
+		"""
+		Updates live torrents with all the cached rows, the objects of the torrents that are still there are kept.
+		"""
+		if self._torrent_objects is None:
+			return
+		objects = self._torrent_objects
+		self._torrent_objects = { }
+		for h, row in ( self._torrent_cache or { } ).items( ):
+			torrent = objects.get( h )
+			if torrent is None:
+				torrent = self._TorrentClass( self, row )
+			else:
+				torrent.fill( row )
+			self._torrent_objects[h] = torrent
+
+	@staticmethod
+	def _check_list_delta( cache, out, changed_key, removed_key ):
+		"""
+		Raises utorrent.ListDeltaError unless the delta of the single kind of rows can be applied to the cache.
+		"""
+		if cache is None:
+			if len( out.get( changed_key, [] ) ) > 0 or len( out.get( removed_key, [] ) ) > 0:
+				raise utorrent.ListDeltaError( "Delta {} has no cached rows".format( changed_key ) )
+			return
+		for i in out.get( removed_key, [] ):
+			if i not in cache:
+				raise utorrent.ListDeltaError( "Removed {} {} is not cached".format( removed_key, i ) )
+
+	def _check_torrent_rows( self, rows ):
+		"""
+		Checks hashes of the torrent rows of the list response, it's done once when they're taken into the cache.
+		"""
+		for row in ( rows.values( ) if isinstance( rows, dict ) else rows ):
+			self.check_hash( row[0] )
+
+	def _update_list_cache( self, out ):
+		changed = True
+		if "torrentp" in out:
+			# the whole delta is checked first so that the cache is not left half updated
+			self._check_torrent_rows( out["torrentp"] )
+			self._check_list_delta( self._torrent_cache, out, "torrentp", "torrentm" )
+			self._check_list_delta( self._rssfeed_cache, out, "rssfeedp", "rssfeedm" )
+			self._check_list_delta( self._rssfilter_cache, out, "rssfilterp", "rssfilterm" )
+			changed = any( len( out.get( k, [] ) ) > 0 for k in ( "torrentm", "torrentp", "rssfeedm", "rssfeedp", "rssfilterm", "rssfilterp" ) )
 			# torrents
 			for t in out["torrentm"]:
-				del self._torrent_cache[t]
+				row = self._torrent_cache.pop( t )
+				if self._torrent_index is not None:
+					self._torrent_index.remove( row )
 			for t in out["torrentp"]:
+				if self._torrent_index is not None:
+					self._torrent_index.update( self._torrent_cache.get( t[0] ), t )
 				self._torrent_cache[t[0]] = t
+			if self._torrent_objects is not None:
+				for t in out["torrentm"]:
+					self._torrent_objects.pop( t, None )
+				for t in out["torrentp"]:
+					torrent = self._torrent_objects.get( t[0] )
+					if torrent is None:
+						self._torrent_objects[t[0]] = self._TorrentClass( self, t )
+					else:
+						torrent.fill( t )
 			# feeds
 			for r in out["rssfeedm"]:
 				del self._rssfeed_cache[r]
@@ -226,60 +468,333 @@ class Desktop:
 			for f in out["rssfilterp"]:
 				self._rssfilter_cache[f[0]] = f
 		else:
-			out = self.do_action( "list" )
 			if "torrents" in out:
-				self._torrent_cache = { hsh: torrent for hsh, torrent in [( t[0], t ) for t in out["torrents"]] }
+				self._check_torrent_rows( out["torrents"] )
+				self._torrent_cache = self._rows_by_id( out["torrents"] )
+				self._torrent_index = None
+				self._sync_torrent_objects( )
 			if "rssfeeds" in out:
-				self._rssfeed_cache = { feed_id: feed for feed_id, feed in [( r[0], r ) for r in out["rssfeeds"]] }
+				self._rssfeed_cache = self._rows_by_id( out["rssfeeds"] )
 			if "rssfilters" in out:
-				self._rssfilter_cache = { filter_id: filter_props for filter_id, filter_props in [( f[0], f ) for f in out["rssfilters"]] }
-		self._list_cache_id = out["torrentc"]
+				self._rssfilter_cache = self._rows_by_id( out["rssfilters"] )
+		if changed or self._list_cache_id != out["torrentc"]:
+			self._list_cache_id = out["torrentc"]
+			self._list_snapshot_dirty = True
+		if self._list_snapshot_dirty:
+			now = time.monotonic( )
+			if self._list_snapshot_saved is None:
+				# the interval starts with the first list of the session
+				self._list_snapshot_saved = now
+			elif now - self._list_snapshot_saved >= self.list_snapshot_interval:
+				self._save_list_snapshot( )
+		return out
+
+	@staticmethod
+	def _list_cache_rejected( e ):
+		"""
+		Returns True if the error means that the list can't be updated from the cache: the delta doesn't match the cached rows or uTorrent
+		doesn't know the cache id and responds with "invalid request". Transport errors are not, the full list would fail the same way.
+
+		:type e: utorrent.uTorrentError
+		"""
+		return isinstance( e, utorrent.ListDeltaError ) or ( len( e.args ) > 0 and e.args[0] == "invalid request" )
+
+	def _apply_list( self, out, changes = None ):
+		"""
+		Updates the cache with the list response, records the changes it makes first if requested.
+
+		:type changes: utorrent.changes.ListChanges
+		"""
+		if changes is not None:
+			changes.compare( self, out )
+		return self._update_list_cache( out )
+
+	def _fetch_torrent_list( self, changes = None ):
+		params = self._list_params( )
+		try:
+			return self._apply_list( self.do_action( "list", params ), changes )
+		except utorrent.uTorrentError as e:
+			if params is None or not self._list_cache_rejected( e ):
+				raise
+			# cache id is not recognized anymore (e.g. uTorrent was restarted) or cached rows don't match the delta, get full list
+			out = self.do_action( "list" )
+			# full list is compared against the previous rows so that only the actual changes are reported
+			if changes is not None:
+				changes.compare( self, out )
+			self._reset_list_cache( )
+			return self._update_list_cache( out )
+
+	def _build_torrent_list( self, res, labels = None, rss_feeds = None, rss_filters = None ):
+		with self.instrumentation.build( "list" ):
+			if self._torrent_objects is not None:
+				out = dict( self._torrent_objects )
+			else:
+				out = { h: self._TorrentClass( self, t ) for h, t in self._torrent_cache.items( ) }
+			if labels is not None:
+				labels.extend( [utorrent.torrent.Label( i ) for i in res["label"]] )
+			if rss_feeds is not None:
+				for feed_id, feed in self._rssfeed_cache.items( ):
+					rss_feeds[feed_id] = rss.Feed( feed )
+			if rss_filters is not None:
+				for filter_id, filter_props in self._rssfilter_cache.items( ):
+					rss_filters[filter_id] = rss.Filter( filter_props )
 		return out
 
 	def torrent_list( self, labels = None, rss_feeds = None, rss_filters = None ):
 		res = self._fetch_torrent_list( )
-		out = { h: self._TorrentClass( self, t ) for h, t in self._torrent_cache.items( ) }
-		if labels is not None:
-			labels.extend( [utorrent.torrent.Label( i ) for i in res["label"]] )
-		if rss_feeds is not None:
-			for feed_id, feed in self._rssfeed_cache.items( ):
-				rss_feeds[feed_id] = rss.Feed( feed )
-		if rss_filters is not None:
-			for filter_id, filter_props in self._rssfilter_cache.items( ):
-				rss_filters[filter_id] = rss.Filter( filter_props )
-		return out
+		return self._build_torrent_list( res, labels, rss_feeds, rss_filters )
 
-	def torrent_info( self, torrents ):
-		res = self.do_action( "getprops", { "hash": self._get_hashes( torrents ) } )
+	@staticmethod
+	def _make_query( label = None, where = None ):
+		"""
+		:type where: str, utorrent.query.Query
+		:rtype: utorrent.query.Query
+		"""
+		query = None
+		if where is not None:
+			query = where if isinstance( where, utorrent.query.Query ) else utorrent.query.Query( where )
+		if label is not None:
+			label_query = utorrent.query.Query.compare( "label", "=", label )
+			query = label_query if query is None else query & label_query
+		return query
+
+	def _select_rows( self, query ):
+		"""
+		:type query: utorrent.query.Query
+		:rtype: list
+		"""
+		if query is None:
+			return self._torrent_cache.values( )
+		return query.select( self, self._torrent_cache, self._get_torrent_index( ) )
+
+	def _build_torrent_table( self, label = None, where = None ):
+		query = self._make_query( label, where )
+		with self.instrumentation.build( "list" ):
+			return utorrent.table.TorrentTable( self, self._select_rows( query ) )
+
+	def torrent_table( self, label = None, where = None ):
+		"""
+		Returns torrent list as a columnar table for filtering, sorting and aggregation, see utorrent.table.TorrentTable.
+
+		:param label: include only the torrents with this label
+		:type label: str
+		:param where: include only the torrents matching the condition, see utorrent.query
+		:type where: str, utorrent.query.Query
+		:rtype: utorrent.table.TorrentTable
+		"""
+		self._fetch_torrent_list( )
+		return self._build_torrent_table( label, where )
+
+	def _iter_rows( self, query ):
+		"""
+		:type query: utorrent.query.Query
+		:rtype: collections.abc.Iterator[list]
+		"""
+		if query is None:
+			return iter( self._torrent_cache.values( ) )
+		return query.iter_rows( self, self._torrent_cache, self._get_torrent_index( ) )
+
+	def _select_hashes( self, where ):
+		query = self._make_query( where = where )
+		with self.instrumentation.build( "list" ):
+			return sorted( row[0] for row in self._iter_rows( query ) )
+
+	def _build_torrent_top( self, sort_field, count, desc, label, where ):
+		query = self._make_query( label, where )
+		key = utorrent.table.row_getters( self )[sort_field]
+		select = heapq.nlargest if desc else heapq.nsmallest
+		with self.instrumentation.build( "list" ):
+			return [self._TorrentClass( self, row ) for row in select( count, self._iter_rows( query ), key = key )]
+
+	def torrent_top( self, sort_field, count, desc = False, label = None, where = None ):
+		"""
+		Returns first count torrents ordered by the field, same as sorting all of them and taking the first count. Rows are filtered and
+		ranked one by one while only count of them are kept, the torrent objects are built for the result only.
+
+		:param sort_field: name of the column, see utorrent.table.TorrentTable
+		:type sort_field: str
+		:type count: int
+		:param desc: sort in descending order
+		:type desc: bool
+		:param label: include only the torrents with this label
+		:type label: str
+		:param where: include only the torrents matching the condition, see utorrent.query
+		:type where: str, utorrent.query.Query
+		:rtype: list[utorrent.torrent.Torrent]
+		"""
+		self._fetch_torrent_list( )
+		return self._build_torrent_top( sort_field, count, desc, label, where )
+
+	def torrent_hashes( self, where = None ):
+		"""
+		Returns hashes of the torrents matching the condition (all of them if it's None) without building the torrent objects, see
+		utorrent.query for the syntax.
+
+		:type where: str, utorrent.query.Query
+		:rtype: list[str]
+		"""
+		self._fetch_torrent_list( )
+		return self._select_hashes( where )
+
+	def _get_torrent_index( self ):
+		"""
+		:rtype: utorrent.index.TorrentIndex
+		"""
+		if self._torrent_cache is None:
+			return utorrent.index.TorrentIndex( { } )
+		if self._torrent_index is None:
+			self._torrent_index = utorrent.index.TorrentIndex( self._torrent_cache )
+		return self._torrent_index
+
+	def torrent_index( self ):
+		"""
+		Fetches the list and returns indexes of the torrents by label, status flag, download directory, name and hash prefix. The index
+		is kept up to date with the following list requests, so repeated lookups cost only as much as the number of the matches.
+
+		:rtype: utorrent.index.TorrentIndex
+		"""
+		self._fetch_torrent_list( )
+		return self._get_torrent_index( )
+
+	def torrent_changes( self ):
+		"""
+		Fetches the list and returns torrents, RSS feeds and filters that were added, removed or changed since the previous fetch, with
+		the old and new values of the changed fields. All of them are reported as added on the first fetch.
+
+		:rtype: utorrent.changes.ListChanges
+		"""
+		changes = utorrent.changes.ListChanges( )
+		self._fetch_torrent_list( changes )
+		return changes
+
+	def _stream_list( self, params, key, stream ):
+		"""
+		Requests the list and yields the rows of the key as they're received.
+
+		:type stream: _ListStream
+		"""
+		chunks = self._connection.stream_action( "list", params )
+		try:
+			for chunk in chunks:
+				for k, row in stream.feed( chunk ):
+					if k == key:
+						stream.yielded += 1
+						yield row
+			for k, row in stream.close( ):
+				if k == key:
+					stream.yielded += 1
+					yield row
+		finally:
+			chunks.close( )
+
+	def _iter_list( self, key, cache_attr ):
+		"""
+		Yields rows of the full list key ("torrents", "rssfeeds" or "rssfilters") while the response is being received. Delta response is
+		applied to the cache first and then the cached rows are yielded. Cache is updated only if the generator is exhausted.
+		"""
+		params = self._list_params( )
+		stream = _ListStream( )
+		try:
+			yield from self._stream_list( params, key, stream )
+			out = self._update_list_cache( stream.result( ) )
+		except utorrent.uTorrentError as e:
+			if params is None or stream.yielded > 0 or not self._list_cache_rejected( e ):
+				raise
+			# cache id is not recognized anymore (e.g. uTorrent was restarted) or cached rows don't match the delta, get full list
+			self._reset_list_cache( )
+			stream = _ListStream( )
+			yield from self._stream_list( None, key, stream )
+			out = self._update_list_cache( stream.result( ) )
+		if key not in out and getattr( self, cache_attr ) is not None:
+			yield from list( getattr( self, cache_attr ).values( ) )
+
+	def iter_torrents( self ):
+		"""
+		Yields torrents while the list is being received, so they can be filtered without building all of them at once.
+
+		:rtype: collections.abc.Iterator[utorrent.torrent.Torrent]
+		"""
+		for row in self._iter_list( "torrents", "_torrent_cache" ):
+			# streamed rows are passed on before they get into the cache
+			self.check_hash( row[0] )
+			yield self._TorrentClass( self, row )
+
+	def iter_rss_feeds( self ):
+		"""
+		:rtype: collections.abc.Iterator[utorrent.rss.Feed]
+		"""
+		for row in self._iter_list( "rssfeeds", "_rssfeed_cache" ):
+			yield rss.Feed( row )
+
+	def iter_rss_filters( self ):
+		"""
+		:rtype: collections.abc.Iterator[utorrent.rss.Filter]
+		"""
+		for row in self._iter_list( "rssfilters", "_rssfilter_cache" ):
+			yield rss.Filter( row )
+
+	def _parse_torrent_info( self, res ):
 		if not "props" in res:
 			return { }
-		return { hsh: info for hsh, info in [( i["hash"], self._JobInfoClass( self, jobinfo = i ) ) for i in res["props"]] }
+		with self.instrumentation.build( "getprops" ):
+			return { hsh: info for hsh, info in [( i["hash"], self._JobInfoClass( self, jobinfo = i ) ) for i in res["props"]] }
 
-	def torrent_add_url( self, url, download_dir = None ):
-		prev_dir = self._handle_download_dir( download_dir )
-		res = self.do_action( "add-url", { "s": url } )
-		self._handle_prev_dir( prev_dir )
+	def torrent_info( self, torrents ):
+		return self._parse_torrent_info( self.do_action( "getprops", { "hash": self._get_hashes( torrents ) } ) )
+
+	@staticmethod
+	def _check_add_result( res ):
 		if "error" in res:
 			raise utorrent.uTorrentError( res["error"] )
+
+	@staticmethod
+	def _magnet_hash( url ):
 		if url[0:7] == "magnet:":
 			m = re.search( "urn:btih:([0-9A-F]{40})", url, re.IGNORECASE )
 			if m:
 				return m.group( 1 ).upper( )
 		return None
 
+	def torrent_add_url( self, url, download_dir = None ):
+		prev_dir = self._handle_download_dir( download_dir )
+		res = self.do_action( "add-url", { "s": url } )
+		self._handle_prev_dir( prev_dir )
+		self._check_add_result( res )
+		return self._magnet_hash( url )
+
 	def torrent_add_data( self, torrent_data, download_dir = None, filename = "default.torrent" ):
+		"""
+		:param torrent_data: .torrent file contents or decoded metainfo dict
+		:type torrent_data: bytes, bytearray, mmap.mmap, dict
+		:rtype: str
+		"""
+		torrent_data = self._encode_torrent_data( torrent_data )
 		prev_dir = self._handle_download_dir( download_dir )
-		res = self.do_action( "add-file", data = self._create_torrent_upload( torrent_data, filename ) )
+		# the view of the payload is released even if the request fails, otherwise the traceback keeps the mmap from closing
+		with self._create_torrent_upload( torrent_data, filename ) as upload:
+			res = self.do_action( "add-file", data = upload )
 		self._handle_prev_dir( prev_dir )
-		if "error" in res:
-			raise utorrent.uTorrentError( res["error"] )
+		self._check_add_result( res )
 		return self.get_info_hash( torrent_data )
 
 	def torrent_add_file( self, filename, download_dir = None ):
-		f = open( filename, "rb" )
-		torrent_data = f.read( )
-		f.close( )
-		return self.torrent_add_data( torrent_data, download_dir, os.path.basename( filename ) )
+		# the file is mapped instead of read and uploaded from the mapping, it's checked to be a torrent before sending
+		try:
+			meta = utorrent.metainfo.TorrentMetainfo.open( filename )
+		except ValueError as e:
+			raise utorrent.uTorrentError( "{}: {}".format( filename, e ) )
+		with meta:
+			return self.torrent_add_data( meta.data, download_dir, os.path.basename( filename ) )
+
+	@staticmethod
+	def _set_props_args( props ):
+		args = []
+		for arg in props:
+			for hsh, t_prop in arg.items( ):
+				for name, value in t_prop.items( ):
+					args.append(
+						"hash={}&s={}&v={}".format( utorrent._url_quote( hsh ), utorrent._url_quote( name ), utorrent._url_quote( str( value ) ) ) )
+		return args
 
 	def torrent_set_props( self, props ):
 		"""
@@ -292,13 +807,7 @@ class Desktop:
 			...
 		]
 		"""
-		args = []
-		for arg in props:
-			for hsh, t_prop in arg.items( ):
-				for name, value in t_prop.items( ):
-					args.append(
-						"hash={}&s={}&v={}".format( utorrent._url_quote( hsh ), utorrent._url_quote( name ), utorrent._url_quote( str( value ) ) ) )
-		self.do_action( "setprops", params_str = "&".join( args ) )
+		self.do_action( "setprops", params_str = self._set_props_args( props ) )
 
 	def torrent_start( self, torrents, force = False ):
 		if force:
@@ -330,62 +839,89 @@ class Desktop:
 	def torrent_remove_with_data( self, torrents ):
 		return self.torrent_remove( torrents, True )
 
+	@staticmethod
+	def _magnet_link( torrent_hash, name, trackers ):
+		trackers = "&".join( [""] + ["tr=" + utorrent._url_quote( t ) for t in trackers] )
+		return "magnet:?xt=urn:btih:{}&dn={}{}".format( utorrent._url_quote( torrent_hash.lower( ) ), utorrent._url_quote( name ), trackers )
+
 	def torrent_get_magnet( self, torrents, self_tracker = False ):
 		out = { }
-		tors = self.torrent_list( )
+		self._fetch_torrent_list( )
 		for t in torrents:
 			t = t.upper( )
 			self.check_hash( t )
-			if t in tors:
+			if t in self._torrent_cache:
 				if self_tracker:
 					trackers = [self._connection.request_obj.get_full_url( ) + "announce"]
 				else:
 					trackers = self.torrent_info( t )[t].trackers
-				trackers = "&".join( [""] + ["tr=" + utorrent._url_quote( t ) for t in trackers] )
-				out[t] = "magnet:?xt=urn:btih:{}&dn={}{}".format( utorrent._url_quote( t.lower( ) ), utorrent._url_quote( tors[t].name ), trackers )
+				out[t] = self._magnet_link( t, self._TorrentClass( self, self._torrent_cache[t] ).name, trackers )
 		return out
 
-	def file_list( self, torrents ):
-		res = self.do_action( "getfiles", { "hash": self._get_hashes( torrents ) } )
+	def _parse_file_list( self, res ):
 		out = { }
 		if "files" in res:
-			fi = iter( res["files"] )
-			for hsh in fi:
-				out[hsh] = [self._FileClass( self, hsh, i, f ) for i, f in enumerate( next( fi ) )]
+			with self.instrumentation.build( "getfiles" ):
+				fi = iter( res["files"] )
+				for hsh in fi:
+					self.check_hash( hsh )
+					out[hsh] = [self._FileClass( self, hsh, i, f ) for i, f in enumerate( next( fi ) )]
 		return out
 
-	def file_set_priority( self, files ):
-		args = []
-		filecount_cache = { }
+	def file_list( self, torrents ):
+		return self._parse_file_list( self.do_action( "getfiles", { "hash": self._get_hashes( torrents ) } ) )
+
+	def _parse_file_priorities( self, files ):
+		"""
+		Splits file priority specification into a list of ( parent_hash, index, priority ), index is None for all files of the torrent.
+		"""
+		out = []
 		for hsh, prio in files.items( ):
 			parent_hash, index = self.parse_hash_prop( hsh )
 			if not isinstance( prio, utorrent.priority.Priority ):
 				prio = utorrent.priority.Priority( prio )
-			if index is None:
-				if not parent_hash in filecount_cache:
-					filecount_cache[parent_hash] = len( self.file_list( parent_hash )[parent_hash] )
-				for i in range( filecount_cache[parent_hash] ):
-					args.append( "hash={}&p={}&f={}".format( utorrent._url_quote( parent_hash ), utorrent._url_quote( str( prio.value ) ),
-					                                         utorrent._url_quote( str( i ) ) ) )
-			else:
+			out.append( ( parent_hash, index, prio ) )
+		return out
+
+	@staticmethod
+	def _set_priority_args( priorities, filecount_cache ):
+		args = []
+		for parent_hash, index, prio in priorities:
+			indices = range( filecount_cache[parent_hash] ) if index is None else ( index, )
+			for i in indices:
 				args.append( "hash={}&p={}&f={}".format( utorrent._url_quote( parent_hash ), utorrent._url_quote( str( prio.value ) ),
-				                                         utorrent._url_quote( str( index ) ) ) )
-		self.do_action( "setprio", params_str = "&".join( args ) )
+				                                         utorrent._url_quote( str( i ) ) ) )
+		return args
 
-	def settings_get( self ):
-		res = self.do_action( "getsettings" )
+	def file_set_priority( self, files ):
+		priorities = self._parse_file_priorities( files )
+		filecount_cache = { }
+		for parent_hash, index, prio in priorities:
+			if index is None and not parent_hash in filecount_cache:
+				filecount_cache[parent_hash] = len( self.file_list( parent_hash )[parent_hash] )
+		self.do_action( "setprio", params_str = self._set_priority_args( priorities, filecount_cache ) )
+
+	def _parse_settings( self, res ):
 		out = { }
-		for name, valueType, value in res["settings"]:
-			out[name] = self._setting_val( valueType, value )
+		with self.instrumentation.build( "getsettings" ):
+			for name, valueType, value in res["settings"]:
+				out[name] = self._setting_val( valueType, value )
 		return out
 
-	def settings_set( self, settings ):
+	def settings_get( self ):
+		return self._parse_settings( self.do_action( "getsettings" ) )
+
+	@staticmethod
+	def _settings_set_args( settings ):
 		args = []
 		for k, v in settings.items( ):
 			if isinstance( v, bool ):
 				v = int( v )
 			args.append( "s={}&v={}".format( utorrent._url_quote( k ), utorrent._url_quote( str( v ) ) ) )
-		self.do_action( "setsetting", params_str = "&".join( args ) )
+		return args
+
+	def settings_set( self, settings ):
+		self.do_action( "setsetting", params_str = self._settings_set_args( settings ) )
 
 	def rss_list( self ):
 		rss_feeds = { }
@@ -430,36 +966,45 @@ class Falcon( Desktop ):
 		self.do_action( "proxy", { "id": parent_hash, "file": index }, range_start = range_start, range_len = range_len, save_buffer = buffer,
 		                progress_cb = progress_cb )
 
-	def settings_get( self, extended_attributes = False ):
-		res = self.do_action( "getsettings" )
+	def _parse_settings( self, res ):
 		out = { }
-		for name, valueType, value, attrs in res["settings"]:
-			out[name] = self._setting_val( valueType, value )
+		with self.instrumentation.build( "getsettings" ):
+			for name, valueType, value, attrs in res["settings"]:
+				out[name] = self._setting_val( valueType, value )
 		return out
 
+	def settings_get( self, extended_attributes = False ):
+		return self._parse_settings( self.do_action( "getsettings" ) )
+
 	def rss_add( self, url ):
 		return self.rss_update( -1, { "url": url } )
 
-	def rss_update( self, feed_id, params ):
-		params["feed-id"] = feed_id
-		res = self.do_action( "rss-update", params )
+	@staticmethod
+	def _rss_ident( res, feed_id ):
 		if "rss_ident" in res:
 			return int( res["rss_ident"] )
 		return feed_id
 
+	def rss_update( self, feed_id, params ):
+		params["feed-id"] = feed_id
+		return self._rss_ident( self.do_action( "rss-update", params ), feed_id )
+
 	def rss_remove( self, feed_id ):
 		self.do_action( "rss-remove", { "feed-id": feed_id } )
 
 	def rssfilter_add( self, feed_id = -1 ):
 		return self.rssfilter_update( -1, { "feed-id": feed_id } )
 
-	def rssfilter_update( self, filter_id, params ):
-		params["filter-id"] = filter_id
-		res = self.do_action( "filter-update", params )
+	@staticmethod
+	def _filter_ident( res, filter_id ):
 		if "filter_ident" in res:
 			return int( res["filter_ident"] )
 		return filter_id
 
+	def rssfilter_update( self, filter_id, params ):
+		params["filter-id"] = filter_id
+		return self._filter_ident( self.do_action( "filter-update", params ), filter_id )
+
 	def rssfilter_remove( self, filter_id ):
 		self.do_action( "filter-remove", { "filter-id": filter_id } )
 
@@ -513,6 +1058,35 @@ class Version:
 		out.peer_id = "UT{}{}{}0".format( out.major, out.middle, out.minor )
 		return out
 
+	_fields = ( "product", "major", "middle", "minor", "build", "engine", "ui", "date", "user_agent", "peer_id", "device_id" )
+
+	@staticmethod
+	def from_dict( values ):
+		"""
+		Restores version previously saved with as_dict().
+
+		:type values: dict
+		:rtype: Version
+		"""
+		out = Version.__new__( Version )
+		for name in Version._fields:
+			if name in values:
+				setattr( out, name, values[name] )
+		if out.date is not None:
+			out.date = datetime.datetime.strptime( out.date, "%Y-%m-%dT%H:%M:%S" )
+		return out
+
+	def as_dict( self ):
+		"""
+		Returns version as JSON serializable dict.
+
+		:rtype: dict
+		"""
+		out = { name: getattr( self, name ) for name in self._fields }
+		if self.date is not None:
+			out["date"] = self.date.strftime( "%Y-%m-%dT%H:%M:%S" )
+		return out
+
 	def __init__( self, res ):
 		if "version" in res: # server returns full data
 			self.product = res["version"]["product_code"]
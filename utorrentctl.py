@@ -19,15 +19,19 @@
 	utorrentctl - uTorrent cli remote control utility
 
 """
+import atexit
 import datetime
 import optparse
 import os
 import sys
 
 import utorrent as utorrent_module
+import utorrent.metainfo
 import utorrent.rss as rss
+import utorrent.table
 from utorrent import uTorrentError
 from utorrent.connection import Connection
+from utorrent.query import Query
 from utorrent.uTorrent import Desktop, Falcon, LinuxServer
 
 level1 = "   "
@@ -105,6 +109,15 @@ parser.add_option( "-U", "--user", dest = "user", help = "WebUI login" )
 parser.add_option( "-P", "--password", dest = "password", help = "WebUI password" )
 parser.add_option( "-S", "--ssl", action = "store_true", dest = "ssl", default = False, help = "Use SSL when connecting to uTorrent instance" )
 parser.add_option("--no-ssl-verify", action="store_false", dest="ssl_verify", default=True, help="Don't perform SSL verification for server certificate")
+parser.add_option( "--keep-alive", action = "store_true", dest = "keep_alive", default = False,
+                   help = "reuse single connection to uTorrent instance for all requests instead of reconnecting every time" )
+parser.add_option( "--cache", action = "store_true", dest = "cache", default = None,
+                   help = "save security token, session cookie, server version and torrent list in the user cache directory (readable only by "
+                          "the user) and reuse them in the next runs" )
+parser.add_option( "--no-cache", action = "store_false", dest = "cache",
+                   help = "don't save or reuse them even if cache is enabled in the config, this is the default" )
+parser.add_option( "--timings", action = "store_true", dest = "timings", default = False,
+                   help = "print time spent in every WebUI action and transferred data amount to stderr on exit" )
 parser.add_option( "--api", dest = "api",
                    help = "Disable autodetection of server version and force specific API: linux, desktop (2.x), falcon (3.x)" )
 parser.add_option( "-n", "--nv", "--no-verbose", action = "store_false", dest = "verbose", default = True,
@@ -116,6 +129,9 @@ parser.add_option( "-c", "--active", action = "store_true", dest = "active", def
 parser.add_option( "-f", "--format", default = utorrentcfg["default_torrent_format"], dest = "format",
                    help = "display torrent list in specific format, e.g. '{hash} {name} {ratio}', use --dump to view full list of available fields + peer_info (display seeds or peers depending on progress)" )
 parser.add_option( "--label", dest = "label", help = "when listing torrents display only ones with specified label" )
+parser.add_option( "-w", "--where", dest = "where",
+                   help = "select torrents matching the condition, e.g. 'ratio>2 and label=tv and status=seeding' (only for list and actions "
+                          "taking hashes, with set-props specify only prop=value ...)" )
 parser.add_option( "-s", "--sort", default = "name", dest = "sort_field", help = "sort torrents, use --dump to view full list of available fields" )
 parser.add_option( "--desc", action = "store_true", dest = "sort_desc", default = False, help = "sort torrents in descending order" )
 parser.add_option( "-a", "--add-file", action = "store_const", dest = "action", const = "add_file",
@@ -178,6 +194,8 @@ parser.add_option( "--rssfilter-set-props", action = "store_const", dest = "acti
                    help = "change properties of rss filter; use --rssfilter-dump to view them (filter_id.prop=value filter_id.prop=value ...)" )
 parser.add_option( "--magnet", action = "store_const", dest = "action", const = "get_magnet",
                    help = "generate magnet link for the specified torrents (hash hash ...)" )
+parser.add_option( "--torrent-info", action = "store_const", dest = "action", const = "torrent_metainfo",
+                   help = "show name, size, files and info hash of local .torrent files without connecting to uTorrent (file file ...)" )
 parser.add_option( "--limit", dest = "limit", default = 0, help = "limit the number of records to return, 0 returns all, default is 0" )
 opts, args = parser.parse_args( )
 
@@ -194,38 +212,77 @@ try:
 			opts.ssl = utorrentcfg["ssl"]
 		if opts.ssl_verify == True and "ssl_verify" in utorrentcfg and utorrentcfg["ssl_verify"] is not None:
 			opts.ssl_verify = utorrentcfg["ssl_verify"]
+		if opts.keep_alive == False and "keep_alive" in utorrentcfg and utorrentcfg["keep_alive"] is not None:
+			opts.keep_alive = utorrentcfg["keep_alive"]
+		if opts.cache is None and "cache" in utorrentcfg and utorrentcfg["cache"] is not None:
+			opts.cache = utorrentcfg["cache"]
+
+	# actions which arguments are torrent hashes, --where adds the matching ones
+	hash_actions = ( "torrent_start", "torrent_stop", "torrent_pause", "torrent_resume", "torrent_recheck", "torrent_remove", "torrent_info",
+	                 "torrent_dump", "set_props", "get_magnet" )
+	# parsed before connecting so that syntax errors are reported right away
+	where = Query( opts.where ) if opts.where is not None else None
+	if where is not None and opts.action != "torrent_list" and opts.action not in hash_actions:
+		# other actions don't select torrents, the condition would be silently ignored
+		parser.error( "-w/--where can only be used with --list and actions taking torrent hashes" )
+
+	# actions that don't need uTorrent
+	local_actions = ( "torrent_metainfo", )
 
 	utorrent = None
-	if opts.action is not None:
-		utorrent = Connection(opts.host, opts.user, opts.password, opts.ssl, opts.ssl_verify).utorrent(opts.api)
+	if opts.action is not None and opts.action not in local_actions:
+		connection = Connection(opts.host, opts.user, opts.password, opts.ssl, opts.ssl_verify, opts.keep_alive,
+		                        cache_dir=get_cache_dir() if opts.cache else None)
+		if opts.timings:
+			atexit.register( lambda: print( connection.instrumentation.summary( ), file = sys.stderr ) )
+		utorrent = connection.utorrent(opts.api)
+		if opts.cache:
+			# the list is written to the cache once, after all the changes
+			atexit.register( utorrent.save_list_cache )
+
+	if where is not None and opts.action in hash_actions:
+		hashes = utorrent.torrent_hashes( where )
+		if len( hashes ) == 0:
+			print_console( "No torrents match the condition" )
+			sys.exit( 0 )
+		if opts.action == "set_props":
+			args = ["{}.{}".format( hsh, a ) for hsh in hashes for a in args]
+		else:
+			args = hashes + args
 
 	if opts.action == "server_version":
 		print_console( utorrent.version( ).verbose_str( ) if opts.verbose else utorrent.version( ) )
 
 	elif opts.action == "torrent_list":
-		total_ul, total_dl, count, total_size = 0, 0, 0, 0
 		opts.sort_field = opts.sort_field.lower( )
 		# ensure that int is returned
 		opts.limit = int( opts.limit )
-		if not opts.sort_field in utorrent.TorrentClass.get_public_attrs( ) + utorrent.TorrentClass.get_readonly_attrs( ):
+		if not opts.sort_field in utorrent_module.table.row_getters( utorrent ):
 			opts.sort_field = "name"
-		for h, t in sorted( utorrent.torrent_list( ).items( ), key = lambda x: getattr( x[1], opts.sort_field ), reverse = opts.sort_desc ):
-			if not opts.active or opts.active and ( t.ul_speed > 0 or t.dl_speed > 0 ): # handle --active
-				if opts.label is None or opts.label == t.label: # handle --label
-					count += 1
-					if opts.limit > 0 and count > opts.limit:
-						break
-					total_size += t.progress / 100 * t.size
-					if opts.verbose:
-						print_console( t.verbose_str( opts.format ) )
-						total_ul += t.ul_speed
-						total_dl += t.dl_speed
-					else:
-						print_console( t )
+		query = where
+		if opts.active: # handle --active
+			active = Query( "ul_speed > 0 or dl_speed > 0" )
+			query = active if query is None else query & active
+		if opts.limit > 0:
+			# only the shown torrents are kept while the rows are ranked, no table and no other objects are built
+			torrents = utorrent.torrent_top( opts.sort_field, opts.limit, opts.sort_desc, opts.label, query )
+			dl_speed = sum( t.dl_speed for t in torrents )
+			ul_speed = sum( t.ul_speed for t in torrents )
+			total_size = sum( t.size * t.progress for t in torrents ) / 100
+		else:
+			# --label and --where are looked up in the indexes where possible, the table holds only the matching torrents
+			table = utorrent.torrent_table( opts.label, query )
+			indices = table.sort( [( opts.sort_field, opts.sort_desc )] )
+			torrents = table.torrents( indices )
+			dl_speed = table.sum( "dl_speed", indices )
+			ul_speed = table.sum( "ul_speed", indices )
+			total_size = table.sum( "size", indices, weight = "progress" ) / 100
+		for t in torrents:
+			print_console( t.verbose_str( opts.format ) if opts.verbose else t )
 		if opts.verbose:
-			print_console(
-				"Total speed: D:{}/s U:{}/s  count: {}  size: {}".format( utorrent_module.human_size( total_dl ), utorrent_module.human_size( total_ul ),
-				                                                          count, utorrent_module.human_size( total_size ) ) )
+			print_console( "Total speed: D:{}/s U:{}/s  count: {}  size: {}".format( utorrent_module.human_size( dl_speed ),
+			                                                                         utorrent_module.human_size( ul_speed ), len( torrents ),
+			                                                                         utorrent_module.human_size( total_size ) ) )
 
 	elif opts.action == "add_file":
 		for i in args:
@@ -371,7 +428,7 @@ try:
 	elif opts.action == "stats":
 		res = utorrent.xfer_history_get( )
 		excl_local = utorrent.settings_get( )["net.limit_excludeslocal"]
-		torrents = utorrent.torrent_list( )
+		table = utorrent.torrent_table( )
 		today_start = datetime.datetime.now( ).replace( hour = 0, minute = 0, second = 0, microsecond = 0 )
 		period = len( res["daily_download"] )
 		period_start = today_start - datetime.timedelta( days = period - 1 )
@@ -380,8 +437,8 @@ try:
 		down_total = sum( res["daily_download"] ) - ( down_total_local if excl_local else 0 )
 		up_total_local = sum( res["daily_local_upload"] )
 		up_total = sum( res["daily_upload"] ) - ( down_total_local if excl_local else 0 )
-		period_added_torrents = { k: v for k, v in torrents.items( ) if v.added_on >= period_start }
-		period_completed_torrents = { k: v for k, v in torrents.items( ) if v.completed_on >= period_start }
+		period_added_torrents = table.mask( "added_on", ">=", period_start ).count( )
+		period_completed_torrents = table.mask( "completed_on", ">=", period_start ).count( )
 		print_console( "Last {} days:".format( period ) )
 		print_console(
 			level1 + "Downloaded: {} (+{} local)".format( utorrent_module.human_size( down_total ), utorrent_module.human_size( down_total_local ) ) )
@@ -390,15 +447,15 @@ try:
 		print_console( level1 + "     Total: {} (+{} local)".format( utorrent_module.human_size( down_total + up_total ),
 		                                                             utorrent_module.human_size( down_total_local + up_total_local ) ) )
 		print_console( level1 + "Ratio: {:.2f}".format( up_total / down_total ) )
-		print_console( level1 + "Added torrents: {}".format( len( period_added_torrents ) ) )
-		print_console( level1 + "Completed torrents: {}".format( len( period_completed_torrents ) ) )
+		print_console( level1 + "Added torrents: {}".format( period_added_torrents ) )
+		print_console( level1 + "Completed torrents: {}".format( period_completed_torrents ) )
 
 		down_day_local = res["daily_local_download"][0]
 		down_day = res["daily_download"][0] - ( down_day_local if excl_local else 0 )
 		up_day_local = res["daily_local_upload"][0]
 		up_day = res["daily_upload"][0] - ( up_day_local if excl_local else 0 )
-		today_added_torrents = { k: v for k, v in torrents.items( ) if v.added_on >= today_start }
-		today_completed_torrents = { k: v for k, v in torrents.items( ) if v.completed_on >= today_start }
+		today_added_torrents = table.mask( "added_on", ">=", today_start ).count( )
+		today_completed_torrents = table.mask( "completed_on", ">=", today_start ).count( )
 		print_console( "Today:" )
 		print_console(
 			level1 + "Downloaded: {} (+{} local)".format( utorrent_module.human_size( down_day ), utorrent_module.human_size( down_day_local ) ) )
@@ -407,8 +464,8 @@ try:
 		print_console( level1 + "     Total: {} (+{} local)".format( utorrent_module.human_size( down_day + up_day ),
 		                                                             utorrent_module.human_size( down_day_local + up_day_local ) ) )
 		print_console( level1 + "Ratio: {:.2f}".format( up_day / down_day ) )
-		print_console( level1 + "Added torrents: {}".format( len( today_added_torrents ) ) )
-		print_console( level1 + "Completed torrents: {}".format( len( today_completed_torrents ) ) )
+		print_console( level1 + "Added torrents: {}".format( today_added_torrents ) )
+		print_console( level1 + "Completed torrents: {}".format( today_completed_torrents ) )
 
 	elif opts.action == "reset_stats":
 		res = utorrent.xfer_history_reset( )
@@ -607,6 +664,22 @@ try:
 			if name in rss.Filter.get_public_attrs( ) or rss.Filter.get_writeonly_attrs( ):
 				utorrent.rssfilter_update( filter_id, { name.replace( "_", "-" ): value } )
 
+	elif opts.action == "torrent_metainfo":
+		for filename in args:
+			try:
+				# only the requested values are decoded, the pieces are skipped
+				with utorrent_module.metainfo.TorrentMetainfo.open( filename ) as meta:
+					print_console( meta.verbose_str( ) if opts.verbose else meta )
+					if opts.verbose:
+						print_console( level1 + "Files ({}):".format( len( meta.files ) ) )
+						for path, size in meta.files:
+							print_console( level2 + "{} {}".format( path, utorrent_module.human_size( size ) ) )
+						print_console( level1 + "Trackers:" )
+						for tr in meta.trackers:
+							print_console( level2 + tr )
+			except ( OSError, ValueError ) as e:
+				print_console( "{}: {}".format( filename, e ) )
+
 	elif opts.action == "get_magnet":
 		if opts.verbose:
 			tors = utorrent.torrent_list( )